@@ -4,38 +4,23 @@ import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 
-def plot_seasonality_heatmap(df_full: pd.DataFrame, selected_island: str):
+def plot_seasonality_heatmap(heat_table: pd.DataFrame):
     """Plot a heatmap of monthly passengers by year for the island (TOTAL PASAJEROS only).
 
-    Uses the FULL dataset (not filtered by the slider) and excludes pandemic years 2020–2021.
+    ``heat_table`` is the island's seasonality pivot from the aggregate cube
+    (rows ``Año``, columns months 1–12, full history, not filtered by the
+    slider); pandemic years 2020–2021 are excluded here.
     """
     st.subheader("🔥 Heatmapa — Estacionalidad por mes y año (sin pandemia)")
 
-    # Filter island
-    df_island_full = df_full[
-        df_full["Isla"].str.contains(selected_island, case=False, na=False)
-    ].copy()
-
-    # Only TOTAL PASAJEROS
-    df_heat = df_island_full[
-        df_island_full["AEROPUERTO_DE_PROCEDENCIA"].str.upper() == "TOTAL PASAJEROS"
-    ].copy()
-
-    if df_heat.empty:
+    if heat_table.empty:
         st.warning("No hay datos para generar la heatmapa.")
         return
 
-    # Ensure Fecha is datetime
-    df_heat["Fecha"] = pd.to_datetime(df_heat["Fecha"], errors="coerce")
-
-    # Recompute Año & Mes cleanly
-    df_heat["Año"] = df_heat["Fecha"].dt.year.astype(int)
-    df_heat["Mes"] = df_heat["Fecha"].dt.month.astype(int)
-
     # Remove pandemic years
-    df_heat = df_heat[df_heat["Año"] >= 2022]
+    heat_table = heat_table[heat_table.index >= 2022]
 
-    if df_heat.empty:
+    if heat_table.empty:
         st.warning("No hay datos después de 2022 para generar la heatmapa.")
         return
 
@@ -44,10 +29,6 @@ def plot_seasonality_heatmap(df_full: pd.DataFrame, selected_island: str):
     month_labels = ["Ene", "Feb", "Mar", "Abr", "May", "Jun",
                     "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
 
-    # Pivot: rows = Año, cols = Mes
-    heat_table = df_heat.pivot(index="Año", columns="Mes", values="Pasajeros")
-    heat_table = heat_table.reindex(columns=range(1, 13))
-
     heat_values = heat_table.fillna(0)
     text_values = heat_table.fillna("").astype(str)
 
@@ -12,19 +12,18 @@ EXCLUDE_ORIGINS = [
     "AEROP. PENINSULARES + AEROP. EXTRANJEROS",
 ]
 
-def plot_origins_donut(dfv: pd.DataFrame):
-    """Display a donut chart of top origin airports / countries."""
-    st.subheader("🌍 Top aeropuertos de procedencia (donut)")
+def plot_origins_donut(country_sum: pd.Series):
+    """Display a donut chart of top origin airports / countries.
 
-    df_clean = dfv[
-        ~dfv["AEROPUERTO_DE_PROCEDENCIA"].str.upper().isin(EXCLUDE_ORIGINS)
-    ]
+    ``country_sum`` holds the passengers per origin over the selected range,
+    aggregate rows (``EXCLUDE_ORIGINS``) already left out.
+    """
+    st.subheader("🌍 Top aeropuertos de procedencia (donut)")
 
-    if df_clean.empty:
+    if country_sum.empty:
         st.warning("No hay datos de procedencia para este rango.")
         return
 
-    country_sum = df_clean.groupby("AEROPUERTO_DE_PROCEDENCIA")["Pasajeros"].sum()
     df_top = country_sum.sort_values(ascending=False).head(10)
     otros_value = country_sum.sum() - df_top.sum()
 
@@ -4,18 +4,19 @@ import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 
-def plot_total_passengers(dfv: pd.DataFrame):
-    """Plot monthly evolution of TOTAL PASAJEROS for the selected island and date range."""
-    df_total = dfv[dfv["AEROPUERTO_DE_PROCEDENCIA"].str.upper() == "TOTAL PASAJEROS"]
+def plot_total_passengers(total: pd.Series):
+    """Plot monthly evolution of TOTAL PASAJEROS for the selected island and date range.
 
-    if df_total.empty:
+    ``total`` is the monthly series from the aggregate cube (index ``Fecha``).
+    """
+    if total.empty:
         st.warning("No se encontraron filas con 'TOTAL PASAJEROS'.")
         return
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=df_total["Fecha"],
-        y=df_total["Pasajeros"],
+        x=total.index,
+        y=total.values,
         mode="lines+markers",
         name="Total Pasajeros",
         line=dict(color="#004E98", width=4),
@@ -33,27 +34,18 @@ def plot_total_passengers(dfv: pd.DataFrame):
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def plot_flight_type_shares(dfv: pd.DataFrame):
-    """Plot % share of main flight types over time (interinsular, peninsular, extranjeros)."""
-    st.subheader("📊 % de participación por tipo de vuelo")
+def plot_flight_type_shares(df_pct: pd.DataFrame):
+    """Plot % share of main flight types over time (interinsular, peninsular, extranjeros).
 
-    tipos = ["aerop. Interinsulares", "aerop. peninsulares", "Total aerop. Extranjeros"]
-    df_types = dfv[dfv["AEROPUERTO_DE_PROCEDENCIA"].isin(tipos)]
+    ``df_pct`` holds one column per flight type and one row per month (from
+    ``AggregateCube.type_shares``).
+    """
+    st.subheader("📊 % de participación por tipo de vuelo")
 
-    if df_types.empty:
+    if df_pct.empty:
         st.warning("No hay datos para estos tipos principales.")
         return
 
-    df_month_total = df_types.groupby("Fecha")["Pasajeros"].sum().rename("Total")
-
-    df_pct = (
-        df_types.groupby(["Fecha", "AEROPUERTO_DE_PROCEDENCIA"])["Pasajeros"]
-        .sum()
-        .unstack(fill_value=0)
-    )
-
-    df_pct = df_pct.div(df_month_total, axis=0) * 100
-
     fig = go.Figure()
     colors = {
         "aerop. Interinsulares": "#1f77b4",
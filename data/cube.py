@@ -0,0 +1,277 @@
+"""Precomputed aggregate cube of the passenger details.
+
+The detail table is dense on (island, month, origin), so it is materialized
+once as a 3-D array plus the aggregates the dashboard shows, each stored as
+an ``.npy`` file next to a JSON index with the axes::
+
+    store/cube/index.json
+    store/cube/passengers.npy   (islands, months, origins)
+    store/cube/total.npy        (islands, months)       TOTAL PASAJEROS
+    store/cube/types.npy        (islands, months, 3)    main flight types
+    store/cube/yearly.npy       (islands, years)        yearly TOTAL PASAJEROS
+    store/cube/season.npy       (islands, years, 12)    seasonality pivot
+
+Arrays are memory-mapped on load, so opening the cube costs almost nothing,
+and every query is an index lookup plus a contiguous month slice instead of
+string matching over all rows. The cube is rebuilt by ``PassengerAgent``
+after every ingest; the index records the version of the source it was built
+from so a stale cube is detected.
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data.storage import DETAILS_TABLE, STORE_DIR, table_exists, table_path
+
+CUBE_DIR = os.path.join(STORE_DIR, "cube")
+INDEX_FILE = "index.json"
+ARRAYS = ("passengers", "total", "types", "yearly", "season")
+TOTAL_ORIGIN = "TOTAL PASAJEROS"
+FLIGHT_TYPES = ["aerop. Interinsulares", "aerop. peninsulares", "Total aerop. Extranjeros"]
+DETAILS_CSV = "result.csv"
+
+
+def source_version(store_dir=STORE_DIR, csv_path=DETAILS_CSV) -> str:
+    """Version stamp (paths, sizes, mtimes) of the detail data the dashboard reads."""
+    if table_exists(DETAILS_TABLE, store_dir):
+        files = sorted(table_path(DETAILS_TABLE, store_dir).rglob("*.parquet"))
+    elif os.path.exists(csv_path):
+        files = [Path(csv_path)]
+    else:
+        return ""
+    stamps = []
+    for path in files:
+        st = path.stat()
+        stamps.append(f"{path.as_posix()}:{st.st_size}:{st.st_mtime_ns}")
+    return "|".join(stamps)
+
+
+def _nansum(values, axis):
+    """Sum ignoring NaN; NaN where every value is NaN (pandas ``min_count=1``)."""
+    out = np.nansum(values, axis=axis)
+    out[np.isnan(values).all(axis=axis)] = np.nan
+    return out
+
+
+def build_cube(df: pd.DataFrame):
+    """Aggregate the detail table into ``(index, arrays)``."""
+    df = df[["Isla", "Fecha", "AEROPUERTO_DE_PROCEDENCIA", "Pasajeros", "Mes", "MesNum"]].dropna(
+        subset=["Fecha"])
+    fecha = pd.to_datetime(df["Fecha"]).to_numpy().astype("datetime64[M]")
+    first, last = fecha.min(), fecha.max()
+    n_months = int((last - first).astype(int)) + 1
+
+    isla = pd.Categorical(df["Isla"].astype(str))
+    origin = pd.Categorical(df["AEROPUERTO_DE_PROCEDENCIA"].astype(str))
+    islands, origins = list(isla.categories), list(origin.categories)
+
+    passengers = np.full((len(islands), n_months, len(origins)), np.nan)
+    passengers[isla.codes, (fecha - first).astype(int), origin.codes] = df["Pasajeros"].to_numpy(dtype=float)
+
+    total_cols = [j for j, o in enumerate(origins) if o.upper() == TOTAL_ORIGIN]
+    total = _nansum(passengers[:, :, total_cols], axis=2)
+    flight_types = [t for t in FLIGHT_TYPES if t in origins]
+    types = passengers[:, :, [origins.index(t) for t in flight_types]]
+
+    month_num = np.arange(first, last + 1).astype(int)        # months since 1970-01
+    first_year = int(month_num[0] // 12 + 1970)
+    years = list(range(first_year, int(month_num[-1] // 12 + 1970) + 1))
+    season = np.full((len(islands), len(years), 12), np.nan)
+    season[:, month_num // 12 + 1970 - first_year, month_num % 12] = total
+    yearly = _nansum(season, axis=2)
+
+    names = df.drop_duplicates("MesNum").set_index("MesNum")["Mes"].astype(str).to_dict()
+    index = {
+        "islands": islands,
+        "origins": origins,
+        "flight_types": flight_types,
+        "first_month": str(first),
+        "n_months": n_months,
+        "years": years,
+        "month_names": {str(k): v for k, v in sorted(names.items())},
+    }
+    arrays = {"passengers": passengers, "total": total, "types": types, "yearly": yearly, "season": season}
+    return index, arrays
+
+
+def write_cube(df: pd.DataFrame, cube_dir=CUBE_DIR, source=None) -> Path:
+    """Build the cube from ``df`` and store it (arrays first, index last, atomic renames).
+
+    Temporary files get unique names (``mkstemp``), so concurrent writers in
+    one process (Streamlit threads share a PID) or in several never collide.
+    """
+    index, arrays = build_cube(df)
+    index["source"] = source_version() if source is None else source
+    root = Path(cube_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    for name, values in arrays.items():
+        fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp.npy", dir=root)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(values))
+        os.replace(tmp, root / f"{name}.npy")
+    fd, tmp = tempfile.mkstemp(prefix=f".{INDEX_FILE}.", suffix=".tmp", dir=root)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(json.dumps(index, ensure_ascii=False, indent=1))
+    os.replace(tmp, root / INDEX_FILE)
+    return root
+
+
+def read_index(cube_dir=CUBE_DIR):
+    """The cube index, or ``None`` if no cube was built."""
+    path = Path(cube_dir) / INDEX_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class AggregateCube:
+    """Read-only view of a stored cube (memory-mapped) or of freshly built arrays."""
+
+    def __init__(self, cube_dir=CUBE_DIR, index=None, arrays=None, mmap_mode="r"):
+        if index is None:
+            index = read_index(cube_dir)
+            if index is None:
+                raise FileNotFoundError(Path(cube_dir) / INDEX_FILE)
+            arrays = {name: np.load(Path(cube_dir) / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+        self.index = index
+        self.arrays = arrays
+        self.islands = index["islands"]
+        self.origins = index["origins"]
+        self.flight_types = index["flight_types"]
+        self.years = index["years"]
+        self.month_names = {int(k): v for k, v in index["month_names"].items()}
+        first = np.datetime64(index["first_month"], "M")
+        self.months = pd.DatetimeIndex((first + np.arange(index["n_months"])).astype("datetime64[ns]"))
+        self._island_pos = {name: i for i, name in enumerate(self.islands)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """In-memory cube built from a detail frame (nothing is written)."""
+        index, arrays = build_cube(df)
+        return cls(index=index, arrays=arrays)
+
+    # ---------------------------------------------------------- slicing
+    def _island(self, island):
+        try:
+            return self._island_pos[island]
+        except KeyError:
+            raise KeyError(f"Unknown island '{island}'") from None
+
+    def _span(self, start=None, end=None):
+        """Month positions ``[lo, hi)`` with ``start <= month <= end``."""
+        dates = self.months.asi8
+        lo = 0 if start is None else int(np.searchsorted(dates, pd.Timestamp(start).value, side="left"))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, pd.Timestamp(end).value, side="right"))
+        return lo, hi
+
+    def date_range(self, island):
+        """First and last month with data for ``island``."""
+        has = ~np.isnan(self.arrays["passengers"][self._island(island)]).all(axis=1)
+        pos = np.flatnonzero(has)
+        return self.months[pos[0]], self.months[pos[-1]]
+
+    def view(self, island, start=None, end=None) -> "CubeView":
+        """``island`` restricted to the months ``start..end``, resolved once for several queries."""
+        return CubeView(self, self._island(island), *self._span(start, end))
+
+    # ---------------------------------------------------------- queries
+    def total_series(self, island, start=None, end=None) -> pd.Series:
+        """Monthly TOTAL PASAJEROS of ``island`` between ``start`` and ``end``."""
+        return self.view(island, start, end).total_series()
+
+    def yearly_table(self, island, start=None, end=None) -> pd.DataFrame:
+        """TOTAL PASAJEROS summed per year over the selected months."""
+        return self.view(island, start, end).yearly_table()
+
+    def monthly_table(self, island, start=None, end=None) -> pd.DataFrame:
+        """``Año``, ``Mes``, ``Pasajeros`` rows of TOTAL PASAJEROS, sorted by ``Año``/``Mes``."""
+        return self.view(island, start, end).monthly_table()
+
+    def type_shares(self, island, start=None, end=None) -> pd.DataFrame:
+        """% share of each main flight type in the monthly sum of the three (rows: months)."""
+        return self.view(island, start, end).type_shares()
+
+    def origin_totals(self, island, start=None, end=None, exclude=()) -> pd.Series:
+        """Passengers per origin over the selected months (origins in ``exclude`` left out, case-insensitive)."""
+        return self.view(island, start, end).origin_totals(exclude)
+
+    def seasonality(self, island, min_year=None) -> pd.DataFrame:
+        """TOTAL PASAJEROS pivot: rows ``Año``, columns months 1..12 (years without data dropped)."""
+        values = np.asarray(self.arrays["season"][self._island(island)])
+        out = pd.DataFrame(values, index=pd.Index(self.years, name="Año"), columns=pd.RangeIndex(1, 13, name="Mes"))
+        out = out[~np.isnan(values).all(axis=1)]
+        if min_year is not None:
+            out = out[out.index >= min_year]
+        return out
+
+    def last_month(self, island):
+        """Last month with TOTAL PASAJEROS for ``island`` (``None`` if there is none)."""
+        s = self.total_series(island)
+        return s.index.max() if not s.empty else None
+
+
+class CubeView:
+    """One island and month span of an :class:`AggregateCube`.
+
+    The span is resolved once; every query reads the same ``[lo, hi)`` month
+    slice of the (memory-mapped) arrays. The total series is computed once
+    and shared by the queries built on it.
+    """
+
+    def __init__(self, cube: AggregateCube, pos: int, lo: int, hi: int):
+        self.cube = cube
+        self.pos, self.lo, self.hi = pos, lo, hi
+        self.months = cube.months[lo:hi]
+        self._total = None
+
+    def _values(self, name):
+        return np.asarray(self.cube.arrays[name][self.pos, self.lo:self.hi])
+
+    def total_series(self) -> pd.Series:
+        """Monthly TOTAL PASAJEROS (months without data dropped)."""
+        if self._total is None:
+            s = pd.Series(self._values("total"), index=pd.Index(self.months, name="Fecha"), name="Pasajeros")
+            self._total = s.dropna()
+        return self._total
+
+    def yearly_table(self) -> pd.DataFrame:
+        """TOTAL PASAJEROS summed per year."""
+        s = self.total_series()
+        out = s.groupby(s.index.year).sum()
+        return out.rename_axis("Año").reset_index()
+
+    def monthly_table(self) -> pd.DataFrame:
+        """``Año``, ``Mes``, ``Pasajeros`` rows of TOTAL PASAJEROS, sorted by ``Año``/``Mes``."""
+        s = self.total_series()
+        out = pd.DataFrame({
+            "Año": s.index.year,
+            "Mes": [self.cube.month_names[m] for m in s.index.month],
+            "Pasajeros": s.to_numpy(),
+        })
+        return out.sort_values(["Año", "Mes"])
+
+    def type_shares(self) -> pd.DataFrame:
+        """% share of each main flight type in the monthly sum of the three (rows: months)."""
+        values = self._values("types")
+        keep = ~np.isnan(values).all(axis=1)
+        values = values[keep]
+        pct = np.nan_to_num(values) / np.nansum(values, axis=1, keepdims=True) * 100
+        types = self.cube.flight_types
+        cols = [j for j in range(len(types)) if not np.isnan(values[:, j]).all()]
+        return pd.DataFrame(pct[:, cols], index=pd.Index(self.months[keep], name="Fecha"),
+                            columns=[types[j] for j in cols])
+
+    def origin_totals(self, exclude=()) -> pd.Series:
+        """Passengers per origin (origins in ``exclude`` left out, case-insensitive)."""
+        values = self._values("passengers")
+        origins = self.cube.origins
+        excluded = {e.upper() for e in exclude}
+        cols = [j for j, o in enumerate(origins)
+                if o.upper() not in excluded and not np.isnan(values[:, j]).all()]
+        return pd.Series(np.nansum(values[:, cols], axis=0), index=[origins[j] for j in cols],
+                         name="Pasajeros")
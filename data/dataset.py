@@ -0,0 +1,36 @@
+"""Typed, read-only view of the passenger detail table.
+
+Rows are sorted once by ``Isla`` and ``Fecha`` with categorical ``Isla`` and
+``AEROPUERTO_DE_PROCEDENCIA``, so every island is one contiguous block of
+date-sorted rows. The KPI table and the aggregate cube are computed from it
+(``frame``) by grouped passes.
+
+The dataset has no island/date slicing of its own: the dashboard's island
+selection and date-range filtering read the aggregate cube instead
+(``AggregateCube.view`` in ``data/cube.py``: island position lookup plus a
+``searchsorted`` month span), which replaced the per-request row filters.
+"""
+
+import pandas as pd
+
+CATEGORICAL_COLS = ["Isla", "AEROPUERTO_DE_PROCEDENCIA"]
+
+
+class PassengerDataset:
+    """Passenger rows sorted by island and date, with categorical keys.
+
+    ``frame`` is shared by every dashboard session; treat it as read-only
+    (copy before adding columns).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.rename(columns=str.strip).copy()
+        df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+        for col in CATEGORICAL_COLS:
+            if col in df.columns:
+                values = df[col].astype(str)
+                df[col] = pd.Categorical(values, categories=sorted(values.unique()))
+        self.frame = df.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.frame)
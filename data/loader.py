@@ -1,21 +1,112 @@
-"""Data loading utilities (cached in Streamlit)."""
+"""Data loading utilities (cached in Streamlit).
+
+Everything is cached with ``st.cache_resource``: one read-only copy shared by
+all sessions (no per-session pickling), keyed by :func:`data_version`, i.e.
+the paths, sizes and mtimes of the source files plus the reload marker the
+agent touches after writing new data. A new version is loaded on the next
+rerun and ``MAX_VERSIONS`` bounds how many stay in memory (oldest evicted).
+Callers must not modify the returned objects.
+"""
+
+import os
+import threading
 
 import pandas as pd
 import streamlit as st
 
-@st.cache_data
-def load_main_dataset():
-    """Load the main passengers dataset from result.csv."""
+from data.cube import CUBE_DIR, INDEX_FILE, AggregateCube, read_index, source_version, write_cube
+from data.dataset import PassengerDataset
+from data.storage import DETAILS_TABLE, read_table, reload_stamp, table_exists
+from kpi.kpi_calculator import calculate_kpi_table
+from forecast.islands import ISLAND_FORECAST_FILES, LEGACY_FORECAST_FILES
+
+MAX_VERSIONS = 2   # data versions kept in memory (current + the one being replaced)
+_CUBE_LOCK = threading.Lock()   # one cube rebuild at a time across sessions
+
+
+def data_version(source=None) -> str:
+    """Cache key of the dashboard data: source files plus the agent's reload marker."""
+    source = source_version() if source is None else source
+    return f"{source}#{reload_stamp()}"
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_VERSIONS)
+def _dataset(version):
+    if table_exists(DETAILS_TABLE):
+        return PassengerDataset(read_table(DETAILS_TABLE))
+
     df = pd.read_csv("result.csv", parse_dates=["Fecha"], encoding="utf-8-sig")
-    df = df.rename(columns=str.strip)
-    return df
+    return PassengerDataset(df)
+
+
+def load_main_dataset():
+    """Load the main passengers dataset as a sorted, categorical ``PassengerDataset``.
+
+    Reads the typed Parquet store when it exists and falls back to result.csv.
+    Island and date-range reads go through :func:`load_cube`.
+    """
+    return _dataset(data_version())
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_VERSIONS)
+def _kpi_table(version):
+    return calculate_kpi_table(_dataset(version).frame)
+
+
+def load_kpis():
+    """KPI records of every island (``{island: kpi}``).
+
+    Computed in one pass per data version and shared by all sessions, so
+    showing an island's KPIs is a dictionary lookup.
+    """
+    return _kpi_table(data_version())
+
+
+@st.cache_resource(show_spinner=False, max_entries=MAX_VERSIONS)
+def _open_cube(index_mtime):
+    return AggregateCube(CUBE_DIR)
+
+
+def load_cube():
+    """Memory-mapped aggregate cube of the main dataset.
+
+    The agent rebuilds it after every ingest; if it is missing or older than
+    the data it is rebuilt here once (sessions arriving meanwhile wait for
+    it instead of rebuilding too). Reopened only when its index changes.
+    """
+    source = source_version()
+    index = read_index(CUBE_DIR)
+    if index is None or index.get("source") != source:
+        with _CUBE_LOCK:
+            index = read_index(CUBE_DIR)
+            if index is None or index.get("source") != source:
+                write_cube(_dataset(data_version(source)).frame, source=source)
+    return _open_cube(os.stat(os.path.join(CUBE_DIR, INDEX_FILE)).st_mtime_ns)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2 * MAX_VERSIONS)
+def _forecast_csv(path, mtime_ns):
+    return pd.read_csv(path, parse_dates=["Fecha"], encoding="utf-8-sig")
+
+
+def _read_forecast_table(model):
+    path = ISLAND_FORECAST_FILES[model]
+    if not os.path.exists(path):
+        path = LEGACY_FORECAST_FILES[model]
+    return _forecast_csv(path, os.stat(path).st_mtime_ns)
+
 
-@st.cache_data
 def load_forecasts():
-    """Load XGB and LSTM forecast CSVs if available."""
+    """Load the XGB and LSTM forecast tables if available.
+
+    The dashboard only reads results: the consolidated all-island
+    ``forecast_islands_*.csv`` tables the agent rewrites after every ingest
+    (or the single-series Total Canarias file if one is missing). No model
+    is loaded, fitted or run in the dashboard process; a table is re-read
+    only when its file changes.
+    """
     try:
-        df_xgb = pd.read_csv("forecast_total_canarias_xgb.csv", parse_dates=["Fecha"], encoding="utf-8-sig")
-        df_lstm = pd.read_csv("forecast_total_canarias_lstm.csv", parse_dates=["Fecha"], encoding="utf-8-sig")
+        df_xgb, df_lstm = _read_forecast_table("xgb"), _read_forecast_table("lstm")
         return df_xgb, df_lstm
     except Exception as e:
         st.warning(f"⚠️ No se pudieron cargar las predicciones: {e}")
@@ -0,0 +1,90 @@
+"""Content-hash cache for parsed raw workbooks.
+
+Each entry holds the detail/total frames extracted from one ``.xlsx`` file,
+stored as two Parquet files named after the SHA-256 of the workbook plus the
+parser version::
+
+    .cache/parse/<sha256>-v<version>.details.parquet
+    .cache/parse/<sha256>-v<version>.total.parquet
+
+An unchanged workbook therefore never has to be opened again, and bumping the
+parser version invalidates every entry at once.
+"""
+
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+CACHE_DIR = ".cache/parse"
+MAX_AGE_DAYS = 180
+
+
+def file_digest(path, chunk_size=1 << 20) -> str:
+    """SHA-256 of the file contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(path, parser_version) -> str:
+    """Cache key of a workbook: content hash + parser version."""
+    return f"{file_digest(path)}-v{parser_version}"
+
+
+def _entry_paths(key: str, cache_dir=CACHE_DIR):
+    root = Path(cache_dir)
+    return root / f"{key}.details.parquet", root / f"{key}.total.parquet"
+
+
+def load(key: str, cache_dir=CACHE_DIR):
+    """Return ``(df_details, df_totals)`` for ``key`` or ``None`` on a miss."""
+    details_path, total_path = _entry_paths(key, cache_dir)
+    if not details_path.exists() or not total_path.exists():
+        return None
+    try:
+        df_details = pd.read_parquet(details_path)
+        df_totals = pd.read_parquet(total_path)
+    except Exception:
+        return None
+    # refresh mtime so eviction by age behaves like an LRU
+    now = time.time()
+    for p in (details_path, total_path):
+        os.utime(p, (now, now))
+    return df_details, df_totals
+
+
+def save(key: str, df_details: pd.DataFrame, df_totals: pd.DataFrame, cache_dir=CACHE_DIR):
+    """Store the frames of one workbook (atomic per file)."""
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    for df, path in zip((df_details, df_totals), _entry_paths(key, cache_dir)):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        df.reset_index(drop=True).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+
+def evict(keep_keys=None, max_age_days=MAX_AGE_DAYS, cache_dir=CACHE_DIR) -> int:
+    """Remove stale entries and return how many files were deleted.
+
+    An entry is stale when ``keep_keys`` is given and it is not in it (the
+    workbook changed, was removed, or the parser version was bumped), or when
+    it has not been used for ``max_age_days``.
+    """
+    root = Path(cache_dir)
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+    removed = 0
+    for path in root.glob("*.parquet"):
+        key = path.name.split(".", 1)[0]
+        stale = keep_keys is not None and key not in keep_keys
+        if cutoff is not None and path.stat().st_mtime < cutoff:
+            stale = True
+        if stale:
+            path.unlink()
+            removed += 1
+    return removed
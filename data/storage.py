@@ -0,0 +1,313 @@
+"""Columnar storage for the passenger tables (partitioned Parquet datasets).
+
+The detail table (``result.csv``) and the island totals (``result_total.csv``)
+are kept as Hive-partitioned Parquet datasets, one directory per island and
+year::
+
+    store/details/Isla=Gran%20Canaria/Año=2024/part-0.parquet
+    store/total/Isla=Tenerife/Año=2025/part-0.parquet
+
+Columns are stored typed (categorical ``Isla``/``AEROPUERTO_DE_PROCEDENCIA``,
+datetime ``Fecha``, integer ``Pasajeros``), so loading does not re-parse text.
+CSV export is still available through :func:`export_csv`.
+"""
+
+import os
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+STORE_DIR = "store"
+DETAILS_TABLE = "details"
+TOTAL_TABLE = "total"
+
+PARTITION_COLS = ["Isla", "Año"]
+PARTITIONING = ds.partitioning(
+    pa.schema([("Isla", pa.string()), ("Año", pa.int32())]), flavor="hive"
+)
+
+TABLE_COLUMNS = {
+    DETAILS_TABLE: ["AEROPUERTO_DE_PROCEDENCIA", "Mes_Año", "Pasajeros", "Isla", "Mes", "Año", "MesNum", "Fecha"],
+    TOTAL_TABLE: ["Isla", "Fecha", "Mes", "Año", "MesNum", "Pasajeros"],
+}
+TABLE_KEYS = {
+    DETAILS_TABLE: ["Isla", "Fecha", "AEROPUERTO_DE_PROCEDENCIA"],
+    TOTAL_TABLE: ["Isla", "Fecha"],
+}
+CATEGORICAL_COLS = ["Isla", "AEROPUERTO_DE_PROCEDENCIA"]
+CSV_CHUNKSIZE = 5000
+RELOAD_MARKER = ".reload"   # touched by the agent after writing new data
+
+
+def table_path(name: str, store_dir=STORE_DIR) -> Path:
+    """Return the directory holding the dataset ``name``."""
+    return Path(store_dir) / name
+
+
+def table_exists(name: str, store_dir=STORE_DIR) -> bool:
+    """True if the dataset has at least one Parquet file."""
+    path = table_path(name, store_dir)
+    return path.is_dir() and any(path.rglob("*.parquet"))
+
+
+def _partition_subdir(isla: str, year: int) -> Path:
+    return Path(f"Isla={quote(str(isla), safe='')}") / f"Año={int(year)}"
+
+
+def partition_dir(name: str, isla: str, year: int, store_dir=STORE_DIR) -> Path:
+    """Directory of one (Isla, Año) partition."""
+    return table_path(name, store_dir) / _partition_subdir(isla, year)
+
+
+def normalize_types(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    """Coerce a passenger table to the storage schema.
+
+    Rows without ``Fecha`` or ``Pasajeros`` are dropped (same rule as the
+    CSV pipeline), the result is sorted by ``Isla``/``Fecha`` and
+    deduplicated on the table key keeping the last occurrence.
+    """
+    columns = TABLE_COLUMNS[name]
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise KeyError(f"Missing columns for table '{name}': {missing}")
+
+    df = df[columns].copy()
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    df["Pasajeros"] = pd.to_numeric(df["Pasajeros"], errors="coerce")
+    df = df.dropna(subset=["Fecha", "Pasajeros", "Isla"])
+
+    df["Pasajeros"] = df["Pasajeros"].astype("int64")
+    df["Año"] = df["Fecha"].dt.year.astype("int32")
+    df["MesNum"] = df["Fecha"].dt.month.astype("int32")
+    df["Mes"] = df["Mes"].astype(str)
+    if "Mes_Año" in df.columns:
+        df["Mes_Año"] = df["Mes_Año"].astype(str)
+
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip()
+
+    df = df.drop_duplicates(subset=TABLE_KEYS[name], keep="last")
+    df = df.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = pd.Categorical(df[col], categories=sorted(df[col].unique()))
+    return df
+
+
+def _tmp_path(path: Path) -> Path:
+    """Hidden sibling used for atomic writes (ignored by dataset discovery)."""
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+def _write_partition(df: pd.DataFrame, path: Path):
+    """Write one partition frame as ``part-0.parquet`` inside ``path``.
+
+    The file is written to a temporary name and renamed over the old one, so
+    readers never see a half-written partition and files are never modified
+    in place (hard-linked snapshots keep the previous version).
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    target = path / "part-0.parquet"
+    tmp = _tmp_path(target)
+    table = pa.Table.from_pandas(df.drop(columns=PARTITION_COLS), preserve_index=False)
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, target)
+    for old in path.glob("*.parquet"):
+        if old != target:
+            old.unlink()
+
+
+def write_table(df: pd.DataFrame, name: str, store_dir=STORE_DIR):
+    """Replace the whole dataset ``name`` with ``df``, one file per (Isla, Año).
+
+    The new dataset is built next to the old one and swapped in with renames.
+    """
+    df = normalize_types(df, name)
+    root = table_path(name, store_dir)
+    staging = _tmp_path(root)
+    if staging.exists():
+        shutil.rmtree(staging)
+
+    for (isla, year), part in df.groupby(PARTITION_COLS, observed=True, sort=True):
+        _write_partition(part, staging / _partition_subdir(isla, year))
+
+    retired = root.with_name(f".{root.name}.old")
+    if retired.exists():
+        shutil.rmtree(retired)
+    if root.exists():
+        os.replace(root, retired)
+    os.replace(staging, root)
+    if retired.exists():
+        shutil.rmtree(retired)
+
+
+def _read_partition(name: str, isla: str, year: int, store_dir=STORE_DIR):
+    """Read a single (Isla, Año) partition, or ``None`` if it does not exist."""
+    path = partition_dir(name, isla, year, store_dir)
+    files = sorted(path.glob("*.parquet"))
+    if not files:
+        return None
+    df = pd.concat([pq.read_table(f).to_pandas() for f in files], ignore_index=True)
+    df["Isla"] = isla
+    df["Año"] = int(year)
+    return df
+
+
+def upsert_rows(df: pd.DataFrame, name: str, store_dir=STORE_DIR, replace=False) -> pd.DataFrame:
+    """Add rows to the dataset touching only their own (Isla, Año) partitions.
+
+    Months (``Isla``, ``Fecha``) that are already stored are skipped, unless
+    ``replace`` is set, in which case they are replaced as a whole (keyed
+    upsert for corrected months). The cost depends on the size of ``df`` and
+    of the partitions it touches, not on the size of the archive.
+
+    Returns the rows that were actually written.
+    """
+    df = normalize_types(df, name)
+    written = []
+    for (isla, year), new in df.groupby(PARTITION_COLS, observed=True, sort=True):
+        old = _read_partition(name, isla, year, store_dir)
+        if old is not None:
+            if replace:
+                old = old[~old["Fecha"].isin(new["Fecha"])]
+            else:
+                new = new[~new["Fecha"].isin(old["Fecha"])]
+                if new.empty:
+                    continue
+            merged = normalize_types(pd.concat([old, new], ignore_index=True), name)
+        else:
+            merged = new
+        _write_partition(merged, partition_dir(name, isla, year, store_dir))
+        written.append(new)
+
+    if not written:
+        return df.iloc[0:0]
+    return normalize_types(pd.concat(written, ignore_index=True), name)
+
+
+def read_table(name: str, store_dir=STORE_DIR, columns=None, filters=None) -> pd.DataFrame:
+    """Read the dataset ``name`` back as a typed DataFrame.
+
+    ``filters`` is a pyarrow expression (e.g. ``ds.field("Isla") == "Tenerife"``)
+    and only matching partitions are opened.
+    """
+    dataset = ds.dataset(table_path(name, store_dir), format="parquet", partitioning=PARTITIONING)
+    table = dataset.to_table(columns=columns, filter=filters)
+    df = table.to_pandas()
+    if columns is None:
+        df = df[TABLE_COLUMNS[name]]
+    if "Isla" in df.columns and "Fecha" in df.columns:
+        df = df.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = pd.Categorical(df[col], categories=sorted(df[col].astype(str).unique()))
+    return df
+
+
+def _csv_ready(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    out["Fecha"] = pd.to_datetime(out["Fecha"]).dt.strftime("%Y-%m-%d")
+    return out
+
+
+def export_csv(df: pd.DataFrame, csv_path, append=False, chunksize=CSV_CHUNKSIZE):
+    """Write a table with the same layout/encoding as the historical CSVs.
+
+    The file is written in chunks to a temporary name and renamed into
+    place. With ``append`` the rows are added at the end of an existing file
+    in a single write (no rewrite of the existing rows).
+    """
+    out = _csv_ready(df)
+    if append and os.path.exists(csv_path):
+        payload = out.to_csv(index=False, header=False)
+        with open(csv_path, "a", encoding="utf-8", newline="") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        return
+
+    tmp = _tmp_path(Path(csv_path))
+    out.to_csv(tmp, index=False, encoding="utf-8-sig", chunksize=chunksize)
+    os.replace(tmp, csv_path)
+
+
+def export_table_csv(name: str, csv_path, store_dir=STORE_DIR):
+    """Stream a stored dataset to CSV one partition at a time.
+
+    Peak memory is one (Isla, Año) partition instead of the whole table;
+    the output replaces ``csv_path`` atomically.
+    """
+    dataset = ds.dataset(table_path(name, store_dir), format="parquet", partitioning=PARTITIONING)
+    fragments = sorted(dataset.get_fragments(), key=lambda frag: frag.path)
+    tmp = _tmp_path(Path(csv_path))
+    with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+        header = True
+        for fragment in fragments:
+            part = fragment.to_table(schema=dataset.schema).to_pandas()
+            part = part.sort_values("Fecha", kind="mergesort")[TABLE_COLUMNS[name]]
+            _csv_ready(part).to_csv(f, index=False, header=header)
+            header = False
+    os.replace(tmp, csv_path)
+
+
+def snapshot_store(dest, store_dir=STORE_DIR) -> int:
+    """Copy-on-write snapshot of the store into ``dest``.
+
+    Every file is hard-linked (no data is copied); this is safe because the
+    store never modifies files in place, it only renames new files over old
+    ones. Falls back to a real copy where hard links are not supported.
+    Returns the number of files in the snapshot.
+    """
+    src_root = Path(store_dir)
+    count = 0
+    for src in src_root.rglob("*.parquet"):
+        if src.name.startswith("."):
+            continue
+        dst = Path(dest) / src.relative_to(src_root)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        count += 1
+    return count
+
+
+def request_reload(store_dir=STORE_DIR) -> Path:
+    """Touch the reload marker so running dashboards drop their cached data."""
+    path = Path(store_dir) / RELOAD_MARKER
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    os.utime(path)
+    return path
+
+
+def reload_stamp(store_dir=STORE_DIR) -> int:
+    """mtime (ns) of the reload marker, 0 if it was never touched."""
+    try:
+        return (Path(store_dir) / RELOAD_MARKER).stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def import_csv(csv_path, name: str, store_dir=STORE_DIR) -> pd.DataFrame:
+    """Build the dataset ``name`` from one of the historical CSV files."""
+    df = pd.read_csv(csv_path, encoding="utf-8-sig")
+    df = df.rename(columns=str.strip)
+    write_table(df, name, store_dir)
+    return read_table(name, store_dir)
+
+
+if __name__ == "__main__":
+    # One-off migration: python -m data.storage
+    for csv_file, table in (("result.csv", DETAILS_TABLE), ("result_total.csv", TOTAL_TABLE)):
+        if os.path.exists(csv_file):
+            rows = len(import_csv(csv_file, table))
+            print(f"{csv_file} -> {table_path(table)} ({rows} rows)")
@@ -1,12 +1,31 @@
 import os
 import re
+import gzip
+import json
 import shutil
 import requests
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from data import parse_cache
+from data.cube import write_cube
+from forecast.cache import ForecastCache
+from forecast.features import (
+    DEFAULT_LAGS, DEFAULT_WINDOWS,
+    compute_features, lag_columns, build_state, extend_features, features_match,
+)
+from data.storage import (
+    STORE_DIR, DETAILS_TABLE, TOTAL_TABLE,
+    table_exists, read_table, write_table, upsert_rows,
+    export_csv, export_table_csv, snapshot_store, request_reload,
+)
 
 # ==============================================================
 # 🔹 Constantes / configuración
@@ -17,14 +36,43 @@ RESULT_DETAILS_CSV = "result.csv"
 RESULT_TOTAL_CSV = "result_total.csv"
 FEATURES_WITH_LAGS = "result_total_with_lags.csv"
 FEATURES_WITH_LAGS_CODED = "result_total_with_lags_coded.csv"
+FEATURES_STATE = "features_state.json"   # últimos meses por isla para update_features()
+# Los CSV se siguen exportando por defecto (notebooks/modelos); EXPORT_CSV=0 los desactiva
+EXPORT_CSV = os.getenv("EXPORT_CSV", "1") == "1"
+# versión del extractor: súbela si cambia el parseo (invalida data/parse_cache)
+PARSER_VERSION = 1
+USE_PARSE_CACHE = os.getenv("PARSE_CACHE", "1") == "1"
+# motor de lectura Excel para pandas (None → openpyxl; "calamine" es más rápido)
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE") or None
 
 BASE_URL = "https://www.webtenerife.com/investigacion/situacion-turistica/trafico-aereo/"
+HTTP_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                   "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.1 Safari/537.36"),
+    "Accept-Language": "es-ES,es;q=0.9,en;q=0.8",
+    "Referer": "https://www.google.com/",
+}
+HTTP_TIMEOUT = 30            # segundos (conexión y lectura)
+HTTP_RETRIES = 3             # reintentos con backoff exponencial
+MAX_DOWNLOAD_WORKERS = 4     # descargas simultáneas
+DOWNLOAD_META = ".download_meta.json"   # ETag/Last-Modified/SHA-256 por URL (dentro de data/)
+REVALIDATE_LAST = 2          # últimos archivos que se revalidan (GET condicional) en cada run
 SPANISH_MONTHS = [
     "enero","febrero","marzo","abril","mayo","junio",
     "julio","agosto","septiembre","octubre","noviembre","diciembre"
 ]
 MESES_MAP = {m:i+1 for i, m in enumerate(SPANISH_MONTHS)}
 
+ISLAS = ["GRAN CANARIA", "FUERTEVENTURA", "LANZAROTE", "TENERIFE", "LA PALMA", "TOTAL CANARIAS"]
+# expresiones compiladas una sola vez y aplicadas a toda la hoja de golpe
+HEADER_RE = re.compile(r"AEROPUERTO PROCEDENCIA", re.IGNORECASE)
+FOOTER_RE = re.compile(
+    r"LLEGADA\s+DE\s+PASAJEROS|REGULAR\s*\+\s*NO\s*REGULAR"
+    r"|FUENTE|ELABORACI|TURISMO\s+DE\s+TENERIFE",
+    re.IGNORECASE,
+)
+PAREN_RE = re.compile(r"\s*\(.*?\)")
+
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
@@ -55,23 +103,60 @@ def parse_month_year_from_filename(filename: str):
     raise ValueError(f"No fue posible emparejar mes+año en el nombre del archivo: {filename}")
 
 
+def make_session(pool_size=MAX_DOWNLOAD_WORKERS, retries=HTTP_RETRIES):
+    """Sesión HTTP reutilizable: pool de conexiones + reintentos con backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HTTP_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def normalize_isla_name(value: str):
     if not isinstance(value, str):
         return ""
     value = value.strip()
-    value = re.sub(r"\s*\(.*?\)", "", value)
+    value = PAREN_RE.sub("", value)
     return value
 
 
+def _cells_as_text(df: pd.DataFrame) -> pd.Series:
+    """Todas las celdas de la hoja como texto, en una Serie plana (orden fila a fila)."""
+    return pd.Series(df.astype(str).to_numpy().ravel(), dtype=object)
+
+
+def rows_matching(df: pd.DataFrame, pattern: re.Pattern) -> np.ndarray:
+    """Máscara booleana de filas con alguna celda que case con `pattern` (vectorizado)."""
+    if df.empty:
+        return np.zeros(len(df), dtype=bool)
+    hits = _cells_as_text(df).str.contains(pattern, na=False, regex=True).to_numpy(dtype=bool)
+    return hits.reshape(df.shape).any(axis=1)
+
+
+def read_sheet_from_header(file_path: str, engine=EXCEL_ENGINE) -> pd.DataFrame:
+    """
+    Lee la primera hoja UNA sola vez y devuelve las filas a partir de la línea
+    'AEROPUERTO PROCEDENCIA' (equivale al antiguo read_excel(skiprows=...)).
+    El lector openpyxl de pandas ya abre el libro en modo read-only; con
+    EXCEL_ENGINE=calamine se usa el lector en Rust (requiere python-calamine).
+    """
+    sheet = pd.read_excel(file_path, header=None, engine=engine)
+    header_line = sheet.index[rows_matching(sheet, HEADER_RE)]
+    if len(header_line) == 0:
+        raise ValueError(f"No se encontró la línea 'AEROPUERTO PROCEDENCIA' en {file_path}")
+    return sheet.iloc[header_line[0]:].reset_index(drop=True)
+
+
 def load_and_clean_excel(file_path: str) -> pd.DataFrame:
     """Limpia y carga la hoja con datos de pasajeros."""
-    excel_preview = pd.read_excel(file_path, header=None)
-    header_line = excel_preview[
-        excel_preview.apply(
-            lambda r: r.astype(str).str.contains("AEROPUERTO PROCEDENCIA", case=False, na=False)
-        ).any(axis=1)
-    ].index
-    df = pd.read_excel(file_path, skiprows=header_line[0], header=None)
+    df = read_sheet_from_header(file_path)
 
     # eliminar columnas/filas vacías y registros basura/pies de página
     df = df.dropna(axis=1, how="all").dropna(axis=0, how="all").replace(["-", ""], pd.NA)
@@ -79,13 +164,7 @@ def load_and_clean_excel(file_path: str) -> pd.DataFrame:
     for col in df.select_dtypes(include="object"):
         df[col] = df[col].astype(str).str.strip()
 
-    patterns = [
-        r"LLEGADA\s+DE\s+PASAJEROS",
-        r"REGULAR\s*\+\s*NO\s*REGULAR",
-        r"FUENTE", r"ELABORACI", r"TURISMO\s+DE\s+TENERIFE"
-    ]
-    combined = "(" + "|".join(patterns) + ")"
-    df = df[~df.astype(str).apply(lambda x: x.str.contains(combined, case=False, na=False, regex=True)).any(axis=1)]
+    df = df[~rows_matching(df, FOOTER_RE)]
 
     return df.dropna(how="all").reset_index(drop=True)
 
@@ -93,15 +172,19 @@ def load_and_clean_excel(file_path: str) -> pd.DataFrame:
 def split_islands_from_combined_table(df: pd.DataFrame):
     """
     A partir de una hoja grande con varias islas crea la lista de marcadores de islas.
+    Busca en toda la hoja a la vez (sin iterrows): normaliza todas las celdas con
+    operaciones de texto vectorizadas y localiza las cabeceras con NumPy.
     """
-    islas = ["GRAN CANARIA", "FUERTEVENTURA", "LANZAROTE", "TENERIFE", "LA PALMA", "TOTAL CANARIAS"]
-    positions = []
-    for r_idx, row in df.iterrows():
-        for c_idx, value in enumerate(row):
-            if normalize_isla_name(value) in islas:
-                positions.append({"isla": normalize_isla_name(value), "row": r_idx, "col": c_idx})
-    positions.sort(key=lambda p: (p["row"], p["col"]))
-    return positions
+    if df.empty:
+        return []
+    names = _cells_as_text(df).str.strip().str.replace(PAREN_RE, "", regex=True)
+    hits = names.isin(ISLAS).to_numpy(dtype=bool)
+    rows, cols = np.nonzero(hits.reshape(df.shape))   # ya en orden (fila, columna)
+    flat_idx = rows * df.shape[1] + cols
+    return [
+        {"isla": names.iat[i], "row": df.index[r], "col": int(c)}
+        for i, r, c in zip(flat_idx, rows, cols)
+    ]
 
 
 def extract_isla_data(df, positions, nrows=40):
@@ -127,22 +210,55 @@ def extract_isla_data(df, positions, nrows=40):
 
 
 def backup_current_results():
+    """
+    Backup antes de actualizar:
+      - almacén Parquet → instantánea con hard links (no copia datos; los
+        archivos del almacén nunca se modifican in situ),
+      - CSV (solo si todavía no hay almacén) → copia comprimida .csv.gz en streaming.
+    """
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    if Path(RESULT_DETAILS_CSV).exists():
-        shutil.copy(RESULT_DETAILS_CSV, Path(BACKUP_DIR) / f"result_{ts}.csv")
-    if Path(RESULT_TOTAL_CSV).exists():
-        shutil.copy(RESULT_TOTAL_CSV, Path(BACKUP_DIR) / f"result_total_{ts}.csv")
+    if table_exists(DETAILS_TABLE) or table_exists(TOTAL_TABLE):
+        snapshot_store(Path(BACKUP_DIR) / f"store_{ts}")
+        return
+
+    for csv_path, prefix in ((RESULT_DETAILS_CSV, "result"), (RESULT_TOTAL_CSV, "result_total")):
+        if Path(csv_path).exists():
+            with open(csv_path, "rb") as src, gzip.open(Path(BACKUP_DIR) / f"{prefix}_{ts}.csv.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+
+def load_results():
+    """
+    Carga las tablas (detalles, total): del almacén Parquet si existe,
+    si no de los CSV históricos.
+    """
+    if table_exists(DETAILS_TABLE) and table_exists(TOTAL_TABLE):
+        return read_table(DETAILS_TABLE), read_table(TOTAL_TABLE)
+
+    if not Path(RESULT_DETAILS_CSV).exists() or not Path(RESULT_TOTAL_CSV).exists():
+        raise FileNotFoundError("❌ Faltan result.csv o result_total.csv. Necesitas datos base.")
+
+    results_details = pd.read_csv(RESULT_DETAILS_CSV, encoding="utf-8-sig")
+    results_total = pd.read_csv(RESULT_TOTAL_CSV, encoding="utf-8-sig")
+    return results_details, results_total
+
+
+def save_results(results_details, results_total, export_to_csv=EXPORT_CSV):
+    """Escribe ambas tablas en el almacén Parquet y, opcionalmente, en CSV."""
+    write_table(results_details, DETAILS_TABLE)
+    write_table(results_total, TOTAL_TABLE)
+    if export_to_csv:
+        export_csv(results_details, RESULT_DETAILS_CSV)
+        export_csv(results_total, RESULT_TOTAL_CSV)
 
 
 # ==============================================================
 # 🔹 Procesamiento principal del archivo
 # ==============================================================
-def process_new_excel(file_path, results_details, results_total, nrows=40):
+def extract_month_tables(file_path, nrows=40):
     """
-    Procesa un nuevo archivo Excel y añade registros a dos tablas:
-      - result.csv  (detalles: cada categoría/origen)
-      - result_total.csv (agregado 'TOTAL PASAJEROS' por isla)
-    Guardado precedido por conversión numérica y dropna.
+    Extrae de un archivo Excel solo los registros del mes indicado en su nombre.
+    Devuelve (df_details, df_totals) ya convertidos, sin vacíos y deduplicados.
     """
     file_path = Path(file_path)
     file_name = file_path.stem
@@ -226,6 +342,43 @@ def process_new_excel(file_path, results_details, results_total, nrows=40):
         df_totals = df_totals.dropna(subset=["Fecha", "Pasajeros", "Isla", "Año", "MesNum"])
         df_totals = df_totals.drop_duplicates(subset=["Isla", "Fecha"], keep="last")
 
+    return df_details, df_totals
+
+
+def workbook_cache_key(file_path, nrows=40):
+    """Clave de caché de un Excel: SHA-256 del contenido + versión del parser."""
+    return parse_cache.cache_key(file_path, f"{PARSER_VERSION}-{nrows}")
+
+
+def extract_month_tables_cached(file_path, nrows=40, use_cache=USE_PARSE_CACHE):
+    """
+    Igual que extract_month_tables(), pero reutiliza el resultado guardado en
+    la caché por contenido si el archivo no ha cambiado desde el último parseo.
+    """
+    if not use_cache:
+        return extract_month_tables(file_path, nrows=nrows)
+
+    key = workbook_cache_key(file_path, nrows=nrows)
+    cached = parse_cache.load(key)
+    if cached is not None:
+        return cached
+
+    df_details, df_totals = extract_month_tables(file_path, nrows=nrows)
+    parse_cache.save(key, df_details, df_totals)
+    return df_details, df_totals
+
+
+def process_new_excel(file_path, results_details, results_total, nrows=40, export_to_csv=EXPORT_CSV):
+    """
+    Procesa un nuevo archivo Excel y añade registros a dos tablas:
+      - details / result.csv  (detalles: cada categoría/origen)
+      - total / result_total.csv (agregado 'TOTAL PASAJEROS' por isla)
+    Guardado (almacén Parquet + CSV opcional) precedido por conversión numérica y dropna.
+    Reconstruye las tablas completas; para el modo incremental ver ingest_new_excel().
+    """
+    # 1–4) registros del nuevo mes
+    df_details, df_totals = extract_month_tables(file_path, nrows=nrows)
+
     # 5) añadir a las tablas existentes y guardar SIN vacíos
     if not results_details.empty:
         results_details["Fecha"] = pd.to_datetime(results_details.get("Fecha"), errors="coerce")
@@ -250,33 +403,242 @@ def process_new_excel(file_path, results_details, results_total, nrows=40):
         results_total = results_total.drop_duplicates(subset=["Isla", "Fecha"], keep="last")
 
     # 6) guardado (después de dropna)
-    results_details.to_csv(RESULT_DETAILS_CSV, index=False, encoding="utf-8-sig")
-    results_total.to_csv(RESULT_TOTAL_CSV, index=False, encoding="utf-8-sig")
+    save_results(results_details, results_total, export_to_csv=export_to_csv)
 
-    print(f"✅ Guardado {RESULT_DETAILS_CSV} y {RESULT_TOTAL_CSV} (después de dropna + deduplicación).")
+    print(f"✅ Guardado {STORE_DIR}/ (+ CSV: {export_to_csv}) después de dropna + deduplicación.")
     return results_details, results_total
 
 
+def ingest_new_excel(file_path, upsert=False, nrows=40, export_to_csv=EXPORT_CSV, use_cache=USE_PARSE_CACHE):
+    """
+    Ingesta incremental: valida y escribe solo las particiones (Isla, Año)
+    del mes nuevo, sin cargar ni reescribir el histórico.
+      - upsert=False → solo añade; los meses (Isla, Fecha) ya guardados se omiten.
+      - upsert=True  → reemplaza los meses ya guardados (meses corregidos).
+    Devuelve (nuevos_detalles, nuevos_totales) realmente escritos.
+    """
+    df_details, df_totals = extract_month_tables_cached(file_path, nrows=nrows, use_cache=use_cache)
+    if df_details.empty and df_totals.empty:
+        print(f"⚠️ {Path(file_path).name}: sin registros válidos, nada que guardar.")
+        return df_details, df_totals
+
+    written_details = upsert_rows(df_details, DETAILS_TABLE, replace=upsert) if not df_details.empty else df_details
+    written_totals = upsert_rows(df_totals, TOTAL_TABLE, replace=upsert) if not df_totals.empty else df_totals
+
+    skipped = len(df_totals) - len(written_totals)
+    if skipped:
+        print(f"ℹ️ {skipped} meses (Isla, Fecha) ya existían y se omitieron (usa upsert=True para reemplazarlos).")
+
+    if export_to_csv and (len(written_details) or len(written_totals)):
+        # los CSV van ordenados por (Isla, Fecha): el mes nuevo de cada isla cae
+        # en medio del archivo, no al final → reexportar desde el almacén
+        # partición a partición (memoria acotada, reemplazo atómico).
+        # Con EXPORT_CSV=0 la ingesta solo toca las particiones del mes.
+        export_table_csv(DETAILS_TABLE, RESULT_DETAILS_CSV)
+        export_table_csv(TOTAL_TABLE, RESULT_TOTAL_CSV)
+
+    print(f"✅ Ingesta incremental: {len(written_details)} detalles, {len(written_totals)} totales → {STORE_DIR}/")
+    return written_details, written_totals
+
+
+def ensure_store():
+    """Crea el almacén Parquet a partir de los CSV si todavía no existe."""
+    if table_exists(DETAILS_TABLE) and table_exists(TOTAL_TABLE):
+        return
+    results_details, results_total = load_results()
+    write_table(results_details, DETAILS_TABLE)
+    write_table(results_total, TOTAL_TABLE)
+    print(f"🗄️ Almacén {STORE_DIR}/ creado desde los CSV.")
+
+
+# ==============================================================
+# 🔹 Backfill: reconstrucción completa desde data/*.xlsx
+# ==============================================================
+CANONICAL_NAME_RE = re.compile(r"\d+_pasajeros_canarias_[a-z]+_\d{4}")
+
+
+def source_priority(file_name: str):
+    """
+    Prioridad de un archivo cuando varios aportan el mismo mes (mayor gana):
+      1) nombre canónico del agente (NN_pasajeros_canarias_mes_año)
+         → 06_..._junio_2024 gana a 06_..._junio__2024,
+      2) archivo de un solo mes frente a multi-mes (07_09_...julio_septiembre),
+      3) número de secuencia más alto (descarga más reciente),
+      4) nombre del archivo (desempate determinista).
+    """
+    stem = Path(file_name).stem.lower()
+    tokens = re.split(r"[_\-\s]+", stem)
+    single_month = sum(t in SPANISH_MONTHS for t in tokens) == 1
+    m = re.match(r"^(\d+)_", stem)
+    seq = int(m.group(1)) if m else -1
+    return (bool(CANONICAL_NAME_RE.fullmatch(stem)), single_month, seq, stem)
+
+
+def _parse_workbook(file_path, nrows=40, use_cache=USE_PARSE_CACHE):
+    """Trabajo de un proceso del pool: (nombre, detalles, totales) o (nombre, error)."""
+    name = Path(file_path).name
+    try:
+        df_details, df_totals = extract_month_tables_cached(file_path, nrows=nrows, use_cache=use_cache)
+    except Exception as e:
+        return name, f"{type(e).__name__}: {e}"
+    return name, (df_details, df_totals)
+
+
+def _keep_winning_sources(frames, keys=("Isla", "Fecha")):
+    """Une los frames por archivo y conserva, para cada mes (Isla, Fecha), solo el archivo ganador."""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df["_prio"] = df["_source"].map(source_priority)
+    winner = df.groupby(list(keys))["_prio"].transform("max")
+    return df[df["_prio"] == winner].drop(columns=["_source", "_prio"])
+
+
+def backfill(data_dir=DATA_DIR, workers=None, replace_all=False, nrows=40,
+             export_to_csv=EXPORT_CSV, use_cache=USE_PARSE_CACHE):
+    """
+    Reconstruye las tablas desde todos los Excel de data/ en una sola pasada:
+      1) parsea los libros en paralelo (pool de procesos); los que no han
+         cambiado se leen de la caché por contenido (use_cache=False la ignora),
+      2) resuelve duplicados/solapes entre archivos con source_priority(),
+      3) escribe almacén (y CSV) una sola vez.
+    Con replace_all=False los meses que no aparecen en ningún Excel (histórico
+    anterior a data/) se conservan del almacén/CSV actual.
+    """
+    files = sorted(str(p) for p in Path(data_dir).glob("*.xlsx"))
+    if not files:
+        raise RuntimeError(f"❌ No hay archivos .xlsx en {data_dir}/")
+
+    print(f"🧱 Backfill: {len(files)} archivos con {workers or os.cpu_count()} procesos...")
+    details_frames, total_frames = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        n = len(files)
+        for name, result in pool.map(_parse_workbook, files, [nrows] * n, [use_cache] * n):
+            if isinstance(result, str):
+                print(f"⚠️ {name}: {result}")
+                continue
+            df_details, df_totals = result
+            details_frames.append(df_details.assign(_source=name))
+            total_frames.append(df_totals.assign(_source=name))
+
+    if use_cache:
+        # entradas de archivos modificados/borrados o de otra versión del parser
+        keep = {workbook_cache_key(f, nrows=nrows) for f in files}
+        removed = parse_cache.evict(keep_keys=keep)
+        if removed:
+            print(f"🧹 Caché de parseo: {removed} entradas obsoletas eliminadas.")
+
+    new_details = _keep_winning_sources(details_frames)
+    new_totals = _keep_winning_sources(total_frames)
+    if new_totals.empty:
+        raise RuntimeError("❌ Ningún archivo aportó registros válidos.")
+
+    if not replace_all:
+        try:
+            old_details, old_totals = load_results()
+        except FileNotFoundError:
+            old_details, old_totals = pd.DataFrame(), pd.DataFrame()
+
+        def keep_uncovered(old, new):
+            if old.empty:
+                return new
+            old = old.copy()
+            old["Fecha"] = pd.to_datetime(old["Fecha"], errors="coerce")
+            covered = pd.MultiIndex.from_frame(new[["Isla", "Fecha"]].astype({"Isla": str}))
+            mask = pd.MultiIndex.from_frame(old[["Isla", "Fecha"]].astype({"Isla": str})).isin(covered)
+            return pd.concat([old[~mask], new], ignore_index=True)
+
+        new_details = keep_uncovered(old_details, new_details)
+        new_totals = keep_uncovered(old_totals, new_totals)
+
+    # mismo orden que los CSV históricos (Isla, Fecha); estable dentro del mes
+    new_details = new_details.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+    new_totals = new_totals.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+    save_results(new_details, new_totals, export_to_csv=export_to_csv)
+    print(f"✅ Backfill completo: {len(new_details)} detalles, {len(new_totals)} totales.")
+    return new_details, new_totals
+
+
+# ==============================================================
+# 🔹 Cubo de agregados del dashboard
+# ==============================================================
+def build_cube():
+    """
+    Materializa el cubo de agregados (isla × mes × procedencia, totales,
+    tipos de vuelo, sumas anuales y estacionalidad) en store/cube/, que el
+    dashboard abre con memory-map en lugar de filtrar result.csv.
+    """
+    if table_exists(DETAILS_TABLE):
+        details = read_table(DETAILS_TABLE)
+    elif Path(RESULT_DETAILS_CSV).exists():
+        details = pd.read_csv(RESULT_DETAILS_CSV, encoding="utf-8-sig")
+    else:
+        print("⚠️ No hay tabla de detalles – omito el cubo.")
+        return None
+    path = write_cube(details)
+    print(f"🧊 Cubo de agregados guardado en {path}/")
+    return path
+
+
+# ==============================================================
+# 🔹 Modelos y tablas de pronóstico del dashboard
+# ==============================================================
+def refresh_forecasts(retrain_mode="none"):
+    """
+    Reescribe forecast_islands_*.csv con los modelos de models/ (el XGB global
+    se ajusta aquí si todavía no existe) y, con retrain_mode distinto de
+    "none", actualiza antes el XGB (ver ForecastService.retrain).
+    El dashboard solo lee estas tablas: nunca carga ni ajusta modelos.
+    Un servicio por modelo, para que sin TensorFlow solo falle el LSTM.
+    """
+    from forecast.service import MODELS, ForecastService
+
+    written = []
+    for model in MODELS:
+        try:
+            service = ForecastService(models=(model,))
+            if model == "xgb" and retrain_mode != "none":
+                print(f"🧮 XGB: modo {service.retrain(retrain_mode)}")
+            for path in service.write_tables():
+                print(f"💾 Guardado {path}")
+                written.append(path)
+        except Exception as e:
+            print(f"⚠️ {model.upper()}: no se pudo actualizar el pronóstico: {e}")
+    return written
+
+
 # ==============================================================
 # 🔹 Construcción de características (lags/rolling) – paso separado
 # ==============================================================
+def _read_total_for_features(result_total_csv=RESULT_TOTAL_CSV):
+    """Tabla de totales: del almacén Parquet si existe (ruta por defecto), si no del CSV."""
+    if result_total_csv == RESULT_TOTAL_CSV and table_exists(TOTAL_TABLE):
+        return read_table(TOTAL_TABLE)
+    if not Path(result_total_csv).exists():
+        return None
+    return pd.read_csv(result_total_csv, encoding="utf-8-sig")
+
+
 def build_features(result_total_csv=RESULT_TOTAL_CSV,
                    out_with_lags=FEATURES_WITH_LAGS,
-                   out_with_lags_coded=FEATURES_WITH_LAGS_CODED):
+                   out_with_lags_coded=FEATURES_WITH_LAGS_CODED,
+                   lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                   state_path=FEATURES_STATE):
     """
-    Calcula características cíclicas, lags 1..12 y rolling 3/6 para cada isla.
-    No se ejecuta automáticamente en run(); ejecútalo cuando quieras (p. ej. en CI).
+    Calcula características cíclicas, lags (por defecto 1..12) y rolling
+    (por defecto 3/6) para todas las islas en una sola pasada vectorizada
+    (ver forecast/features.py). Guarda también el estado incremental
+    (últimos meses por isla) que usa update_features().
+    Devuelve el DataFrame completo de características (o None si no hay datos).
     """
-    import numpy as np
-
-    if not Path(result_total_csv).exists():
+    df = _read_total_for_features(result_total_csv)
+    if df is None:
         print(f"⚠️ Falta {result_total_csv} – omito build_features.")
-        return
-
-    df = pd.read_csv(result_total_csv, encoding="utf-8-sig")
+        return None
     if df.empty:
         print("⚠️ result_total.csv vacío – nada que hacer.")
-        return
+        return None
 
     # sanity + tipos
     for col in ("Fecha", "Pasajeros", "Isla", "Año", "MesNum"):
@@ -289,41 +651,92 @@ def build_features(result_total_csv=RESULT_TOTAL_CSV,
     df["MesNum"] = pd.to_numeric(df["MesNum"], errors="coerce")
 
     df = df.dropna(subset=["Fecha", "Pasajeros", "Isla", "Año", "MesNum"]).copy()
-    df = df.sort_values(["Isla", "Fecha"]).reset_index(drop=True)
-
-    # características cíclicas y year_norm
-    df["month_sin"] = np.sin(2 * np.pi * df["MesNum"] / 12.0)
-    df["month_cos"] = np.cos(2 * np.pi * df["MesNum"] / 12.0)
-    years_sorted = sorted(df["Año"].astype(int).unique())
-    year_map = {y: i + 1 for i, y in enumerate(years_sorted)}
-    df["year_norm"] = df["Año"].astype(int).map(year_map)
-
-    # lags 1..12 por isla
-    fe = df.copy()
-    for lag in range(1, 13):
-        fe[f"lag_{lag}"] = fe.groupby("Isla")["Pasajeros"].shift(lag)
-
-    # rolling (sobre desplazado 1)
-    s1 = fe.groupby("Isla")["Pasajeros"].shift(1)
-    fe["roll3"] = s1.groupby(fe["Isla"]).rolling(3).mean().reset_index(level=0, drop=True)
-    fe["roll6"] = s1.groupby(fe["Isla"]).rolling(6).mean().reset_index(level=0, drop=True)
-
-    lag_cols = [f"lag_{i}" for i in range(1, 13)] + ["roll3", "roll6"]
+
+    # calendario + lags + rolling por isla (un solo paso sobre el array ordenado)
+    fe = compute_features(df, lags=lags, windows=windows)
+
+    lag_cols = lag_columns(lags, windows)
     fe_full = fe.dropna(subset=lag_cols).reset_index(drop=True)
 
     # guardado
     fe.to_csv(out_with_lags, index=False, encoding="utf-8-sig")
     fe_full.to_csv(out_with_lags_coded, index=False, encoding="utf-8-sig")
+    if state_path:
+        state = build_state(fe, lags=lags, windows=windows)
+        Path(state_path).write_text(json.dumps(state, indent=1), encoding="utf-8")
     print(f"📈 Guardadas características: {out_with_lags} y {out_with_lags_coded}")
+    return fe
+
+
+def _csv_header(path):
+    with open(path, encoding="utf-8-sig") as f:
+        return f.readline().rstrip("\r\n").split(",")
+
+
+def update_features(new_totals,
+                    out_with_lags=FEATURES_WITH_LAGS,
+                    out_with_lags_coded=FEATURES_WITH_LAGS_CODED,
+                    state_path=FEATURES_STATE,
+                    check=False):
+    """
+    Actualización incremental de características tras una ingesta: calcula
+    lags/rolling SOLO para las filas nuevas a partir del estado guardado
+    (buffer con los últimos meses de cada isla) y las añade a los CSV.
+    Si no es posible (sin estado, meses anteriores al último, columnas
+    distintas...) hace build_features() completo.
+    Con check=True verifica el resultado contra una reconstrucción completa.
+    """
+    if new_totals is None or len(new_totals) == 0:
+        return
+    if not (Path(state_path).exists() and Path(out_with_lags).exists() and Path(out_with_lags_coded).exists()):
+        build_features(out_with_lags=out_with_lags, out_with_lags_coded=out_with_lags_coded, state_path=state_path)
+        return
+
+    state = json.loads(Path(state_path).read_text(encoding="utf-8"))
+    try:
+        feats, new_state = extend_features(new_totals, state)
+        header = _csv_header(out_with_lags)
+        if header != _csv_header(out_with_lags_coded) or set(header) != set(feats.columns):
+            raise ValueError("las columnas de los CSV de características no coinciden")
+    except ValueError as e:
+        print(f"ℹ️ Características: reconstrucción completa ({e}).")
+        build_features(out_with_lags=out_with_lags, out_with_lags_coded=out_with_lags_coded, state_path=state_path)
+        return
+
+    feats = feats[header]
+    lag_cols = lag_columns(new_state["lags"], new_state["windows"])
+    feats.to_csv(out_with_lags, mode="a", header=False, index=False, encoding="utf-8")
+    feats.dropna(subset=lag_cols).to_csv(out_with_lags_coded, mode="a", header=False, index=False, encoding="utf-8")
+    Path(state_path).write_text(json.dumps(new_state, indent=1), encoding="utf-8")
+    print(f"📈 Características: {len(feats)} filas nuevas añadidas (incremental).")
+
+    if check and not check_features_consistency(out_with_lags, new_state["lags"], new_state["windows"]):
+        print("⚠️ Las características incrementales no coinciden con la reconstrucción completa → rebuild.")
+        build_features(out_with_lags=out_with_lags, out_with_lags_coded=out_with_lags_coded, state_path=state_path)
+
+
+def check_features_consistency(out_with_lags=FEATURES_WITH_LAGS, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+    """Compara el CSV de características con una reconstrucción completa en memoria."""
+    df = _read_total_for_features()
+    if df is None or not Path(out_with_lags).exists():
+        return False
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    df = df.dropna(subset=["Fecha", "Pasajeros", "Isla", "Año", "MesNum"])
+    expected = compute_features(df, lags=lags, windows=windows)
+    current = pd.read_csv(out_with_lags, encoding="utf-8-sig")
+    if set(current.columns) != set(expected.columns):
+        return False
+    return features_match(current, expected[current.columns])
 
 
 # ==============================================================
 # 🔹 Agente
 # ==============================================================
 class PassengerAgent:
-    def __init__(self, data_dir=DATA_DIR, base_url=BASE_URL):
+    def __init__(self, data_dir=DATA_DIR, base_url=BASE_URL, session=None):
         self.data_dir = data_dir
         self.base_url = base_url
+        self.session = session or make_session()
 
     def get_last_month_file(self):
         files = [f for f in os.listdir(self.data_dir) if f.endswith(".xlsx")]
@@ -338,21 +751,183 @@ class PassengerAgent:
         next_year = anio + 1 if next_idx == 0 else anio
         return SPANISH_MONTHS[next_idx], next_year
 
-    def download_latest_file(self, target_month: str, target_year: int):
-        headers = {
-            "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                           "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.1 Safari/537.36"),
-            "Accept-Language": "es-ES,es;q=0.9,en;q=0.8",
-            "Referer": "https://www.google.com/",
-        }
-
+    # ----------------------------------------------------------
+    # Descargas (sesión con pool de conexiones, reintentos, GET condicional)
+    # ----------------------------------------------------------
+    def fetch_index_links(self, meta=None):
+        """
+        Descarga la página índice UNA vez y devuelve las URLs absolutas de los .xlsx.
+        Con `meta` hace un GET condicional y, si el índice no cambió (304),
+        reutiliza la lista de enlaces guardada.
+        """
         print(f"🌍 Cargando página: {self.base_url}")
-        resp = requests.get(self.base_url, headers=headers)
+        cached = (meta or {}).get("index", {})
+        headers = {}
+        if cached.get("links") is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        resp = self.session.get(self.base_url, headers=headers, timeout=HTTP_TIMEOUT)
+        if resp.status_code == 304:
+            print("ℹ️ Índice sin cambios (304).")
+            return list(cached["links"])
         resp.raise_for_status()
         soup = BeautifulSoup(resp.text, "html.parser")
 
         links = [a["href"] for a in soup.find_all("a", href=True) if ".xlsx" in a["href"].lower()]
         links = [urljoin(self.base_url, href) for href in links]
+        if meta is not None:
+            meta["index"] = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "links": links,
+            }
+        return links
+
+    def _next_seq(self):
+        nums = []
+        for f in os.listdir(self.data_dir):
+            m = re.match(r"^(\d+)_", f)
+            if f.endswith(".xlsx") and m:
+                nums.append(int(m.group(1)))
+        return max(nums) + 1 if nums else 1
+
+    def _load_download_meta(self):
+        path = Path(self.data_dir) / DOWNLOAD_META
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        return {"index": {}, "files": {}}
+
+    def _save_download_meta(self, meta):
+        path = Path(self.data_dir) / DOWNLOAD_META
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def download_file(self, url, dst, validators=None):
+        """
+        GET condicional de `url` hacia `dst`.
+        Si `dst` existe y hay ETag/Last-Modified previos (validators), el servidor
+        puede responder 304 y no se vuelve a descargar.
+        Si responde 200 (sin validadores, o con un ETag nuevo para el mismo
+        archivo), se compara el SHA-256 del contenido con el del archivo
+        guardado: sólo cuenta como cambiado si los bytes difieren.
+        Devuelve (cambiado: bool, validators nuevos con "sha256").
+        """
+        validators = validators or {}
+        headers = {}
+        if os.path.exists(dst):
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        resp = self.session.get(url, headers=headers, timeout=HTTP_TIMEOUT, stream=True)
+        if resp.status_code == 304:
+            resp.close()
+            return False, validators
+        resp.raise_for_status()
+
+        tmp = f"{dst}.part"
+        with open(tmp, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        digest = parse_cache.file_digest(tmp)
+        previous = validators.get("sha256")
+        if previous is None and os.path.exists(dst):
+            previous = parse_cache.file_digest(dst)
+        os.replace(tmp, dst)
+        return digest != previous, {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "sha256": digest,
+            "path": dst,
+        }
+
+    def find_missing_months(self, links):
+        """
+        Meses publicados en el índice posteriores al último mes presente en data/.
+        Devuelve [(mes, año, url)] en orden cronológico (una URL por mes).
+        """
+        local = []
+        for f in os.listdir(self.data_dir):
+            if f.endswith(".xlsx"):
+                try:
+                    mes, anio = parse_month_year_from_filename(f)
+                except ValueError:
+                    continue
+                local.append((anio, MESES_MAP[mes]))
+        last = max(local) if local else (0, 0)
+
+        by_month = {}
+        for url in links:
+            try:
+                mes, anio = parse_month_year_from_filename(os.path.basename(url))
+            except ValueError:
+                continue
+            if (anio, MESES_MAP[mes]) > last:
+                by_month.setdefault((anio, MESES_MAP[mes]), []).append(url)
+
+        return [
+            (SPANISH_MONTHS[m - 1], y, sorted(urls)[-1])
+            for (y, m), urls in sorted(by_month.items())
+        ]
+
+    def sync_files(self, max_workers=MAX_DOWNLOAD_WORKERS, revalidate_last=REVALIDATE_LAST):
+        """
+        Lee el índice una sola vez y, con como máximo `max_workers` descargas
+        simultáneas:
+          - descarga todos los meses que faltan en data/,
+          - revalida con GET condicional los `revalidate_last` últimos archivos
+            descargados (el organismo a veces corrige meses ya publicados);
+            un archivo sólo cuenta como revisado si su SHA-256 cambia.
+        Devuelve (nuevos, revisados): rutas en orden cronológico.
+        """
+        meta = self._load_download_meta()
+        links = self.fetch_index_links(meta)
+        missing = self.find_missing_months(links)
+        if missing:
+            print("🧭 Meses pendientes: " + ", ".join(f"{m.title()} {y}" for m, y, _ in missing))
+
+        seq = self._next_seq()
+        new_jobs = [
+            (url, os.path.join(self.data_dir, f"{seq + i:02d}_pasajeros_canarias_{mes}_{anio}.xlsx"))
+            for i, (mes, anio, url) in enumerate(missing)
+        ]
+        known = [
+            (url, v["path"]) for url, v in meta.get("files", {}).items()
+            if v.get("path") and os.path.exists(v["path"]) and url in links
+        ]
+        def month_key(job):
+            mes, anio = parse_month_year_from_filename(job[1])
+            return anio, MESES_MAP[mes]
+
+        known.sort(key=month_key)
+        recheck_jobs = known[-revalidate_last:] if revalidate_last else []
+
+        jobs = new_jobs + recheck_jobs
+        files_meta = meta.setdefault("files", {})
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(self.download_file, url, dst, files_meta.get(url)) for url, dst in jobs]
+            results = [f.result() for f in futures]
+
+        new_paths, revised_paths = [], []
+        for i, ((url, dst), (changed, validators)) in enumerate(zip(jobs, results)):
+            files_meta[url] = validators
+            if i < len(new_jobs):
+                new_paths.append(dst)
+                print(f"📦 Guardado: {dst}")
+            elif changed:
+                revised_paths.append(dst)
+                print(f"♻️ Archivo revisado por el publicador: {dst}")
+        self._save_download_meta(meta)
+        return new_paths, revised_paths
+
+    def download_latest_file(self, target_month: str, target_year: int):
+        """Descarga un único mes concreto (modo manual)."""
+        links = self.fetch_index_links()
 
         want_month = target_month.lower()
         want_year = str(target_year)
@@ -366,82 +941,116 @@ class PassengerAgent:
 
         excel_url = sorted(cand)[-1]
 
-        existing = [f for f in os.listdir(self.data_dir) if f.endswith(".xlsx")]
-        next_seq = 1
-        if existing:
-            nums = []
-            for f in existing:
-                m = re.match(r"^(\d+)_", f)
-                if m:
-                    nums.append(int(m.group(1)))
-            next_seq = max(nums) + 1 if nums else 1
-
-        filename = f"{next_seq:02d}_pasajeros_canarias_{want_month}_{want_year}.xlsx"
+        filename = f"{self._next_seq():02d}_pasajeros_canarias_{want_month}_{want_year}.xlsx"
         dst = os.path.join(self.data_dir, filename)
 
         if os.path.exists(dst):
             print(f"ℹ️ Archivo ya existe, omito descarga: {dst}")
             return dst
 
-        fresp = requests.get(excel_url, headers=headers)
-        fresp.raise_for_status()
-        with open(dst, "wb") as f:
-            f.write(fresp.content)
+        meta = self._load_download_meta()
+        _, meta.setdefault("files", {})[excel_url] = self.download_file(excel_url, dst)
+        self._save_download_meta(meta)
 
         print(f"📦 Guardado: {dst}")
         return dst
 
-    def run(self):
+    def run(self, use_cache=USE_PARSE_CACHE):
         """
-        Ciclo principal: encuentra el nuevo mes, descarga el archivo,
-        haz backup, actualiza CSV (con DROPNAs), FIN.
-        (Sin lags en este paso — lo hace build_features()).
+        Ciclo principal: encuentra los meses nuevos, descarga los archivos,
+        haz backup, actualiza almacén/CSV (con DROPNAs) y las características
+        (lags/rolling) de forma incremental, FIN.
         """
         files = sorted([f for f in os.listdir(self.data_dir) if f.endswith(".xlsx")])
         if not files:
             raise RuntimeError("❌ No hay archivos en data/. Añade el primero manualmente.")
 
         last_file = files[-1]
-        next_month, next_year = self.get_next_month_name(last_file)
-        print(f"🧭 Último archivo: {last_file} → Busco: {next_month.title()} {next_year}")
-
-        # 1) descargar nuevo archivo
-        new_path = self.download_latest_file(next_month, next_year)
-        print(f"✅ Nuevo archivo guardado: {new_path}")
+        print(f"🧭 Último archivo: {last_file} → busco todos los meses posteriores")
 
-        # 2) cargar CSV existentes
-        if not Path(RESULT_DETAILS_CSV).exists() or not Path(RESULT_TOTAL_CSV).exists():
-            raise FileNotFoundError("❌ Faltan result.csv o result_total.csv. Necesitas datos base.")
+        # 1) descargar todos los meses que falten (en paralelo) + revalidar los últimos
+        new_paths, revised_paths = self.sync_files()
+        if not new_paths and not revised_paths:
+            print("ℹ️ No hay meses nuevos publicados.")
+            return
+        print(f"✅ Nuevos archivos: {len(new_paths)} · revisados: {len(revised_paths)}")
 
-        results_details = pd.read_csv(RESULT_DETAILS_CSV, encoding="utf-8-sig")
-        results_total = pd.read_csv(RESULT_TOTAL_CSV, encoding="utf-8-sig")
+        # 2) almacén Parquet (se crea desde los CSV la primera vez)
+        ensure_store()
 
         # 3) backup
         backup_current_results()
         print("💾 Backup OK.")
 
-        # 4) procesar nuevo archivo → actualización CSV (dropna dentro)
-        before_rows = len(results_total)
-        results_details, results_total = process_new_excel(new_path, results_details, results_total)
-        added_rows = len(results_total) - before_rows
-        print(f"➕ Añadidos {added_rows} registros a {RESULT_TOTAL_CSV}")
+        # 4) ingesta incremental de cada archivo nuevo (solo sus particiones)
+        appended = []
+        for new_path in new_paths:
+            _, new_totals = ingest_new_excel(new_path, use_cache=use_cache)
+            appended.append(new_totals)
+            print(f"➕ {Path(new_path).name}: añadidos {len(new_totals)} registros a {TOTAL_TABLE}")
+        for path in revised_paths:
+            _, new_totals = ingest_new_excel(path, upsert=True, use_cache=use_cache)
+            print(f"♻️ {Path(path).name}: reemplazados {len(new_totals)} registros en {TOTAL_TABLE}")
+
+        # 5) características (lags/rolling): incrementales salvo si se corrigió historia
+        if revised_paths:
+            build_features()
+        else:
+            update_features(pd.concat(appended, ignore_index=True), check=os.getenv("FEATURES_CHECK") == "1")
+
+        # cubo de agregados del dashboard
+        build_cube()
 
-        # 5) (opcional) reentrenamiento después de actualizar
+        # pronósticos en caché (.cache/forecast) calculados con los datos anteriores
+        removed = ForecastCache().clear()
+        if removed:
+            print(f"🧹 Caché de pronósticos invalidada ({removed} entradas)")
+
+        # 6) modelos y tablas de pronóstico — en el mismo proceso, sin relanzar
+        #    los scripts; (opcional) reentrenamiento con RUN_RETRAIN=1:
+        #    meses corregidos → ajuste completo; si no, RETRAIN_MODE=auto|warm|full|none
+        mode = "none"
         if os.getenv("RUN_RETRAIN") == "1":
-            try:
-                print("🚀 RUN_RETRAIN=1 → inicio reentrenamiento de modelos...")
-                os.system("python model_final_xgb.py")
-                os.system("python model_final_lstm.py")
-                print("✅ Modelos reentrenados.")
-            except Exception as e:
-                print(f"⚠️ Error durante el entrenamiento: {e}")
+            print("🚀 RUN_RETRAIN=1 → inicio reentrenamiento de modelos...")
+            mode = "full" if revised_paths else os.getenv("RETRAIN_MODE", "auto")
+        refresh_forecasts(mode)
+
+        # 7) aviso al dashboard: sus cachés compartidas se recargan en el siguiente rerun
+        request_reload()
 
 
 # ==============================================================
 # 🔹 Lanzamiento
 # ==============================================================
 if __name__ == "__main__":
-    agent = PassengerAgent()
-    agent.run()
-    # Si quieres construir las características para XGB/LSTM de inmediato, descomenta:
-    # build_features()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Agente de descarga de pasajeros Canarias")
+    parser.add_argument("--no-cache", action="store_true", help="ignora la caché de parseo de Excel")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("run", help="descarga e ingesta del siguiente mes (por defecto)")
+    p_backfill = sub.add_parser("backfill", help="reconstruye las tablas desde data/*.xlsx")
+    p_backfill.add_argument("--workers", type=int, default=None, help="procesos en paralelo")
+    p_backfill.add_argument("--replace", action="store_true",
+                            help="no conservar meses que no estén en ningún Excel")
+    p_features = sub.add_parser("features", help="reconstruye las características (lags/rolling)")
+    p_features.add_argument("--check", action="store_true",
+                            help="solo verifica el CSV actual contra una reconstrucción completa")
+    args = parser.parse_args()
+
+    use_cache = USE_PARSE_CACHE and not args.no_cache
+    if args.command == "backfill":
+        backfill(workers=args.workers, replace_all=args.replace, use_cache=use_cache)
+        build_features()
+        build_cube()
+        refresh_forecasts()
+        request_reload()
+    elif args.command == "features":
+        if args.check:
+            ok = check_features_consistency()
+            print("✅ Características coherentes." if ok else "❌ Características desactualizadas.")
+        else:
+            build_features()
+    else:
+        agent = PassengerAgent()
+        agent.run(use_cache=use_cache)
@@ -0,0 +1,179 @@
+"""Vectorized rolling-origin backtest for the recursive XGB forecaster.
+
+The feature matrix is built once for the whole history (same logic as
+``build_features``) and its rows are ordered by date, so the training set of
+any cutoff is a prefix slice of it (a view, no copy). Models are refitted
+every ``refit_every`` cutoffs only; folds in between reuse the last model
+(which never saw data after their own cutoff). All folds x islands are then
+forecast in a single batched step loop, and the errors are reported per
+forecast horizon::
+
+    python -m forecast.backtest --cutoffs 24 --horizon 12 --refit-every 6
+"""
+
+import numpy as np
+import pandas as pd
+
+from forecast.features import (
+    DEFAULT_LAGS, DEFAULT_WINDOWS, add_month_index, compute_features, lag_columns, year_base,
+)
+from forecast.islands import island_matrix
+from forecast.recursive import XGB_FEATURES, RecursiveForecaster
+
+HORIZON = 12
+N_CUTOFFS = 24
+REFIT_EVERY = 1
+
+
+class FeatureMatrix:
+    """Training rows of all islands, sorted by date (then island).
+
+    ``rows_until(cutoff)`` returns ``(X, y)`` views with every row dated on
+    or before ``cutoff``. The features come from ``compute_features`` (the
+    function ``build_features`` writes the coded table with), so
+    ``year_norm`` is the dense year rank over the whole history, and
+    ``month_idx`` counts complete rows per island as ``load_all_islands``
+    does; ``base_year`` continues that ``year_norm`` in the forecasts.
+    """
+
+    def __init__(self, df_total, features=XGB_FEATURES, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+        fe = compute_features(df_total, lags=lags, windows=windows)
+        fe = fe.dropna(subset=lag_columns(lags, windows)).reset_index(drop=True)
+        fe = add_month_index(fe)
+        self.base_year = year_base(fe)
+
+        order = np.lexsort((fe["Isla"].astype(str).to_numpy(), fe["Fecha"].to_numpy()))
+        fe = fe.iloc[order].reset_index(drop=True)
+        self.frame = fe
+        self.X = np.ascontiguousarray(fe[list(features)].to_numpy(dtype=float))
+        self.y = fe["Pasajeros"].to_numpy(dtype=float)
+        self.dates = fe["Fecha"].to_numpy()
+
+    def rows_until(self, cutoff):
+        end = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(cutoff)), side="right")
+        return self.X[:end], self.y[:end]
+
+    def rows_per_island(self, islands, cutoffs) -> np.ndarray:
+        """Number of training rows of every island up to every cutoff: ``(n_cutoffs, n_islands)``."""
+        isla = self.frame["Isla"].astype(str).to_numpy()
+        out = np.empty((len(cutoffs), len(islands)), dtype=np.int64)
+        cut = np.asarray(pd.DatetimeIndex(cutoffs).to_numpy())
+        for j, name in enumerate(islands):
+            out[:, j] = np.searchsorted(self.dates[isla == name], cut, side="right")
+        return out
+
+
+class GroupedModel:
+    """``predict`` that sends contiguous row blocks to different fitted models."""
+
+    def __init__(self, models, sizes):
+        self.models = list(models)
+        self.bounds = np.cumsum([0, *sizes])
+
+    def predict(self, X):
+        out = np.empty(len(X))
+        for model, lo, hi in zip(self.models, self.bounds[:-1], self.bounds[1:]):
+            out[lo:hi] = model.predict(X[lo:hi])
+        return out
+
+
+def default_cutoffs(dates, n_cutoffs=N_CUTOFFS, horizon=HORIZON, min_train=24, step=1):
+    """The last ``n_cutoffs`` origins, ``step`` months apart, that still have ``horizon`` months to score."""
+    dates = pd.DatetimeIndex(dates)
+    last = len(dates) - 1 - horizon
+    positions = np.arange(last, min_train - 1, -step)[:n_cutoffs]
+    return dates[positions[::-1]]
+
+
+def run_backtest(df_total, model_factory, cutoffs=None, horizon=HORIZON, refit_every=REFIT_EVERY,
+                 features=XGB_FEATURES) -> pd.DataFrame:
+    """Backtest ``model_factory()`` at every cutoff; one row per (island, cutoff, step).
+
+    ``refit_every=k`` fits a model at every k-th cutoff only (``None``: one
+    model, fitted at the first cutoff). Predictions past the end of the data
+    have no ``actual`` and are left out of the error curves.
+    """
+    islands, dates, history = island_matrix(df_total, "Pasajeros")
+    fm = FeatureMatrix(df_total, features)
+    cutoffs = pd.DatetimeIndex(default_cutoffs(dates, horizon=horizon) if cutoffs is None else cutoffs)
+    n_folds, n_islands = len(cutoffs), len(islands)
+
+    # models: one per block of `refit_every` consecutive cutoffs, trained on a prefix view
+    block = n_folds if not refit_every else int(refit_every)
+    models, sizes = [], []
+    for start in range(0, n_folds, block):
+        X_train, y_train = fm.rows_until(cutoffs[start])
+        models.append(model_factory().fit(X_train, y_train))
+        sizes.append(min(block, n_folds - start) * n_islands)
+
+    # batch rows are fold-major: (cutoff 0: island 0..k), (cutoff 1: ...), ...
+    forecaster = RecursiveForecaster(GroupedModel(models, sizes), features)
+    cap = forecaster.cap
+    origin = dates.get_indexer(cutoffs) + 1
+    if (origin <= 0).any():
+        raise ValueError("Every cutoff must be a month present in the data")
+    padded = np.concatenate([np.full((n_islands, cap), np.nan), history,
+                             np.full((n_islands, horizon), np.nan)], axis=1)
+    window_idx = origin[:, None] + np.arange(cap)[None, :]                   # (folds, cap) in padded coords
+    hist = padded[:, window_idx].transpose(1, 0, 2).reshape(-1, cap)         # (folds*islands, cap)
+    actual_idx = origin[:, None] + cap + np.arange(horizon)[None, :]
+    actual = padded[:, actual_idx].transpose(1, 0, 2).reshape(-1, horizon)
+
+    future = (cutoffs.to_numpy().astype("datetime64[M]")[:, None] + np.arange(1, horizon + 1)).astype("datetime64[ns]")
+    future = np.repeat(future, n_islands, axis=0)
+    month_idx0 = fm.rows_per_island(islands, cutoffs).reshape(-1)
+    preds = forecaster.forecast(hist, future, base_year=fm.base_year, month_idx0=month_idx0)
+
+    return pd.DataFrame({
+        "Isla": np.tile(np.repeat(islands, horizon), n_folds),
+        "cutoff": np.repeat(cutoffs, n_islands * horizon),
+        "h": np.tile(np.arange(1, horizon + 1), n_folds * n_islands),
+        "Fecha": future.reshape(-1),
+        "actual": actual.reshape(-1),
+        "pred": preds.reshape(-1),
+    })
+
+
+def error_curves(results: pd.DataFrame, by=None) -> pd.DataFrame:
+    """MAE / RMSE / MAPE per forecast step ``h`` (optionally also per ``by``, e.g. ``"Isla"``)."""
+    res = results.dropna(subset=["actual"])
+    err = res["pred"] - res["actual"]
+    tmp = pd.DataFrame({
+        "abs": err.abs(), "sq": err ** 2, "ape": err.abs() / res["actual"].abs() * 100,
+    })
+    keys = ([by] if isinstance(by, str) else list(by or [])) + ["h"]
+    for k in keys:
+        tmp[k] = res[k].to_numpy()
+    out = tmp.groupby(keys, observed=True).agg(mae=("abs", "mean"), mse=("sq", "mean"),
+                                               mape=("ape", "mean"), n=("abs", "size")).reset_index()
+    out["rmse"] = np.sqrt(out.pop("mse"))
+    return out[keys + ["mae", "rmse", "mape", "n"]]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import model_final_xgb as xgb_script
+
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the XGB forecaster")
+    parser.add_argument("--total", default="result_total.csv", help="island totals CSV")
+    parser.add_argument("--cutoffs", type=int, default=N_CUTOFFS, help="number of monthly origins")
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    parser.add_argument("--refit-every", type=int, default=REFIT_EVERY, help="refit the model every N cutoffs")
+    parser.add_argument("--out", default=None, help="write the per-step results to this CSV")
+    args = parser.parse_args()
+
+    df_total = pd.read_csv(args.total, encoding="utf-8-sig")
+    df_total["Fecha"] = pd.to_datetime(df_total["Fecha"])
+    dates = island_matrix(df_total, "Pasajeros")[1]
+
+    t0 = time.perf_counter()
+    results = run_backtest(df_total, xgb_script.build_pooled_model,
+                           cutoffs=default_cutoffs(dates, args.cutoffs, args.horizon),
+                           horizon=args.horizon, refit_every=args.refit_every)
+    print(f"{results['cutoff'].nunique()} cutoffs x {results['Isla'].nunique()} islands "
+          f"in {time.perf_counter() - t0:.1f} s")
+    print(error_curves(results).to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False, encoding="utf-8-sig")
@@ -0,0 +1,119 @@
+"""Forecast result cache (in-process LRU + Parquet files on disk).
+
+A forecast is identified by ``(model, island, horizon, data hash, artifact
+hash)``: the data hash covers the history rows the forecaster consumed and
+the artifact hash the model files in ``models/``. New data or a new model
+therefore produce new keys, and stale entries are never served; the agent
+also clears the cache after every ingest so old entries do not pile up.
+
+Entries live in memory (most recently used first, bounded) and in
+``.cache/forecast/<key>.parquet`` so they survive restarts and are shared
+between processes (agent, service, dashboard).
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data.parse_cache import file_digest
+
+CACHE_DIR = ".cache/forecast"
+MAX_MEMORY_ENTRIES = 64
+
+_digests = {}
+
+
+def data_hash(islands, dates, history) -> str:
+    """Hash of the history matrix a forecaster consumes (islands, months, values)."""
+    h = hashlib.sha256()
+    h.update("\x1f".join(map(str, islands)).encode("utf-8"))
+    h.update(np.asarray(pd.DatetimeIndex(dates).asi8).tobytes())
+    h.update(np.ascontiguousarray(history, dtype=float).tobytes())
+    return h.hexdigest()[:20]
+
+
+def artifact_hash(paths) -> str:
+    """Combined content hash of model files; digests are reused while size/mtime are unchanged."""
+    h = hashlib.sha256()
+    for path in paths:
+        st = os.stat(path)
+        stamp = (str(path), st.st_size, st.st_mtime_ns)
+        if _digests.get(str(path), (None,))[0] != stamp:
+            _digests[str(path)] = (stamp, file_digest(path))
+        h.update(_digests[str(path)][1].encode("ascii"))
+    return h.hexdigest()[:20]
+
+
+def cache_key(model, island, horizon, data_digest, artifact_digest, variant="") -> str:
+    raw = f"{model}|{island or '*'}|{int(horizon)}|{data_digest}|{artifact_digest}|{variant}"
+    return f"{model}-{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]}"
+
+
+class ForecastCache:
+    """Two-level cache of forecast tables; thread-safe."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_MEMORY_ENTRIES):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.parquet"
+
+    def _remember(self, key, df):
+        self._memory[key] = df
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Cached table for ``key`` (a copy) or ``None``."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key].copy()
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception:
+            return None
+        with self._lock:
+            self._remember(key, df)
+        return df.copy()
+
+    def put(self, key, df: pd.DataFrame):
+        """Store ``df`` in memory and on disk (atomic write)."""
+        df = df.reset_index(drop=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        with self._lock:
+            self._remember(key, df)
+
+    def get_or_compute(self, key, compute):
+        df = self.get(key)
+        if df is None:
+            df = compute()
+            self.put(key, df)
+        return df
+
+    def clear(self) -> int:
+        """Drop every entry (memory and disk); returns the number of files removed."""
+        with self._lock:
+            self._memory.clear()
+        removed = 0
+        if self.cache_dir.is_dir():
+            for path in self.cache_dir.glob("*.parquet"):
+                path.unlink()
+                removed += 1
+        return removed
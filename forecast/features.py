@@ -0,0 +1,201 @@
+"""Vectorized lag / rolling feature engine for the monthly passenger series.
+
+All series are processed together in one pass over an island-contiguous
+NumPy array (rows sorted by ``Isla`` then ``Fecha``): lags are a single
+gather with a per-row "position inside its island" mask, and rolling means
+are computed on strided windows. The output columns match the historical
+``result_total_with_lags*.csv`` layout (``lag_1..lag_12``, ``roll3``, ``roll6``).
+"""
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_LAGS = tuple(range(1, 13))
+DEFAULT_WINDOWS = (3, 6)
+
+
+def lag_columns(lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS):
+    """Names of the lag and rolling columns, in output order."""
+    return [f"lag_{k}" for k in lags] + [f"roll{w}" for w in windows]
+
+
+def group_positions(groups) -> np.ndarray:
+    """Position of every row inside its (contiguous) group: 0, 1, 2, ... per island."""
+    groups = np.asarray(groups)
+    n = len(groups)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.r_[True, groups[1:] != groups[:-1]]
+    start_idx = np.flatnonzero(starts)
+    run_lengths = np.diff(np.r_[start_idx, n])
+    return np.arange(n) - np.repeat(start_idx, run_lengths)
+
+
+def lag_matrix(values, positions, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS) -> np.ndarray:
+    """Feature matrix ``(n_rows, len(lags) + len(windows))`` for sorted series.
+
+    ``values`` is the target in island-contiguous order and ``positions`` the
+    row position inside each island (see :func:`group_positions`). Row ``i``
+    gets ``values[i - k]`` for every lag ``k`` and the mean of the ``w``
+    previous values for every window ``w``; entries that would reach into
+    another island (or before the start) are NaN.
+    """
+    y = np.asarray(values, dtype=float)
+    pos = np.asarray(positions)
+    n = len(y)
+    lags = np.asarray(lags, dtype=np.int64)
+    out = np.full((n, len(lags) + len(windows)), np.nan)
+    if n == 0:
+        return out
+
+    # all lags in one gather
+    idx = np.arange(n)[:, None] - lags[None, :]
+    valid = pos[:, None] >= lags[None, :]
+    out[:, :len(lags)] = np.where(valid, y[np.clip(idx, 0, None)], np.nan)
+
+    # rolling means of the previous w values (window [i-w, i-1])
+    for j, w in enumerate(windows, start=len(lags)):
+        if n <= w:
+            continue
+        means = sliding_window_view(y, w).sum(axis=1) / w      # means[s] = mean(y[s:s+w])
+        rows = np.arange(w, n)
+        col = np.full(n, np.nan)
+        col[rows] = means[rows - w]
+        col[pos < w] = np.nan
+        out[:, j] = col
+    return out
+
+
+def add_calendar_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Add ``month_sin``, ``month_cos`` and ``year_norm`` (dense year rank from 1)."""
+    month = df["MesNum"].to_numpy(dtype=float)
+    df["month_sin"] = np.sin(2 * np.pi * month / 12.0)
+    df["month_cos"] = np.cos(2 * np.pi * month / 12.0)
+    _, year_rank = np.unique(df["Año"].astype(int).to_numpy(), return_inverse=True)
+    df["year_norm"] = year_rank.reshape(-1) + 1
+    return df
+
+
+def add_month_index(fe: pd.DataFrame, group_col="Isla") -> pd.DataFrame:
+    """Add ``month_idx``: position of every row inside its island (rows sorted by island/date)."""
+    fe["month_idx"] = group_positions(fe[group_col].astype(str).to_numpy())
+    return fe
+
+
+def year_base(fe: pd.DataFrame) -> int:
+    """Year whose ``year_norm`` is 1 in a feature table.
+
+    ``year_norm`` is the dense rank of the years of the whole history, which
+    for monthly series is ``year - year_base + 1``; a recursive forecast
+    continuing the table must use this ``base_year``, not the first year
+    left after dropping incomplete rows.
+    """
+    return int(pd.to_datetime(fe["Fecha"]).dt.year.min()) - int(fe["year_norm"].min()) + 1
+
+
+def compute_features(df: pd.DataFrame, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                     group_col="Isla", target_col="Pasajeros") -> pd.DataFrame:
+    """Return ``df`` sorted by island/date with calendar, lag and rolling columns."""
+    df = df.sort_values([group_col, "Fecha"], kind="mergesort").reset_index(drop=True)
+    df = add_calendar_features(df)
+    groups = df[group_col].astype(str).to_numpy()
+    feats = lag_matrix(df[target_col].to_numpy(dtype=float), group_positions(groups), lags, windows)
+    return pd.concat([df, pd.DataFrame(feats, columns=lag_columns(lags, windows))], axis=1)
+
+
+# --------------------------------------------------------------------------
+# Incremental maintenance
+# --------------------------------------------------------------------------
+def build_state(fe: pd.DataFrame, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                group_col="Isla", target_col="Pasajeros") -> dict:
+    """Snapshot of what is needed to extend the features without the history.
+
+    Per island: the last ``max(lags + windows)`` target values (ring buffer),
+    the number of rows seen and the last date; plus the set of years used by
+    the ``year_norm`` rank. The result is JSON-serializable.
+    """
+    depth = max(max(lags), max(windows))
+    islands = {}
+    for isla, g in fe.groupby(group_col, sort=True, observed=True):
+        islands[str(isla)] = {
+            "last_fecha": pd.Timestamp(g["Fecha"].max()).strftime("%Y-%m-%d"),
+            "count": int(len(g)),
+            "history": g[target_col].to_numpy(dtype=float)[-depth:].tolist(),
+        }
+    return {
+        "lags": list(lags),
+        "windows": list(windows),
+        "years": sorted(int(y) for y in fe["Año"].unique()),
+        "islands": islands,
+    }
+
+
+def extend_features(new_rows: pd.DataFrame, state: dict, group_col="Isla", target_col="Pasajeros"):
+    """Compute feature rows for ``new_rows`` only, from the ring-buffer state.
+
+    Returns ``(features, new_state)``; ``features`` has the same columns as
+    :func:`compute_features`. Raises ``ValueError`` when the new rows cannot
+    be appended (a month at or before an island's last month, or a year that
+    would shift the ``year_norm`` rank) and a full rebuild is needed.
+    """
+    lags, windows = tuple(state["lags"]), tuple(state["windows"])
+    depth = max(max(lags), max(windows))
+    new = new_rows.sort_values([group_col, "Fecha"], kind="mergesort").reset_index(drop=True)
+    new["Fecha"] = pd.to_datetime(new["Fecha"])
+
+    years = set(state["years"])
+    added_years = set(new["Año"].astype(int)) - years
+    if years and added_years and min(added_years) < max(years):
+        raise ValueError(f"New years {sorted(added_years)} fall inside the history; rebuild needed")
+    years_sorted = sorted(years | added_years)
+
+    islands = {k: dict(v) for k, v in state["islands"].items()}
+    values, positions, is_new = [], [], []
+    for isla, g in new.groupby(group_col, sort=True, observed=True):
+        st = islands.get(str(isla), {"last_fecha": None, "count": 0, "history": []})
+        if st["last_fecha"] and g["Fecha"].min() <= pd.Timestamp(st["last_fecha"]):
+            raise ValueError(f"{isla}: {g['Fecha'].min().date()} is not after {st['last_fecha']}; rebuild needed")
+
+        hist = list(st["history"])
+        y_new = g[target_col].to_numpy(dtype=float).tolist()
+        start = st["count"] - len(hist)
+        block = hist + y_new
+        values.extend(block)
+        positions.extend(range(start, start + len(block)))
+        is_new.extend([False] * len(hist) + [True] * len(y_new))
+
+        islands[str(isla)] = {
+            "last_fecha": g["Fecha"].max().strftime("%Y-%m-%d"),
+            "count": st["count"] + len(y_new),
+            "history": block[-depth:],
+        }
+
+    feats = lag_matrix(values, positions, lags, windows)[np.asarray(is_new, dtype=bool)]
+
+    out = new.copy()
+    month = out["MesNum"].to_numpy(dtype=float)
+    out["month_sin"] = np.sin(2 * np.pi * month / 12.0)
+    out["month_cos"] = np.cos(2 * np.pi * month / 12.0)
+    out["year_norm"] = np.searchsorted(years_sorted, out["Año"].astype(int).to_numpy()) + 1
+    out = pd.concat([out, pd.DataFrame(feats, columns=lag_columns(lags, windows))], axis=1)
+
+    new_state = {"lags": list(lags), "windows": list(windows), "years": years_sorted, "islands": islands}
+    return out, new_state
+
+
+def features_match(a: pd.DataFrame, b: pd.DataFrame, group_col="Isla", rtol=1e-9) -> bool:
+    """True if two feature tables hold the same rows/values (order-insensitive)."""
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    keys = [group_col, "Fecha"]
+    a = a.assign(Fecha=pd.to_datetime(a["Fecha"])).sort_values(keys).reset_index(drop=True)
+    b = b.assign(Fecha=pd.to_datetime(b["Fecha"])).sort_values(keys).reset_index(drop=True)
+    for col in a.columns:
+        x, y = a[col], b[col]
+        if pd.api.types.is_numeric_dtype(x) and pd.api.types.is_numeric_dtype(y):
+            if not np.allclose(x.to_numpy(float), y.to_numpy(float), rtol=rtol, equal_nan=True):
+                return False
+        elif not (x.astype(str).to_numpy() == y.astype(str).to_numpy()).all():
+            return False
+    return True
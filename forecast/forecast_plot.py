@@ -4,25 +4,45 @@ import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 
-def plot_forecast_tab(df_full: pd.DataFrame, df_xgb: pd.DataFrame, df_lstm: pd.DataFrame):
-    """Render forecast tab: historical Total Canarias + XGB + LSTM."""
-    st.subheader("🔮 Predicción — Histórico + XGB + LSTM (Total Canarias)")
+from forecast.islands import select_island
 
+BAND_LOW, BAND_HIGH = "P10", "P90"
+
+
+def add_band(fig: go.Figure, df_pred: pd.DataFrame, name: str, color: str):
+    """Shaded P10–P90 band of a forecast (skipped for tables without bands)."""
+    if BAND_LOW not in df_pred.columns or df_pred[BAND_LOW].isna().all():
+        return
+    fig.add_trace(go.Scatter(
+        x=df_pred["Fecha"], y=df_pred[BAND_HIGH],
+        line=dict(width=0), hoverinfo="skip", showlegend=False,
+    ))
+    fig.add_trace(go.Scatter(
+        x=df_pred["Fecha"], y=df_pred[BAND_LOW],
+        name=f"{name} (P10–P90)", fill="tonexty", fillcolor=color,
+        line=dict(width=0),
+    ))
+
+def plot_forecast_tab(cube, df_xgb: pd.DataFrame, df_lstm: pd.DataFrame,
+                      island: str = "Total Canarias"):
+    """Render forecast tab: historical data of ``island`` (from the aggregate cube) + XGB + LSTM."""
+    st.subheader(f"🔮 Predicción — Histórico + XGB + LSTM ({island})")
+
+    df_xgb = select_island(df_xgb, island)
+    df_lstm = select_island(df_lstm, island)
     if df_xgb is None or df_lstm is None:
         st.warning("⚠️ No se pudieron cargar las predicciones.")
         return
+    if df_xgb.empty or df_lstm.empty:
+        st.warning(f"No hay predicciones para {island}.")
+        return
 
-    # Historical data for TOTAL PASAJEROS (all islands)
-    df_hist = df_full[
-        df_full["AEROPUERTO_DE_PROCEDENCIA"].str.upper() == "TOTAL PASAJEROS"
-    ].copy()
-
-    if df_hist.empty:
+    # Last month of TOTAL PASAJEROS history of the selected island
+    last_real_date = cube.last_month(island)
+    if last_real_date is None:
         st.warning("No hay datos históricos de 'TOTAL PASAJEROS'.")
         return
 
-    last_real_date = df_hist["Fecha"].max()
-
     xgb_real = df_xgb[df_xgb["Fecha"] <= last_real_date]
     xgb_pred = df_xgb[df_xgb["Fecha"] > last_real_date]
 
@@ -35,6 +55,7 @@ def plot_forecast_tab(df_full: pd.DataFrame, df_xgb: pd.DataFrame, df_lstm: pd.D
 
     # XGB traces
     if model_choice in ["XGB", "Ambos"]:
+        add_band(fig, xgb_pred, "XGB", "rgba(255,165,0,0.2)")
         fig.add_trace(go.Scatter(
             x=xgb_real["Fecha"],
             y=xgb_real["Pasajeros"],
@@ -50,6 +71,7 @@ def plot_forecast_tab(df_full: pd.DataFrame, df_xgb: pd.DataFrame, df_lstm: pd.D
 
     # LSTM traces
     if model_choice in ["LSTM", "Ambos"]:
+        add_band(fig, lstm_pred, "LSTM", "rgba(0,128,0,0.2)")
         fig.add_trace(go.Scatter(
             x=lstm_real["Fecha"],
             y=lstm_real["Pasajeros"],
@@ -78,12 +100,13 @@ def plot_forecast_tab(df_full: pd.DataFrame, df_xgb: pd.DataFrame, df_lstm: pd.D
     with st.expander("📋 Ver datos"):
 
         # Clean XGB display
-        xgb_display = df_xgb[["Fecha", "Pasajeros", "Phase"]].copy()
+        band_cols = ["P10", "P90"]
+        xgb_display = df_xgb[["Fecha", "Pasajeros", "Phase"] + [c for c in band_cols if c in df_xgb]].copy()
         xgb_display["Fecha"] = xgb_display["Fecha"].dt.to_period("M").astype(str)
         xgb_display = xgb_display.sort_values("Fecha")
 
         # Clean LSTM display
-        lstm_display = df_lstm[["Fecha", "Pasajeros", "Phase"]].copy()
+        lstm_display = df_lstm[["Fecha", "Pasajeros", "Phase"] + [c for c in band_cols if c in df_lstm]].copy()
         lstm_display["Fecha"] = lstm_display["Fecha"].dt.to_period("M").astype(str)
         lstm_display = lstm_display.sort_values("Fecha")
 
@@ -0,0 +1,77 @@
+"""Lockstep multi-island forecasting helpers.
+
+The long island tables are pivoted into an ``(islands, months)`` matrix on a
+shared date axis, so a recursive forecaster can step every island at once
+(one batched ``predict`` per month), and the predictions come back as one
+tidy table per model (``Isla``, ``Fecha``, ``Pasajeros``, ``Phase``).
+"""
+
+import numpy as np
+import pandas as pd
+
+ISLAND_FORECAST_FILES = {
+    "xgb": "forecast_islands_xgb.csv",
+    "lstm": "forecast_islands_lstm.csv",
+}
+LEGACY_FORECAST_FILES = {
+    "xgb": "forecast_total_canarias_xgb.csv",
+    "lstm": "forecast_total_canarias_lstm.csv",
+}
+FORECAST_COLUMNS = ["Isla", "Fecha", "Pasajeros", "Phase"]
+
+
+def island_matrix(df: pd.DataFrame, target_col="Pasajeros", group_col="Isla", date_col="Fecha"):
+    """Pivot a long table into ``(islands, dates, values)``.
+
+    ``values`` is ``(n_islands, n_dates)`` with NaN where an island has no
+    observation. The date axis stops at the last month that *every* island
+    has, so all series can be forecast from the same origin.
+    """
+    df = df[[group_col, date_col, target_col]].copy()
+    df[date_col] = pd.to_datetime(df[date_col])
+    df[group_col] = df[group_col].astype(str)
+    wide = df.pivot_table(index=group_col, columns=date_col, values=target_col, aggfunc="last")
+    wide = wide.sort_index().sort_index(axis=1)
+
+    last_common = min(row.last_valid_index() for _, row in wide.iterrows())
+    wide = wide.loc[:, wide.columns <= last_common]
+    return wide.index.tolist(), pd.DatetimeIndex(wide.columns), wide.to_numpy(dtype=float)
+
+
+def forecast_table(islands, hist_dates, history, future_dates, preds, bands=None,
+                   group_col="Isla", date_col="Fecha", target_col="Pasajeros") -> pd.DataFrame:
+    """One tidy History + Forecast table for all islands, sorted by island/date.
+
+    ``bands`` (e.g. ``{"P10": ..., "P90": ...}``, each ``(n_islands, horizon)``)
+    become extra columns, empty on History rows.
+    """
+    hist_dates = pd.DatetimeIndex(hist_dates)
+    future_dates = pd.DatetimeIndex(future_dates)
+    n_islands = len(islands)
+
+    hist = pd.DataFrame({
+        group_col: np.repeat(islands, len(hist_dates)),
+        date_col: np.tile(hist_dates, n_islands),
+        target_col: np.asarray(history, dtype=float).reshape(-1),
+        "Phase": "History",
+    }).dropna(subset=[target_col])
+    fut = pd.DataFrame({
+        group_col: np.repeat(islands, len(future_dates)),
+        date_col: np.tile(future_dates, n_islands),
+        target_col: np.asarray(preds, dtype=float).reshape(-1),
+        "Phase": "Forecast",
+    })
+    for name, values in (bands or {}).items():
+        hist[name] = np.nan
+        fut[name] = np.asarray(values, dtype=float).reshape(-1)
+    out = pd.concat([hist, fut], ignore_index=True)
+    return out.sort_values([group_col, date_col], kind="mergesort").reset_index(drop=True)
+
+
+def select_island(df: pd.DataFrame, island: str, group_col="Isla") -> pd.DataFrame:
+    """Rows of one island from a consolidated (or legacy single-island) table."""
+    if df is None:
+        return None
+    if group_col not in df.columns:
+        return df
+    return df[df[group_col].astype(str) == island]
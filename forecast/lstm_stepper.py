@@ -0,0 +1,77 @@
+"""Batched single-step inference for the sequence (LSTM) model.
+
+``model.predict`` builds a dataset and runs a callback loop on every call,
+which dominates the cost of a recursive forecast (one call per month). The
+stepper wraps the Keras model once in a ``tf.function`` with a fixed input
+signature (any batch size, no retracing) and keeps the input windows in a
+preallocated mirrored ring buffer, so each month is one compiled call plus
+two in-place writes.
+
+A batch row is one independent sequence (island, scenario...).
+"""
+
+import numpy as np
+import tensorflow as tf
+
+
+class LSTMStepper:
+    """Recursive multi-step forecaster for a ``(batch, win, n_features)`` model.
+
+    Feature 0 of the window is the (scaled) target fed back at every step;
+    the remaining features are exogenous (calendar) values supplied per step.
+    ``jit_compile`` compiles the step with XLA (about 2x faster on CPU; the
+    results can differ from ``model.predict`` in the last float32 digits).
+    """
+
+    def __init__(self, model, win, n_features, jit_compile=True):
+        self.model = model
+        self.win = int(win)
+        self.n_features = int(n_features)
+        spec = tf.TensorSpec(shape=(None, self.win, self.n_features), dtype=tf.float32)
+        self._step = tf.function(lambda x: model(x, training=False), input_signature=[spec],
+                                 jit_compile=jit_compile)
+
+    def warmup(self, batch=1):
+        """Trace the compiled step once so the first real call is fast."""
+        self._step(tf.zeros((batch, self.win, self.n_features), dtype=tf.float32))
+
+    def forecast(self, windows, exog, step_hook=None, window_hook=None):
+        """Run the recursion.
+
+        ``windows`` is ``(batch, win, n_features)`` with the last observed
+        months; ``exog`` is ``(horizon, n_features - 1)`` (shared by the
+        batch) or ``(batch, horizon, n_features - 1)``. ``step_hook(t, y)``
+        may edit the scaled predictions of step ``t`` in place before they
+        are fed back; ``window_hook(t, window)`` may return a modified copy
+        of the input window of step ``t`` (the buffer itself is not changed).
+        Returns the scaled predictions ``(batch, horizon)``.
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[None]
+        batch, win = windows.shape[0], self.win
+        exog = np.asarray(exog, dtype=np.float32)
+        if exog.ndim == 2:
+            exog = np.broadcast_to(exog, (batch,) + exog.shape)
+        horizon = exog.shape[1]
+
+        # mirrored ring buffer: the current window is buf[:, head:head + win]
+        buf = np.empty((batch, 2 * win, self.n_features), dtype=np.float32)
+        buf[:, :win] = windows
+        buf[:, win:] = windows
+        head = 0
+        preds = np.empty((batch, horizon), dtype=np.float32)
+
+        for t in range(horizon):
+            window = buf[:, head:head + win]
+            if window_hook is not None:
+                window = window_hook(t, window)
+            y = self._step(window).numpy()[:, 0]
+            if step_hook is not None:
+                step_hook(t, y)
+            preds[:, t] = y
+            for slot in (head, head + win):
+                buf[:, slot, 0] = y
+                buf[:, slot, 1:] = exog[:, t]
+            head = (head + 1) % win
+        return preds
@@ -0,0 +1,187 @@
+"""Allocation-free recursive forecaster for the lag-feature models.
+
+The model is fed its own predictions month after month. Instead of growing a
+DataFrame, the last ``cap`` values of every series live in a preallocated
+"mirrored" ring buffer (each value is written at ``i`` and ``i + cap``, so
+the current window is always one contiguous slice), the feature rows are a
+preallocated ``(batch, n_features)`` matrix updated in place, and the
+predictions go into a preallocated ``(batch, horizon)`` array.
+
+A batch row is one independent series (an island, a scenario, a simulated
+path...), so every step is a single ``model.predict`` call for all of them.
+
+``LevelScaledRegressor`` puts the lag features of series of very different
+sizes on one scale-free axis, so a single model can be pooled over them.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+
+from forecast.features import DEFAULT_LAGS, DEFAULT_WINDOWS
+
+XGB_FEATURES = [
+    "month_idx", "month_sin", "month_cos", "year_norm",
+    *[f"lag_{i}" for i in DEFAULT_LAGS],
+    *[f"roll{w}" for w in DEFAULT_WINDOWS],
+]
+
+
+def future_months(last_date, horizon_end):
+    """Month starts strictly after ``last_date`` up to ``horizon_end`` (inclusive)."""
+    return pd.period_range(pd.Timestamp(last_date), horizon_end, freq="M")[1:].to_timestamp()
+
+
+class LevelScaledRegressor(RegressorMixin, BaseEstimator):
+    """Fit ``regressor`` on lags and target relative to each row's level.
+
+    The level of a row is the median of its ``lag_<k>`` features (the last
+    year, robust to one outlier month). Lag / rolling features are divided
+    by it and the target is ``log(y / level)``; predictions are mapped back.
+    A model pooled over islands from 60k to 3M passengers then learns
+    relative dynamics instead of tree splits on absolute levels (which push
+    small islands toward the levels of large ones once the recursion drifts).
+    Calendar features are left as they are.
+    """
+
+    def __init__(self, regressor, feature_names=tuple(XGB_FEATURES)):
+        self.regressor = regressor
+        self.feature_names = feature_names
+
+    def _columns(self):
+        names = list(self.feature_names)
+        lag_cols = [j for j, f in enumerate(names) if f.startswith("lag_")]
+        scaled_cols = [j for j, f in enumerate(names) if f.startswith(("lag_", "roll"))]
+        return lag_cols, scaled_cols
+
+    def level(self, X) -> np.ndarray:
+        """Level of every row (1 where it is undefined)."""
+        lag_cols, _ = self._columns()
+        level = np.nanmedian(np.asarray(X, dtype=float)[:, lag_cols], axis=1)
+        return np.where(level > 0, level, 1.0)
+
+    def scale(self, X, y=None):
+        """``X`` (and ``y``) relative to the row levels, as seen by the inner regressor."""
+        _, scaled_cols = self._columns()
+        Xs = np.array(X, dtype=float)
+        level = self.level(Xs)
+        Xs[:, scaled_cols] /= level[:, None]
+        if y is None:
+            return Xs
+        return Xs, np.log(np.maximum(np.asarray(y, dtype=float) / level, 1e-6))
+
+    def fit(self, X, y):
+        Xs, ys = self.scale(X, y)
+        self.regressor_ = clone(self.regressor).fit(Xs, ys)
+        return self
+
+    def predict(self, X):
+        return np.exp(self.regressor_.predict(self.scale(X))) * self.level(X)
+
+
+class RecursiveForecaster:
+    """Step a fitted regressor forward over lag/rolling features.
+
+    ``feature_names`` fixes the column order of the model input; it may use
+    ``month_idx``, ``month_sin``, ``month_cos``, ``year_norm``, ``lag_<k>``
+    and ``roll<w>``. Predictions are clipped at ``clip_min`` (no negative
+    passengers), as in the original script.
+    """
+
+    def __init__(self, model, feature_names=XGB_FEATURES, clip_min=0.0):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self.clip_min = clip_min
+
+        self.lags = [int(f[4:]) for f in self.feature_names if f.startswith("lag_")]
+        self.windows = [int(f[4:]) for f in self.feature_names if f.startswith("roll")]
+        self.cap = max(self.lags + self.windows + [1])
+
+        col = {name: j for j, name in enumerate(self.feature_names)}
+        self._calendar_cols = [(name, col[name]) for name in ("month_idx", "month_sin", "month_cos", "year_norm")
+                               if name in col]
+        self._lag_cols = np.array([col[f"lag_{k}"] for k in self.lags], dtype=np.intp)
+        self._roll_cols = [(col[f"roll{w}"], w) for w in self.windows]
+
+    def calendar(self, dates, base_year, month_idx0):
+        """Calendar feature arrays for the forecast dates (computed once per run).
+
+        ``dates`` is shared by the whole batch (``(horizon,)``) or given per
+        series (``(batch, horizon)``, e.g. backtest folds with different origins).
+        """
+        months = np.asarray(dates, dtype="datetime64[M]").astype(np.int64)
+        month = (months % 12 + 1).astype(float)
+        year = (months // 12 + 1970).astype(float)
+        return {
+            "month_idx": month_idx0 + np.arange(months.shape[-1], dtype=float),
+            "month_sin": np.sin(2 * np.pi * month / 12),
+            "month_cos": np.cos(2 * np.pi * month / 12),
+            "year_norm": (year - base_year) + 1,
+        }
+
+    def forecast(self, history, dates, base_year, month_idx0=None, keep_features=False, step_hook=None):
+        """Run the recursion for every series in ``history``.
+
+        ``history`` is ``(batch, n)`` (or 1-D for a single series) with the
+        observed values, oldest first; NaN-padding on the left is allowed for
+        shorter series. ``dates`` are the future month starts, shared or per
+        series (see :meth:`calendar`). ``month_idx0`` is the ``month_idx`` of
+        the first forecast (scalar or per series; default ``n``).
+        ``step_hook(t, X, y)`` may edit the feature rows before ``predict``
+        and the prediction after it, in place.
+
+        Returns ``preds`` ``(batch, horizon)`` and, with ``keep_features``,
+        also the ``(batch, horizon, n_features)`` inputs that were used.
+        """
+        hist = np.atleast_2d(np.asarray(history, dtype=float))
+        batch, n = hist.shape
+        horizon = np.shape(dates)[-1]
+        cap = self.cap
+
+        # ring buffer preloaded with the last `cap` observations (NaN if fewer)
+        buf = np.full((batch, 2 * cap), np.nan)
+        tail = hist[:, -cap:]
+        buf[:, cap - tail.shape[1]:cap] = tail
+        buf[:, 2 * cap - tail.shape[1]:] = tail
+        head = 0   # next slot to overwrite; window = buf[:, head:head + cap]
+
+        if month_idx0 is None:
+            month_idx0 = n
+        idx0 = np.broadcast_to(np.asarray(month_idx0, dtype=float), (batch,))
+        cal = self.calendar(dates, base_year, 0.0)
+
+        X = np.empty((batch, len(self.feature_names)))
+        preds = np.empty((batch, horizon))
+        feats = np.empty((batch, horizon, X.shape[1])) if keep_features else None
+        lag_pos = cap - np.asarray(self.lags, dtype=np.intp)
+
+        for t in range(horizon):
+            for name, j in self._calendar_cols:
+                if name == "month_idx":
+                    np.add(idx0, cal["month_idx"][t], out=X[:, j])
+                else:
+                    X[:, j] = cal[name][..., t]
+
+            window = buf[:, head:head + cap]
+            X[:, self._lag_cols] = window[:, lag_pos]
+            for j, w in self._roll_cols:
+                np.mean(window[:, cap - w:], axis=1, out=X[:, j])
+
+            if step_hook is not None:
+                step_hook(t, X, None)
+            y = preds[:, t]
+            y[:] = self.model.predict(X)
+            if self.clip_min is not None:
+                np.maximum(y, self.clip_min, out=y)
+            if step_hook is not None:
+                step_hook(t, X, y)
+            if keep_features:
+                feats[:, t, :] = X
+
+            buf[:, head] = y
+            buf[:, head + cap] = y
+            head = (head + 1) % cap
+
+        if keep_features:
+            return preds, feats
+        return preds
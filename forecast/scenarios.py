@@ -0,0 +1,159 @@
+"""What-if scenarios evaluated as one batched recursive forecast.
+
+A scenario is a list of multiplicative shocks; every shock is a dict::
+
+    {"island": "Lanzarote", "start": "2025-11-01", "end": "2026-03-01",
+     "factor": 1.05, "on": "target"}
+
+``island`` may be omitted (all islands) and ``end`` defaults to ``start``.
+``on="target"`` (default) scales the passengers of those months: observed
+months are edited before forecasting, forecast months are scaled *before*
+they are fed back as lags, so the shock carries over to later months.
+``on="lags"`` only scales what the model sees as lagged/rolling inputs when
+it forecasts those months (a distorted signal, not a change in traffic).
+
+Every scenario x island is one batch row, so hundreds of scenarios cost one
+larger model call per month. The result is a tidy table with the baseline
+and the difference for each scenario::
+
+    python -m forecast.scenarios --scenarios shocks.csv --model xgb --out scenarios.csv
+
+``shocks.csv`` has one shock per row: ``scenario, island, start, end, factor, on``.
+"""
+
+import numpy as np
+import pandas as pd
+
+BASELINE = "baseline"
+SHOCK_TARGETS = ("target", "lags")
+
+
+def load_scenarios(path) -> dict:
+    """Scenario definitions from a CSV (one shock per row) as ``{name: [shock, ...]}``."""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df = df.astype(object).where(df.notna(), None)
+    scenarios = {}
+    for rec in df.to_dict(orient="records"):
+        name = str(rec.pop("scenario"))
+        scenarios.setdefault(name, []).append(rec)
+    return scenarios
+
+
+def shock_matrices(scenarios: dict, islands, hist_dates, future_dates):
+    """Per batch row factors of every scenario (the baseline first).
+
+    Returns ``names`` and three factor matrices, rows scenario-major
+    (scenario 0: islands 0..k, scenario 1: ...): on the history
+    ``(rows, n_hist)``, on the predictions ``(rows, horizon)`` and on the
+    lag inputs ``(rows, horizon)``.
+    """
+    islands = list(islands)
+    hist_dates = pd.DatetimeIndex(hist_dates)
+    future_dates = pd.DatetimeIndex(future_dates)
+    names = [BASELINE] + [name for name in scenarios if name != BASELINE]
+    n_s, n_i = len(names), len(islands)
+    hist_f = np.ones((n_s, n_i, len(hist_dates)))
+    target_f = np.ones((n_s, n_i, len(future_dates)))
+    lag_f = np.ones((n_s, n_i, len(future_dates)))
+
+    for s, name in enumerate(names[1:], start=1):
+        for shock in scenarios[name]:
+            island = shock.get("island")
+            if island is None:
+                rows = np.arange(n_i)
+            elif island in islands:
+                rows = [islands.index(island)]
+            else:
+                raise ValueError(f"Scenario '{name}': unknown island '{island}'")
+            on = shock.get("on") or "target"
+            if on not in SHOCK_TARGETS:
+                raise ValueError(f"Scenario '{name}': 'on' must be one of {SHOCK_TARGETS}, not '{on}'")
+            start = pd.Timestamp(shock["start"])
+            end = pd.Timestamp(shock.get("end") or start)
+            factor = float(shock["factor"])
+
+            in_future = (future_dates >= start) & (future_dates <= end)
+            if on == "target":
+                in_hist = (hist_dates >= start) & (hist_dates <= end)
+                hist_f[s][np.ix_(rows, in_hist)] *= factor
+                target_f[s][np.ix_(rows, in_future)] *= factor
+            else:
+                lag_f[s][np.ix_(rows, in_future)] *= factor
+
+    flat = lambda a: a.reshape(n_s * n_i, -1)
+    return names, flat(hist_f), flat(target_f), flat(lag_f)
+
+
+def scenario_hook(lag_cols, target_f, lag_f):
+    """``step_hook`` for :class:`~forecast.recursive.RecursiveForecaster` applying the shocks."""
+    def hook(t, X, y):
+        if y is None:
+            X[:, lag_cols] *= lag_f[:, t, None]
+        else:
+            y *= target_f[:, t]
+    return hook
+
+
+def scenario_table(names, islands, future_dates, preds) -> pd.DataFrame:
+    """Tidy forecast of every scenario with the baseline and the difference to it."""
+    future_dates = pd.DatetimeIndex(future_dates)
+    n_s, n_i, horizon = len(names), len(islands), len(future_dates)
+    preds = np.asarray(preds, dtype=float).reshape(n_s, n_i, horizon)
+    baseline = np.broadcast_to(preds[0], preds.shape)
+    out = pd.DataFrame({
+        "scenario": np.repeat(names, n_i * horizon),
+        "Isla": np.tile(np.repeat(islands, horizon), n_s),
+        "Fecha": np.tile(future_dates, n_s * n_i),
+        "Pasajeros": preds.reshape(-1),
+        "baseline": baseline.reshape(-1),
+    })
+    out["delta"] = out["Pasajeros"] - out["baseline"]
+    out["delta_pct"] = out["delta"] / out["baseline"] * 100
+    return out
+
+
+def scenario_summary(table: pd.DataFrame) -> pd.DataFrame:
+    """Total passengers over the horizon per scenario and island, vs. the baseline."""
+    out = table.groupby(["scenario", "Isla"], sort=False).agg(
+        Pasajeros=("Pasajeros", "sum"), baseline=("baseline", "sum")).reset_index()
+    out["delta"] = out["Pasajeros"] - out["baseline"]
+    out["delta_pct"] = out["delta"] / out["baseline"] * 100
+    return out
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Batched what-if forecasts")
+    parser.add_argument("--scenarios", required=True, help="CSV: scenario,island,start,end,factor,on")
+    parser.add_argument("--model", choices=("xgb", "lstm"), default="xgb")
+    parser.add_argument("--horizon-end", default="2026-12-01")
+    parser.add_argument("--out", default=None, help="write the tidy table to this CSV")
+    args = parser.parse_args()
+
+    scenarios = load_scenarios(args.scenarios)
+    t0 = time.perf_counter()
+    if args.model == "xgb":
+        import model_final_xgb as xgb_script
+
+        df_all = xgb_script.load_all_islands()
+        if os.path.exists("models/xgb_islands.pkl"):
+            model = joblib.load("models/xgb_islands.pkl")
+        else:
+            model = xgb_script.build_pooled_model().fit(df_all[xgb_script.FEATURES].values,
+                                                 df_all[xgb_script.TARGET_COL].values)
+        table = xgb_script.forecast_scenarios(model, df_all, scenarios, args.horizon_end)
+    else:
+        import model_final_lstm as lstm_script
+
+        model, scaler_y = lstm_script.load_artifacts()
+        df_total = pd.read_csv("result_total.csv", encoding="utf-8-sig")
+        table = lstm_script.forecast_scenarios(model, scaler_y, df_total, scenarios, args.horizon_end)
+    print(f"{len(scenarios)} scenarios in {time.perf_counter() - t0:.1f} s")
+    print(scenario_summary(table).to_string(index=False))
+    if args.out:
+        table.to_csv(args.out, index=False, encoding="utf-8-sig")
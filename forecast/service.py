@@ -0,0 +1,416 @@
+"""Long-lived local forecast service.
+
+Keeps the fitted XGB pipeline and the LSTM model (with its compiled stepper)
+warm in memory and answers forecast requests for any island and horizon
+without paying interpreter / library start-up or retraining. Artifacts in
+``models/`` and the input tables are watched by modification time and
+reloaded on the next request after they change. Results are memoized in a
+``ForecastCache`` keyed by the data and artifact hashes, so repeated requests
+(and other processes sharing ``.cache/forecast``) do not recompute them.
+
+Run it as a small HTTP service (offline, localhost only)::
+
+    python -m forecast.service --port 8765
+
+    GET  /health
+    GET  /forecast?model=xgb&island=Tenerife&horizon=24
+    POST /reload
+
+With ``read_only`` (``--read-only``) the service never fits or writes model
+artifacts: a missing or outdated artifact is an error for that model, and
+training stays with the agent and the ``model_final_*.py`` scripts.
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from forecast.cache import ForecastCache, artifact_hash, cache_key, data_hash
+from forecast.features import year_base
+from forecast.intervals import N_PATHS, band_columns, simulate_bands
+from forecast.islands import ISLAND_FORECAST_FILES, forecast_table, island_matrix
+from forecast.recursive import XGB_FEATURES, LevelScaledRegressor, RecursiveForecaster, future_months
+
+MODELS_DIR = "models"
+XGB_ARTIFACT = "xgb_islands.pkl"
+XGB_TRAIN_META = "xgb_islands.json"          # trained_through / warm_starts of the artifact
+XGB_TRAIN_LOG = "xgb_training_log.csv"       # one row per retrain: mode, wall time, MAPE
+LSTM_ARTIFACT = "lstm_best.h5"
+SCALER_ARTIFACT = "scaler_y.pkl"
+FEATURES_CSV = "result_total_with_lags_coded.csv"
+TOTAL_CSV = "result_total.csv"
+HORIZON_END = "2026-12-01"     # same horizon as model_final_*.py
+DEFAULT_HORIZON = 15
+DEFAULT_PORT = 8765
+MODELS = ("xgb", "lstm")
+
+
+def _atomic_dump(obj, path):
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class ForecastService:
+    """Warm models + island histories, reloaded when their files change.
+
+    ``forecast`` and ``reload_if_changed`` are thread-safe; the HTTP handler
+    shares one instance between request threads. A ``read_only`` service
+    only loads the artifacts in ``models/``; it never fits or saves a model.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, features_csv=FEATURES_CSV, total_csv=TOTAL_CSV,
+                 models=MODELS, cache=None, n_paths=N_PATHS, read_only=False):
+        self.models_dir = Path(models_dir)
+        self.features_csv = features_csv
+        self.total_csv = total_csv
+        self.models = tuple(models)
+        self.cache = ForecastCache() if cache is None else cache
+        self.n_paths = int(n_paths)     # simulated paths of the P10/P90 bands (0: point only)
+        self.read_only = bool(read_only)
+        self._lock = threading.RLock()
+        self._mtimes = {}
+        self._xgb = None
+        self._lstm = None
+
+    # ---------------------------------------------------------- loading
+    def _watched(self):
+        paths = {"features": self.features_csv, "total": self.total_csv}
+        if "xgb" in self.models:
+            paths["xgb"] = self.models_dir / XGB_ARTIFACT
+        if "lstm" in self.models:
+            paths["lstm"] = self.models_dir / LSTM_ARTIFACT
+            paths["scaler"] = self.models_dir / SCALER_ARTIFACT
+        return paths
+
+    def _load_xgb(self):
+        import model_final_xgb as xgb_script
+
+        df_all = xgb_script.load_all_islands(self.features_csv)
+        artifact = self.models_dir / XGB_ARTIFACT
+        model = joblib.load(artifact) if artifact.exists() else None
+        if not isinstance(model, LevelScaledRegressor):
+            # missing, or saved before the pooled model was level-scaled
+            if self.read_only:
+                raise FileNotFoundError(f"{artifact} is missing or outdated; run the agent with "
+                                        f"RUN_RETRAIN=1 or model_final_xgb.py")
+            model = self._fit_xgb(df_all)
+        islands, dates, history = island_matrix(df_all, "Pasajeros")
+        self._xgb = {
+            "script": xgb_script, "forecaster": RecursiveForecaster(model, XGB_FEATURES),
+            "islands": islands, "dates": dates, "history": history,
+            "base_year": year_base(df_all),
+            "data_hash": data_hash(islands, dates, history),
+            "artifact_hash": artifact_hash([artifact]),
+        }
+
+    def _fit_xgb(self, df_all):
+        import model_final_xgb as xgb_script
+
+        model = xgb_script.build_pooled_model()
+        model.fit(df_all[XGB_FEATURES].values, df_all["Pasajeros"].values)
+        self._save_xgb(model, df_all, warm_starts=0)
+        return model
+
+    def _save_xgb(self, model, df_all, warm_starts):
+        """Persist the XGB artifact and its training metadata; returns the metadata."""
+        import model_final_xgb as xgb_script
+
+        self.models_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_dump(model, self.models_dir / XGB_ARTIFACT)
+        meta = {
+            "trained_through": df_all["Fecha"].max().strftime("%Y-%m-%d"),
+            "warm_starts": warm_starts,
+            "n_trees": xgb_script.xgb_pipeline(model).named_steps["model"].get_booster().num_boosted_rounds(),
+        }
+        (self.models_dir / XGB_TRAIN_META).write_text(json.dumps(meta, indent=1), encoding="utf-8")
+        return meta
+
+    def _load_lstm(self):
+        import model_final_lstm as lstm_script
+        from forecast.lstm_stepper import LSTMStepper
+
+        artifacts = [self.models_dir / LSTM_ARTIFACT, self.models_dir / SCALER_ARTIFACT]
+        model, scaler_y = lstm_script.load_artifacts(*artifacts)
+        total = pd.read_csv(self.total_csv, encoding="utf-8-sig")
+        total["Fecha"] = pd.to_datetime(total["Fecha"])
+        stepper = LSTMStepper(model, lstm_script.WIN, len(lstm_script.FEAT_COLS))
+        stepper.warmup(batch=total["Isla"].nunique())
+        self._lstm = {
+            "script": lstm_script, "model": model, "scaler": scaler_y, "stepper": stepper,
+            "total": total,
+            "data_hash": data_hash(*island_matrix(total, "Pasajeros")),
+            "artifact_hash": artifact_hash(artifacts),
+        }
+
+    def reload_if_changed(self) -> bool:
+        """Reload whatever depends on a file whose mtime changed; True if anything was reloaded."""
+        with self._lock:
+            current = {key: _mtime(path) for key, path in self._watched().items()}
+            changed = {key for key, m in current.items() if self._mtimes.get(key, -1) != m}
+            if not changed:
+                return False
+            if "xgb" in self.models and (self._xgb is None or changed & {"xgb", "features", "total"}):
+                self._load_xgb()
+            if "lstm" in self.models and (self._lstm is None or changed & {"lstm", "scaler", "total"}):
+                self._load_lstm()
+            # an XGB fit on first load writes the artifact; record the mtimes after loading
+            self._mtimes = {key: _mtime(path) for key, path in self._watched().items()}
+            return True
+
+    # ---------------------------------------------------------- forecasting
+    def last_date(self, model="xgb"):
+        self.reload_if_changed()
+        if model == "xgb":
+            return self._xgb["dates"][-1]
+        return self._lstm["total"]["Fecha"].max()
+
+    def default_horizon(self, model="xgb", horizon_end=HORIZON_END) -> int:
+        """Months up to ``horizon_end`` (as the training scripts), or ``DEFAULT_HORIZON`` past it."""
+        return len(future_months(self.last_date(model), horizon_end)) or DEFAULT_HORIZON
+
+    def forecast_all(self, model="xgb", horizon=DEFAULT_HORIZON) -> pd.DataFrame:
+        """Consolidated History + Forecast table for every island, ``horizon`` months ahead."""
+        if model not in self.models:
+            raise ValueError(f"Unknown model '{model}' (available: {', '.join(self.models)})")
+        with self._lock:
+            self.reload_if_changed()
+            if model == "xgb":
+                st = self._xgb
+                future_dates = pd.date_range(st["dates"][-1], periods=int(horizon) + 1, freq="MS")[1:]
+                month_idx0 = np.sum(~np.isnan(st["history"]), axis=1)
+                preds = st["forecaster"].forecast(st["history"], future_dates,
+                                                  base_year=st["base_year"], month_idx0=month_idx0)
+                bands = None
+                if self.n_paths:
+                    if "residuals" not in st:
+                        st["residuals"] = st["script"].island_residuals(self.total_csv)
+                    residuals = st["residuals"].reindex(st["islands"]).to_numpy(dtype=float)
+                    bands = simulate_bands(st["forecaster"], st["history"], future_dates, st["base_year"],
+                                           month_idx0, residuals, self.n_paths, point=preds)
+                return forecast_table(st["islands"], st["dates"], st["history"], future_dates, preds, bands)
+
+            st = self._lstm
+            last = st["total"]["Fecha"].max()
+            horizon_end = last + pd.DateOffset(months=int(horizon))
+            return st["script"].forecast_all_islands(st["model"], st["scaler"], st["total"],
+                                                     horizon_end=horizon_end, stepper=st["stepper"],
+                                                     n_paths=self.n_paths)
+
+    def forecast(self, model="xgb", island=None, horizon=DEFAULT_HORIZON) -> pd.DataFrame:
+        """Forecast table of one island (or all islands when ``island`` is None).
+
+        Served from the cache when the same data and artifacts were already
+        forecast; a miss runs every island in one batched pass and caches the
+        full table plus one entry per island.
+        """
+        if model not in self.models:
+            raise ValueError(f"Unknown model '{model}' (available: {', '.join(self.models)})")
+        horizon = int(horizon)
+        with self._lock:
+            self.reload_if_changed()
+            st = self._xgb if model == "xgb" else self._lstm
+            key = lambda name: cache_key(model, name, horizon, st["data_hash"], st["artifact_hash"],
+                                         f"paths={self.n_paths}|{','.join(band_columns())}")
+
+            table = self.cache.get(key(island))
+            if table is not None:
+                return table
+            table = self.cache.get(key(None))
+            if table is None:
+                table = self.forecast_all(model, horizon)
+                self.cache.put(key(None), table)
+                for name, part in table.groupby("Isla", sort=False, observed=True):
+                    self.cache.put(key(name), part)
+            if island is not None:
+                table = table[table["Isla"] == island].reset_index(drop=True)
+                if table.empty:
+                    raise KeyError(f"Unknown island '{island}'")
+            return table
+
+    # ---------------------------------------------------------- maintenance
+    def _load_train_meta(self):
+        path = self.models_dir / XGB_TRAIN_META
+        if path.exists():
+            return json.loads(path.read_text(encoding="utf-8"))
+        return {}
+
+    def _log_training(self, record):
+        log = self.models_dir / XGB_TRAIN_LOG
+        pd.DataFrame([record]).to_csv(log, mode="a", header=not log.exists(), index=False)
+
+    def retrain(self, mode="auto"):
+        """Update the XGB pipeline on the current feature table and persist it.
+
+        ``mode`` is ``"full"`` (fit from scratch), ``"warm"`` (continue
+        boosting the saved model with ``WARM_START_TREES`` extra trees) or
+        ``"none"`` (keep the model, only refresh predictions). ``"auto"``
+        warm-starts when there are new months and falls back to a full fit
+        for the first model or after ``FULL_RETRAIN_EVERY`` warm starts.
+
+        Every run is appended to ``models/xgb_training_log.csv`` with its
+        wall time and the MAPE of the previous model on the new months (one
+        step ahead) and of the updated model on them. The LSTM is not
+        retrained here (as in ``model_final_lstm.py``, it is loaded from
+        ``models/``); it is reloaded if its files changed. Returns the mode used.
+        """
+        if self.read_only:
+            raise RuntimeError("read-only ForecastService: retrain from the agent or model_final_xgb.py")
+        with self._lock:
+            if "xgb" not in self.models:
+                self.reload_if_changed()
+                return "none"
+            import model_final_xgb as xgb_script
+
+            df_all = xgb_script.load_all_islands(self.features_csv)
+            artifact = self.models_dir / XGB_ARTIFACT
+            meta = self._load_train_meta() if artifact.exists() else {}
+            trained_through = pd.Timestamp(meta["trained_through"]) if meta.get("trained_through") else None
+            new_rows = df_all if trained_through is None else df_all[df_all["Fecha"] > trained_through]
+
+            if mode == "auto":
+                if trained_through is None:
+                    mode = "full"
+                elif new_rows.empty:
+                    mode = "none"
+                elif meta.get("warm_starts", 0) >= xgb_script.FULL_RETRAIN_EVERY:
+                    mode = "full"
+                else:
+                    mode = "warm"
+            if mode == "warm" and trained_through is None:
+                mode = "full"
+
+            if mode != "none":
+                X, y = df_all[XGB_FEATURES].values, df_all["Pasajeros"].values
+                previous = joblib.load(artifact) if artifact.exists() else None
+                mape_before = None
+                if previous is not None and not new_rows.empty:
+                    mape_before = xgb_script.mape(new_rows["Pasajeros"], previous.predict(new_rows[XGB_FEATURES].values))
+
+                if mode == "warm" and not isinstance(previous, LevelScaledRegressor):
+                    mode = "full"       # artifact saved before the pooled model was level-scaled
+                t0 = time.perf_counter()
+                if mode == "warm":
+                    model = xgb_script.warm_start_model(previous, X, y)
+                else:
+                    model = xgb_script.build_pooled_model().fit(X, y)
+                wall_time = time.perf_counter() - t0
+
+                mape_after = None
+                if not new_rows.empty:
+                    mape_after = xgb_script.mape(new_rows["Pasajeros"], model.predict(new_rows[XGB_FEATURES].values))
+                warm_starts = meta.get("warm_starts", 0) + 1 if mode == "warm" else 0
+                meta = self._save_xgb(model, df_all, warm_starts)
+                self._log_training({
+                    "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+                    "mode": mode,
+                    "trained_through": meta["trained_through"],
+                    "rows": len(df_all),
+                    "new_rows": len(new_rows),
+                    "n_trees": meta["n_trees"],
+                    "wall_time_s": round(wall_time, 3),
+                    "mape_new_before": mape_before,
+                    "mape_new_after": mape_after,
+                })
+            self.reload_if_changed()
+            return mode
+
+    def write_tables(self, horizon_end=HORIZON_END):
+        """Write the consolidated ``forecast_islands_<model>.csv`` tables.
+
+        Forecasts run up to ``horizon_end`` (as the training scripts do), or
+        ``DEFAULT_HORIZON`` months when the data already reaches that date.
+        """
+        if self.read_only:
+            raise RuntimeError("read-only ForecastService: the forecast tables are written by the agent")
+        written = []
+        for model in self.models:
+            table = self.forecast(model, None, self.default_horizon(model, horizon_end))
+            path = ISLAND_FORECAST_FILES[model]
+            tmp = Path(path).with_name(f".{Path(path).name}.{os.getpid()}.tmp")
+            table.to_csv(tmp, index=False, encoding="utf-8-sig")
+            os.replace(tmp, path)
+            written.append(path)
+        return written
+
+
+# -------------------------------------------------------------- HTTP stand-in
+def make_handler(service: ForecastService):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == "/health":
+                self._reply(200, {"status": "ok", "models": list(service.models)})
+                return
+            if url.path != "/forecast":
+                self._reply(404, {"error": f"unknown path {url.path}"})
+                return
+            try:
+                table = service.forecast(query.get("model", "xgb"), query.get("island"),
+                                         int(query.get("horizon", DEFAULT_HORIZON)))
+            except (KeyError, ValueError) as e:
+                self._reply(400, {"error": e.args[0] if e.args else str(e)})
+                return
+            table = table.assign(Fecha=table["Fecha"].dt.strftime("%Y-%m-%d"))
+            self._reply(200, table.to_dict(orient="records"))
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/reload":
+                self._reply(404, {"error": "unknown path"})
+                return
+            self._reply(200, {"reloaded": service.reload_if_changed()})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(service: ForecastService, host="127.0.0.1", port=DEFAULT_PORT):
+    """Serve ``service`` over HTTP until interrupted."""
+    service.reload_if_changed()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Forecast service on http://{host}:{port} (models: {', '.join(service.models)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local forecast service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--models", default=",".join(MODELS), help="comma-separated: xgb,lstm")
+    parser.add_argument("--read-only", action="store_true", help="never fit or write model artifacts")
+    args = parser.parse_args()
+    serve(ForecastService(models=args.models.split(","), read_only=args.read_only), args.host, args.port)
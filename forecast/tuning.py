@@ -0,0 +1,276 @@
+"""Hyperparameter search for the final models on the rolling-origin backtest.
+
+Every candidate configuration is evaluated at several forecast origins
+(``backtest.default_cutoffs``): the model is fitted on the months up to the
+cutoff, forecasts the next ``horizon`` months recursively for all islands at
+once, and is scored per island with MAE / RMSE / MAPE. XGB configs run
+through ``backtest.run_backtest`` itself, so tuning and backtest scores are
+computed on the same features and origins.
+
+Each (model, config, cutoff) task runs in a process pool with a per-worker
+thread cap, and its result is cached on disk under a hash of the model,
+config, cutoff, horizon and input data, plus ``EVALUATOR_VERSION``. An
+interrupted search resumes from the cache, and re-running after new data
+only recomputes what changed. The cache cannot see code changes: bump
+``EVALUATOR_VERSION`` whenever an evaluator or a model factory it uses
+(e.g. ``build_pooled_model``) changes, so stale fold results are not reused::
+
+    python -m forecast.tuning --models xgb,lstm --workers 4 --threads 1
+"""
+
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from data.parse_cache import file_digest
+from forecast.backtest import default_cutoffs, run_backtest
+from forecast.islands import island_matrix
+
+CACHE_DIR = ".cache/tuning"
+RESULTS_CSV = "tuning_results.csv"
+TOTAL_CSV = "result_total.csv"
+HORIZON = 12
+N_CUTOFFS = 6
+CUTOFF_STEP = 3            # months between consecutive origins
+THREADS_PER_WORKER = 1
+SEED = 42
+# part of every cache key; bump when evaluate_* or the model factories change
+# (2: backtest-engine evaluators, level-scaled pooled XGB)
+EVALUATOR_VERSION = 2
+
+XGB_GRID = {
+    "n_estimators": [400, 800],
+    "learning_rate": [0.03, 0.05],
+    "max_depth": [3, 5],
+}
+LSTM_GRID = {
+    "units": [32, 64],
+    "epochs": [150],
+    "batch_size": [32],
+}
+GRIDS = {"xgb": XGB_GRID, "lstm": LSTM_GRID}
+
+
+def expand_grid(grid: dict) -> list:
+    """All combinations of a ``{param: [values]}`` grid, as a list of dicts."""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def task_key(model: str, config: dict, cutoff, horizon: int, data_digest: str) -> str:
+    """Cache key of one (model, config, cutoff) evaluation."""
+    payload = json.dumps({
+        "model": model, "config": config, "cutoff": pd.Timestamp(cutoff).strftime("%Y-%m-%d"),
+        "horizon": horizon, "data": data_digest, "version": EVALUATOR_VERSION,
+    }, sort_keys=True)
+    return f"{model}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:20]}"
+
+
+def error_metrics(y_true, y_pred) -> dict:
+    y_true = np.asarray(y_true, dtype=float)
+    err = np.asarray(y_pred, dtype=float) - y_true
+    return {
+        "mae": float(np.mean(np.abs(err))),
+        "rmse": float(np.sqrt(np.mean(err ** 2))),
+        "mape": float(np.mean(np.abs(err) / np.abs(y_true)) * 100),
+    }
+
+
+def _score(results: pd.DataFrame):
+    """Per-island metrics of a ``run_backtest``-style table (``Isla``, ``actual``, ``pred``)."""
+    res = results.dropna(subset=["actual"])
+    return [{"Isla": str(isla), **error_metrics(g["actual"], g["pred"])}
+            for isla, g in res.groupby("Isla", sort=True, observed=True)]
+
+
+def _read_total(total_csv=TOTAL_CSV):
+    df = pd.read_csv(total_csv, encoding="utf-8-sig")
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+    return df
+
+
+# ------------------------------------------------------------------ workers
+def _init_worker(threads):
+    """Cap the native thread pools of a worker before any model is built."""
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+
+
+def evaluate_xgb(config, cutoff, horizon=HORIZON, threads=THREADS_PER_WORKER, total_csv=TOTAL_CSV):
+    """Backtest the global XGB pipeline with ``config`` at ``cutoff`` and score it per island."""
+    import model_final_xgb as xgb_script
+
+    def factory():
+        model = xgb_script.build_pooled_model()
+        return model.set_params(**{f"regressor__regressor__model__{k}": v for k, v in config.items()},
+                                regressor__regressor__model__n_jobs=threads)
+
+    results = run_backtest(_read_total(total_csv), factory, cutoffs=[pd.Timestamp(cutoff)], horizon=horizon)
+    return _score(results)
+
+
+def build_lstm(input_shape, units=32):
+    """Same architecture as the selected model (LSTM -> Dense(units/2) -> Dense(1))."""
+    from tensorflow.keras import layers, models
+
+    inp = layers.Input(shape=input_shape)
+    x = layers.LSTM(units)(inp)
+    x = layers.Dense(units // 2, activation="relu")(x)
+    out = layers.Dense(1)(x)
+    m = models.Model(inp, out, name=f"LSTM_{units}")
+    m.compile(optimizer="adam", loss="mse")
+    return m
+
+
+def evaluate_lstm(config, cutoff, horizon=HORIZON, threads=THREADS_PER_WORKER, total_csv=TOTAL_CSV,
+                  val_frac=0.15):
+    """Train one LSTM on the sequences of every island up to ``cutoff`` and score it.
+
+    Each island is standardized with its own statistics (training months
+    only), so all series share the model's input scale.
+    """
+    import tensorflow as tf
+    from tensorflow.keras import callbacks
+
+    import model_final_lstm as lstm_script
+    from forecast.lstm_stepper import LSTMStepper
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    tf.keras.utils.set_random_seed(SEED)
+
+    win = lstm_script.WIN
+    islands, dates, history = island_matrix(_read_total(total_csv), "Pasajeros")
+    origin = dates.get_loc(pd.Timestamp(cutoff)) + 1
+    past = history[:, :origin]
+    mean = np.nanmean(past, axis=1, keepdims=True)
+    scale = np.nanstd(past, axis=1, keepdims=True)
+    scaled = (past - mean) / scale
+
+    cal = lstm_script.calendar_features(dates, dates.year.min())
+    feats = np.concatenate([scaled[:, :, None], np.broadcast_to(cal[:origin], scaled.shape + (3,))], axis=2)
+
+    # (month, island) order, so the validation split takes the latest months of every island
+    windows = sliding_window_view(feats[:, :-1], win, axis=1).transpose(1, 0, 3, 2)   # (n, isl, win, f)
+    X = windows.reshape(-1, win, feats.shape[2])
+    y = scaled[:, win:].T.reshape(-1)
+    keep = ~(np.isnan(X).any(axis=(1, 2)) | np.isnan(y))
+    X, y = X[keep], y[keep]
+
+    model = build_lstm((win, feats.shape[2]), units=config["units"])
+    cb = [
+        callbacks.EarlyStopping(patience=15, restore_best_weights=True),
+        callbacks.ReduceLROnPlateau(factor=0.5, patience=8),
+    ]
+    model.fit(X, y, validation_split=val_frac, epochs=config["epochs"], batch_size=config["batch_size"],
+              shuffle=False, verbose=0, callbacks=cb)
+
+    stepper = LSTMStepper(model, win, feats.shape[2], jit_compile=False)
+    preds_scaled = stepper.forecast(feats[:, -win:], cal[origin:origin + horizon])
+    preds = preds_scaled * scale + mean
+    actual = history[:, origin:origin + horizon]
+    return _score(pd.DataFrame({
+        "Isla": np.repeat(islands, actual.shape[1]),
+        "actual": actual.reshape(-1),
+        "pred": preds.reshape(-1),
+    }))
+
+
+EVALUATORS = {"xgb": evaluate_xgb, "lstm": evaluate_lstm}
+
+
+def _run_task(model, config, cutoff, horizon, threads, key, cache_dir, total_csv=TOTAL_CSV):
+    """Worker entry point: evaluate one task and store it in the cache."""
+    rows = EVALUATORS[model](config, cutoff, horizon=horizon, threads=threads, total_csv=total_csv)
+    entry = {"model": model, "config": config, "cutoff": pd.Timestamp(cutoff).strftime("%Y-%m-%d"), "rows": rows}
+    path = Path(cache_dir) / f"{key}.json"
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(entry), encoding="utf-8")
+    os.replace(tmp, path)
+    return entry
+
+
+def _entries_frame(entries) -> pd.DataFrame:
+    records = []
+    for e in entries:
+        for row in e["rows"]:
+            records.append({"model": e["model"], "config": json.dumps(e["config"], sort_keys=True),
+                            "cutoff": e["cutoff"], **row})
+    return pd.DataFrame(records)
+
+
+# ------------------------------------------------------------------ driver
+def search(models=("xgb",), grids=None, workers=None, threads=THREADS_PER_WORKER, n_cutoffs=N_CUTOFFS,
+           step=CUTOFF_STEP, horizon=HORIZON, cache_dir=CACHE_DIR, resume=True,
+           total_csv=TOTAL_CSV) -> pd.DataFrame:
+    """Evaluate every config of every model at every origin; returns one row per island/task.
+
+    Tasks already in the cache are not recomputed (unless ``resume`` is
+    False). New results are cached as soon as each task finishes.
+    """
+    grids = grids or GRIDS
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    data_digest = file_digest(total_csv)
+    dates = island_matrix(_read_total(total_csv), "Pasajeros")[1]
+    cutoffs = default_cutoffs(dates, n_cutoffs, horizon, step=step)
+
+    entries, pending = [], []
+    for model in models:
+        for config in expand_grid(grids[model]):
+            for cutoff in cutoffs:
+                key = task_key(model, config, cutoff, horizon, data_digest)
+                cached = Path(cache_dir) / f"{key}.json"
+                if resume and cached.exists():
+                    entries.append(json.loads(cached.read_text(encoding="utf-8")))
+                else:
+                    pending.append((model, config, cutoff, horizon, threads, key, cache_dir, total_csv))
+
+    print(f"Tasks: {len(entries) + len(pending)} ({len(entries)} cached, {len(pending)} to run)")
+    if pending:
+        workers = workers or max(1, (os.cpu_count() or 1) // max(threads, 1))
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = [pool.submit(_run_task, *task) for task in pending]
+            for done, fut in enumerate(as_completed(futures), start=1):
+                entry = fut.result()
+                entries.append(entry)
+                print(f"  [{done}/{len(pending)}] {entry['model']} {entry['config']} @ {entry['cutoff']}")
+
+    return _entries_frame(entries)
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean MAE / RMSE / MAPE per (model, config) over origins and islands, best MAPE first."""
+    return (results.groupby(["model", "config"], as_index=False)[["mae", "rmse", "mape"]].mean()
+            .sort_values(["model", "mape"]).reset_index(drop=True))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest / hyperparameter search")
+    parser.add_argument("--models", default="xgb", help="comma-separated: xgb,lstm")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER, help="threads per worker")
+    parser.add_argument("--cutoffs", type=int, default=N_CUTOFFS, help="number of forecast origins")
+    parser.add_argument("--step", type=int, default=CUTOFF_STEP, help="months between origins")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help="months forecast at each origin")
+    parser.add_argument("--no-resume", action="store_true", help="ignore cached fold results")
+    args = parser.parse_args()
+
+    results = search(models=args.models.split(","), workers=args.workers, threads=args.threads,
+                     n_cutoffs=args.cutoffs, step=args.step, horizon=args.horizon, resume=not args.no_resume)
+    results.to_csv(RESULTS_CSV, index=False, encoding="utf-8-sig")
+    print(summarize(results).to_string(index=False))
+    print(f"Saved {RESULTS_CSV}")
@@ -1,7 +1,84 @@
-"""KPI calculation logic (independent from the date slider)."""
+"""KPI calculation logic (independent from the date slider).
+
+``calculate_kpi_table`` computes the KPI record of every island in one
+grouped pass when the data is loaded; the dashboard then only looks the
+selected island up. ``calculate_kpi_full`` is the original per-island
+version and defines the semantics both share.
+"""
 
 import pandas as pd
 
+TOTAL_ORIGIN = "TOTAL PASAJEROS"
+
+
+def _first_per_group(values: pd.Series, keys) -> dict:
+    """First value of every group, in the current row order."""
+    first = values.groupby(keys, sort=False, observed=True).first()
+    return first.to_dict()
+
+
+def calculate_kpi_table(df_full) -> dict:
+    """KPI records (same keys and values as ``calculate_kpi_full``) of every island.
+
+    One pass of grouped aggregations over all rows: last date, TOTAL
+    PASAJEROS per island and month, yearly sums and the best row.
+    """
+    df = df_full[["Isla", "Fecha", "AEROPUERTO_DE_PROCEDENCIA", "Pasajeros", "Año", "Mes_Año"]].copy()
+    df["Fecha"] = pd.to_datetime(df["Fecha"], errors="coerce")
+    df["Isla"] = df["Isla"].astype(str)
+    df = df.sort_values(["Isla", "Fecha"], kind="mergesort")
+
+    origin = df["AEROPUERTO_DE_PROCEDENCIA"].astype(str)
+    is_total = origin.str.upper().to_numpy() == TOTAL_ORIGIN
+    month_key = (df["Fecha"].dt.year * 12 + df["Fecha"].dt.month).to_numpy()
+
+    last_dates = df.groupby("Isla", sort=False)["Fecha"].max()
+    totals = _first_per_group(df.loc[is_total, "Pasajeros"],
+                              [df.loc[is_total, "Isla"], month_key[is_total]])
+    yearly = df.groupby(["Isla", "Año"], sort=True)["Pasajeros"].sum()
+    best = df.loc[df.groupby("Isla", sort=False)["Pasajeros"].idxmax()].set_index("Isla")
+
+    table = {}
+    for island, last_date in last_dates.items():
+        key = last_date.year * 12 + last_date.month
+        last_month_total = totals.get((island, key))
+        prev_month_total = totals.get((island, key - 12))
+
+        if prev_month_total and prev_month_total > 0:
+            yoy_month_pct = ((last_month_total - prev_month_total) / prev_month_total) * 100
+            yoy_month_diff = last_month_total - prev_month_total
+        else:
+            yoy_month_pct = None
+            yoy_month_diff = None
+
+        sums = yearly.loc[island]
+        years = sums.index
+        full_year_n = years[-2] if len(years) >= 3 else None
+        full_year_prev = years[-3] if len(years) >= 3 else None
+        yoy_year_pct = None
+        yoy_year_diff = None
+        if full_year_n and full_year_prev:
+            total_year_n, total_year_prev = sums[full_year_n], sums[full_year_prev]
+            if total_year_prev > 0:
+                yoy_year_pct = ((total_year_n - total_year_prev) / total_year_prev) * 100
+                yoy_year_diff = total_year_n - total_year_prev
+
+        table[island] = {
+            "last_month_label": last_date.strftime("%B %Y"),
+            "last_month_total": last_month_total,
+            "prev_month_total": prev_month_total,
+            "yoy_month_pct": yoy_month_pct,
+            "yoy_month_diff": yoy_month_diff,
+            "full_year_n": full_year_n,
+            "full_year_prev": full_year_prev,
+            "yoy_year_pct": yoy_year_pct,
+            "yoy_year_diff": yoy_year_diff,
+            "best_value": best.at[island, "Pasajeros"],
+            "best_label": best.at[island, "Mes_Año"],
+        }
+    return table
+
+
 def calculate_kpi_full(df_full, selected_island):
     """Calculate YoY KPIs for the selected island.
 
@@ -3,10 +3,9 @@
 import streamlit as st
 import pandas as pd
 
-from data.loader import load_main_dataset, load_forecasts
+from data.loader import load_forecasts, load_cube, load_kpis
 from ui.map import draw_island_map
 from ui.images import show_island_image, show_image_license
-from kpi.kpi_calculator import calculate_kpi_full
 from ui.tabs import display_tabs
 
 
@@ -20,7 +19,7 @@ st.title("🗺️ Análisis de pasajeros aéreos en las Islas Canarias")
 # --------------------------------------------------
 # Load datasets
 # --------------------------------------------------
-dfp = load_main_dataset()
+cube = load_cube()
 df_xgb, df_lstm = load_forecasts()
 
 
@@ -50,7 +49,7 @@ if not selected_island:
 st.markdown("---")
 st.markdown(f"## 📊 KPI — {selected_island}")
 
-kpi = calculate_kpi_full(dfp, selected_island)
+kpi = load_kpis()[selected_island]
 
 c1, c2, c3 = st.columns(3)
 c4, c5 = st.columns(2)
@@ -88,12 +87,6 @@ c5.metric(
 )
 
 
-# --------------------------------------------------
-# dfv BEFORE slider
-# --------------------------------------------------
-dfv = dfp[dfp["Isla"].str.contains(selected_island, case=False, na=False)].copy()
-
-
 # --------------------------------------------------
 # SLIDER → moved inside tabs (ONLY 1–3)
 # --------------------------------------------------
@@ -101,6 +94,6 @@ dfv = dfp[dfp["Isla"].str.contains(selected_island, case=False, na=False)].copy(
 
 
 # --------------------------------------------------
-# TABS (slider lives INSIDE display_tabs)
+# TABS (shared date slider lives INSIDE display_tabs, only the active tab renders)
 # --------------------------------------------------
-display_tabs(dfv, dfp, df_xgb, df_lstm, selected_island)
+display_tabs(cube, df_xgb, df_lstm, selected_island)
@@ -5,8 +5,15 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import joblib
+from sklearn.base import clone
 from tensorflow.keras.models import load_model
 
+from forecast.intervals import N_PATHS, RESIDUAL_MONTHS, bootstrap_factors, log_residuals, path_quantiles
+from forecast.islands import ISLAND_FORECAST_FILES, forecast_table, island_matrix
+from forecast.lstm_stepper import LSTMStepper
+from forecast.recursive import future_months
+from forecast.scenarios import scenario_table, shock_matrices
+
 # --------------------------------------------------------------
 # 1️⃣ PARÁMETROS
 # --------------------------------------------------------------
@@ -15,109 +22,261 @@ TARGET_COL = "Pasajeros"
 DATE_COL = "Fecha"
 HORIZON_END = "2026-12-01"
 WIN = 12  # número de meses en la memoria (ventana de secuencia)
+FEAT_COLS = ["_x_pasaj", "month_sin", "month_cos", "year_norm"]
+
 
 # --------------------------------------------------------------
 # 2️⃣ CARGA DE DATOS Y DEL MODELO
 # --------------------------------------------------------------
-df = pd.read_csv("result_total.csv", encoding="utf-8-sig")
-df = df[df["Isla"] == ISLAND_NAME].copy()
-df[DATE_COL] = pd.to_datetime(df[DATE_COL])
-df = df.sort_values(DATE_COL).reset_index(drop=True)
+def load_island_history(path="result_total.csv", island=ISLAND_NAME):
+    """Serie mensual de una isla con características de calendario."""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df = df[df["Isla"] == island].copy()
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
+    df = df.sort_values(DATE_COL).reset_index(drop=True)
 
-# Características de calendario
-if "month_sin" not in df.columns or "month_cos" not in df.columns:
-    df["month_sin"] = np.sin(2 * np.pi * df[DATE_COL].dt.month / 12)
-    df["month_cos"] = np.cos(2 * np.pi * df[DATE_COL].dt.month / 12)
+    # Características de calendario
+    if "month_sin" not in df.columns or "month_cos" not in df.columns:
+        df["month_sin"] = np.sin(2 * np.pi * df[DATE_COL].dt.month / 12)
+        df["month_cos"] = np.cos(2 * np.pi * df[DATE_COL].dt.month / 12)
 
-if "year_norm" not in df.columns:
-    base_year = df[DATE_COL].dt.year.min()
-    df["year_norm"] = (df[DATE_COL].dt.year - base_year).astype(float) + 1.0
+    if "year_norm" not in df.columns:
+        base_year = df[DATE_COL].dt.year.min()
+        df["year_norm"] = (df[DATE_COL].dt.year - base_year).astype(float) + 1.0
+    return df
 
-# ✅ Cargar modelo SIN compilación
-model = load_model("models/lstm_best.h5", compile=False)
-scaler_y = joblib.load("models/scaler_y.pkl")
 
-# --------------------------------------------------------------
-# 3️⃣ ESCALADO Y CREACIÓN DE LA SECUENCIA INICIAL
-# --------------------------------------------------------------
-# solo escalamos el target
-y_scaled = scaler_y.transform(df[[TARGET_COL]])
+def load_artifacts(model_path="models/lstm_best.h5", scaler_path="models/scaler_y.pkl"):
+    """Modelo LSTM (✅ SIN compilación) y escalador del objetivo."""
+    model = load_model(model_path, compile=False)
+    scaler_y = joblib.load(scaler_path)
+    return model, scaler_y
 
-# añadimos el target escalado como característica
-df["_x_pasaj"] = y_scaled
-FEAT_COLS = ["_x_pasaj", "month_sin", "month_cos", "year_norm"]
-X_all = df[FEAT_COLS].to_numpy()
 
-# últimos 12 meses (WIN) — memoria secuencial
-seq = X_all[-WIN:].reshape(1, WIN, len(FEAT_COLS))
+def calendar_features(dates, base_year):
+    """``month_sin``, ``month_cos`` y ``year_norm`` de una lista de fechas, en bloque."""
+    dates = pd.DatetimeIndex(dates)
+    month = dates.month.to_numpy(dtype=float)
+    year_norm = (dates.year.to_numpy(dtype=float) - base_year) + 1.0
+    return np.column_stack([np.sin(2 * np.pi * month / 12), np.cos(2 * np.pi * month / 12), year_norm])
+
 
 # --------------------------------------------------------------
-# 4️⃣ GENERACIÓN DE FECHAS FUTURAS
+# 3️⃣ PRONÓSTICO ITERATIVO (una isla)
 # --------------------------------------------------------------
-last_date = df[DATE_COL].max()
-future_dates = pd.period_range(last_date, HORIZON_END, freq="M")[1:].to_timestamp()
+def forecast_frame(model, scaler_y, df, horizon_end=HORIZON_END, island=ISLAND_NAME, stepper=None):
+    """Pronóstico iterativo de una isla; devuelve historia + pronóstico.
 
-df_future = df.copy()
-base_year = df[DATE_COL].dt.year.min()
+    La ventana se actualiza en sitio dentro de ``LSTMStepper`` (paso
+    compilado, sin ``model.predict`` por mes) y el DataFrame se construye
+    una sola vez al final.
+    """
+    # solo escalamos el target y lo añadimos como característica
+    df = df.copy()
+    df["_x_pasaj"] = scaler_y.transform(df[[TARGET_COL]])
+    X_all = df[FEAT_COLS].to_numpy()
 
-print(f"📅 Inicio: {last_date.date()} → Fin: {future_dates[-1].date()}")
-print(f"🧠 Memoria de secuencia: {WIN} meses")
+    last_date = df[DATE_COL].max()
+    future_dates = future_months(last_date, horizon_end)
+    base_year = df[DATE_COL].dt.year.min()
+    cal_future = calendar_features(future_dates, base_year)
 
-# --------------------------------------------------------------
-# 5️⃣ PRONÓSTICO ITERATIVO
-# --------------------------------------------------------------
-for next_date in future_dates:
-    month = next_date.month
-    year = next_date.year
-    month_sin = np.sin(2 * np.pi * month / 12)
-    month_cos = np.cos(2 * np.pi * month / 12)
-    year_norm = (year - base_year) + 1.0
-
-    # predicción en escala normalizada
-    y_scaled_pred = float(model.predict(seq, verbose=0)[0][0])
-    y_pred = float(scaler_y.inverse_transform([[y_scaled_pred]])[0][0])
-
-    # añadir nueva fila
-    df_future = pd.concat([df_future, pd.DataFrame([{
-        "Isla": ISLAND_NAME,
-        DATE_COL: next_date,
+    # últimos 12 meses (WIN) — memoria secuencial
+    stepper = stepper or LSTMStepper(model, WIN, len(FEAT_COLS))
+    y_scaled = stepper.forecast(X_all[-WIN:], cal_future)[0].astype(float)
+    y_pred = scaler_y.inverse_transform(y_scaled.reshape(-1, 1))[:, 0]
+
+    future = pd.DataFrame({
+        "Isla": island,
+        DATE_COL: future_dates,
         TARGET_COL: y_pred,
-        "month_sin": month_sin,
-        "month_cos": month_cos,
-        "year_norm": year_norm,
-        "_x_pasaj": y_scaled_pred
-    }])], ignore_index=True)
+        "month_sin": cal_future[:, 0],
+        "month_cos": cal_future[:, 1],
+        "year_norm": cal_future[:, 2],
+        "_x_pasaj": y_scaled,
+    })
+    df_future = pd.concat([df, future], ignore_index=True)
+    df_future["Phase"] = np.where(df_future[DATE_COL] <= last_date, "History", "Forecast")
+    return df_future
 
-    # actualización de la secuencia — desplazamiento de ventana
-    next_step = np.array([[y_scaled_pred, month_sin, month_cos, year_norm]], dtype=float)
-    seq = np.concatenate([seq[:, 1:, :], next_step.reshape(1, 1, -1)], axis=1)
 
 # --------------------------------------------------------------
-# 6️⃣ MARCAR FASE Y GRÁFICO
+# 4️⃣ PRONÓSTICO DE TODAS LAS ISLAS EN BLOQUE
 # --------------------------------------------------------------
-df_future["Phase"] = np.where(df_future[DATE_COL] <= last_date, "History", "Forecast")
-
-plt.figure(figsize=(10,5))
-plt.plot(df_future[df_future["Phase"]=="History"][DATE_COL],
-         df_future[df_future["Phase"]=="History"][TARGET_COL],
-         label="Historia", color="tab:blue")
-plt.plot(df_future[df_future["Phase"]=="Forecast"][DATE_COL],
-         df_future[df_future["Phase"]=="Forecast"][TARGET_COL],
-         label="Pronóstico LSTM", color="tab:green")
-plt.title(f"✈️ {ISLAND_NAME} — Pronóstico LSTM (12 meses de memoria)")
-plt.xlabel("Fecha")
-plt.ylabel("Número de pasajeros")
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
+def island_scalers(scaler_y, islands, history):
+    """Un escalador por isla.
 
-# --------------------------------------------------------------
-# 7️⃣ GUARDAR RESULTADOS
-# --------------------------------------------------------------
-out_file = "forecast_total_canarias_lstm.csv"
-df_future.to_csv(out_file, index=False, encoding="utf-8-sig")
-print(f"💾 Guardado {out_file}")
+    El modelo se entrenó sobre Total Canarias con ``scaler_y``; cada isla se
+    normaliza con una copia del mismo escalador ajustada a su propia serie,
+    de modo que todas entran al LSTM en la misma escala.
+    """
+    scalers = []
+    for isla, row in zip(islands, history):
+        if isla == ISLAND_NAME:
+            scalers.append(scaler_y)
+        else:
+            values = row[~np.isnan(row)]
+            scalers.append(clone(scaler_y).fit(pd.DataFrame({TARGET_COL: values})))
+    return scalers
+
+
+def island_inputs(scaler_y, df_total, horizon_end=HORIZON_END):
+    """Matriz de historia de las islas, fechas futuras y escala (media, desviación) de cada isla."""
+    df_total = df_total.copy()
+    df_total[DATE_COL] = pd.to_datetime(df_total[DATE_COL])
+    islands, hist_dates, history = island_matrix(df_total, TARGET_COL)
+    if np.isnan(history[:, -WIN:]).any():
+        raise ValueError(f"Cada isla necesita al menos {WIN} meses completos de historia")
+
+    base_year = hist_dates.year.min()
+    scalers = island_scalers(scaler_y, islands, history)
+    mean = np.array([s.mean_[0] for s in scalers])
+    scale = np.array([s.scale_[0] for s in scalers])
+    future_dates = future_months(hist_dates[-1], horizon_end)
+    return islands, hist_dates, history, future_dates, mean, scale, base_year
+
+
+def island_windows(history, hist_dates, mean, scale, base_year):
+    """Ventanas de entrada ``(filas, WIN, features)`` con los últimos ``WIN`` meses de cada fila."""
+    seq = np.empty((len(history), WIN, len(FEAT_COLS)))
+    seq[:, :, 0] = (history[:, -WIN:] - mean[:, None]) / scale[:, None]
+    seq[:, :, 1:] = calendar_features(hist_dates[-WIN:], base_year)[None, :, :]
+    return seq
+
+
+def one_step_residuals(stepper, hist_dates, history, mean, scale, base_year, months=RESIDUAL_MONTHS):
+    """Errores relativos a un paso, ``log(real / pred)``, de los últimos ``months`` meses.
+
+    Devuelve ``(islas, months)``; todas las ventanas van en un único lote. El
+    LSTM no se reentrena aquí, así que en los meses que vio durante el
+    entrenamiento el error es dentro de muestra.
+    """
+    n_islands, n = history.shape
+    months = min(months, n - WIN)
+    targets = np.arange(n - months, n)
+    idx = targets[:, None] - WIN + np.arange(WIN)[None, :]               # (months, WIN)
+    cal = calendar_features(hist_dates, base_year)
+
+    windows = np.empty((months, n_islands, WIN, len(FEAT_COLS)))
+    windows[..., 0] = ((history - mean[:, None]) / scale[:, None])[:, idx].transpose(1, 0, 2)
+    windows[..., 1:] = cal[idx][:, None]
+    pred = stepper.forecast(windows.reshape(-1, WIN, len(FEAT_COLS)), np.zeros((1, len(FEAT_COLS) - 1)))
+    pred = pred[:, 0].astype(float).reshape(months, n_islands) * scale + mean
+    return log_residuals(history[:, targets], pred.T)
+
+
+def forecast_all_islands(model, scaler_y, df_total, horizon_end=HORIZON_END, stepper=None, n_paths=0):
+    """Pronóstico de todas las islas a la vez: un paso compilado por mes
+    sobre un lote ``(islas, WIN, features)``.
+
+    Devuelve la tabla consolidada (``Isla``, ``Fecha``, ``Pasajeros``, ``Phase``).
+    Con ``n_paths`` añade las bandas P10/P90: bootstrap de los errores a
+    un paso de cada isla sobre ``n_paths`` trayectorias, en un solo lote
+    ``(trayectorias × islas, WIN, features)``, ancladas en el pronóstico
+    puntual (P10 <= Pasajeros <= P90).
+    """
+    islands, hist_dates, history, future_dates, mean, scale, base_year = island_inputs(scaler_y, df_total,
+                                                                                       horizon_end)
+    cal_future = calendar_features(future_dates, base_year)
+    seq = island_windows(history, hist_dates, mean, scale, base_year)
+
+    stepper = stepper or LSTMStepper(model, WIN, len(FEAT_COLS))
+    preds_scaled = stepper.forecast(seq, cal_future).astype(float)
+    preds = preds_scaled * scale[:, None] + mean[:, None]
+
+    bands = None
+    if n_paths:
+        residuals = one_step_residuals(stepper, hist_dates, history, mean, scale, base_year)
+        factors = bootstrap_factors(residuals, n_paths, len(future_dates))
+        m, s = np.tile(mean, n_paths), np.tile(scale, n_paths)
+
+        def shock(t, y):
+            # el error se aplica en pasajeros y la trayectoria sigue en la escala del modelo
+            y[:] = ((y * s + m) * factors[:, t] - m) / s
+
+        paths = stepper.forecast(np.tile(seq, (n_paths, 1, 1)), cal_future, step_hook=shock)
+        bands = path_quantiles(paths * s[:, None] + m[:, None], n_paths, point=preds)
+    return forecast_table(islands, hist_dates, history, future_dates, preds, bands)
+
+
+def forecast_scenarios(model, scaler_y, df_total, scenarios, horizon_end=HORIZON_END, stepper=None):
+    """Escenarios what-if (ver ``forecast.scenarios``) en un solo lote
+    ``(escenarios × islas, WIN, features)``, un paso compilado por mes.
+
+    Los choques se aplican en pasajeros: sobre la historia, sobre cada
+    predicción antes de realimentarla o sobre la ventana que ve el modelo.
+    Devuelve la tabla ``scenario``, ``Isla``, ``Fecha``, ``Pasajeros``,
+    ``baseline``, ``delta``, ``delta_pct``.
+    """
+    islands, hist_dates, history, future_dates, mean, scale, base_year = island_inputs(scaler_y, df_total,
+                                                                                       horizon_end)
+    names, hist_f, target_f, lag_f = shock_matrices(scenarios, islands, hist_dates, future_dates)
+    n = len(names)
+    m, s = np.tile(mean, n), np.tile(scale, n)
+    seq = island_windows(np.tile(history, (n, 1)) * hist_f, hist_dates, m, s, base_year)
+
+    # solo se tocan las filas con choque: el escenario base queda idéntico al pronóstico normal
+    def shock(t, y):
+        hit = target_f[:, t] != 1
+        y[hit] = ((y[hit] * s[hit] + m[hit]) * target_f[hit, t] - m[hit]) / s[hit]
+
+    def shock_window(t, window):
+        hit = lag_f[:, t] != 1
+        if not hit.any():
+            return window
+        window = window.copy()
+        x = window[hit, :, 0] * s[hit, None] + m[hit, None]
+        window[hit, :, 0] = (x * lag_f[hit, t, None] - m[hit, None]) / s[hit, None]
+        return window
+
+    stepper = stepper or LSTMStepper(model, WIN, len(FEAT_COLS))
+    preds = stepper.forecast(seq, calendar_features(future_dates, base_year),
+                             step_hook=shock, window_hook=shock_window)
+    return scenario_table(names, islands, future_dates, preds * s[:, None] + m[:, None])
+
+
+def plot_forecast(df_future, island=ISLAND_NAME):
+    plt.figure(figsize=(10,5))
+    plt.plot(df_future[df_future["Phase"]=="History"][DATE_COL],
+             df_future[df_future["Phase"]=="History"][TARGET_COL],
+             label="Historia", color="tab:blue")
+    plt.plot(df_future[df_future["Phase"]=="Forecast"][DATE_COL],
+             df_future[df_future["Phase"]=="Forecast"][TARGET_COL],
+             label="Pronóstico LSTM", color="tab:green")
+    plt.title(f"✈️ {island} — Pronóstico LSTM (12 meses de memoria)")
+    plt.xlabel("Fecha")
+    plt.ylabel("Número de pasajeros")
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    df = load_island_history()
+    model, scaler_y = load_artifacts()
+
+    print(f"📅 Inicio: {df[DATE_COL].max().date()} → Fin: {pd.Timestamp(HORIZON_END).date()}")
+    print(f"🧠 Memoria de secuencia: {WIN} meses")
+
+    # ----------------------------------------------------------
+    # 5️⃣ PRONÓSTICO, GRÁFICO Y RESULTADOS
+    # ----------------------------------------------------------
+    stepper = LSTMStepper(model, WIN, len(FEAT_COLS))
+    df_future = forecast_frame(model, scaler_y, df, stepper=stepper)
+    plot_forecast(df_future)
+
+    out_file = "forecast_total_canarias_lstm.csv"
+    df_future.to_csv(out_file, index=False, encoding="utf-8-sig")
+    print(f"💾 Guardado {out_file}")
+
+    print("\n📈 Últimos 12 meses del pronóstico:")
+    print(df_future[df_future["Phase"]=="Forecast"].tail(12)[[DATE_COL, TARGET_COL]])
 
-print("\n📈 Últimos 12 meses del pronóstico:")
-print(df_future[df_future["Phase"]=="Forecast"].tail(12)[[DATE_COL, TARGET_COL]])
+    # ----------------------------------------------------------
+    # 🏝️ Todas las islas en bloque
+    # ----------------------------------------------------------
+    df_islands = forecast_all_islands(model, scaler_y, pd.read_csv("result_total.csv", encoding="utf-8-sig"),
+                                      stepper=stepper, n_paths=N_PATHS)
+    df_islands.to_csv(ISLAND_FORECAST_FILES["lstm"], index=False, encoding="utf-8-sig")
+    print(f"💾 Guardado {ISLAND_FORECAST_FILES['lstm']} ({df_islands['Isla'].nunique()} islas)")
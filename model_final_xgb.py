@@ -2,125 +2,289 @@
 # 🧭 Pronóstico final XGBoost — generación corregida de lags
 # ==============================================================
 
+import sys
+import time
+
 import pandas as pd
 import numpy as np
+import joblib
 import matplotlib.pyplot as plt
 from xgboost import XGBRegressor
+from sklearn.base import clone
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 from sklearn.compose import TransformedTargetRegressor
 
+from forecast.features import add_month_index, year_base
+from forecast.intervals import N_PATHS, backtest_residuals, simulate_bands
+from forecast.islands import ISLAND_FORECAST_FILES, forecast_table, island_matrix
+from forecast.recursive import XGB_FEATURES, LevelScaledRegressor, RecursiveForecaster, future_months
+from forecast.scenarios import scenario_hook, scenario_table, shock_matrices
+
 # === PARÁMETROS ===
 ISLAND_NAME = "Total Canarias"
 TARGET_COL = "Pasajeros"
 DATE_COL = "Fecha"
 HORIZON_END = "2026-12-01"
+WARM_START_TREES = 100       # árboles añadidos en cada actualización incremental
+FULL_RETRAIN_EVERY = 12      # actualizaciones incrementales antes de un reentrenamiento completo
 
-# === Datos de entrada ===
-df = pd.read_csv("result_total_with_lags_coded.csv", encoding="utf-8-sig")
-df[DATE_COL] = pd.to_datetime(df[DATE_COL])
-df = df.sort_values(DATE_COL)
-df = df[df["Isla"] == ISLAND_NAME].reset_index(drop=True)
+# 🔹 Características para el modelo
+FEATURES = XGB_FEATURES
 
-# 🔹 Tendencia a largo plazo
-df["month_idx"] = np.arange(len(df))
 
-# 🔹 Características para el modelo
-FEATURES = [
-    "month_idx", "month_sin", "month_cos", "year_norm",
-    *[f"lag_{i}" for i in range(1, 13)],
-    "roll3", "roll6"
-]
-
-X_train = df[FEATURES].values
-y_train = df[TARGET_COL].values
-print(y_train)
-
-# 🔹 Modelo XGB
-xgb = Pipeline([
-    ("imputer", SimpleImputer(strategy="median")),
-    ("model", XGBRegressor(
-        n_estimators=800,
-        learning_rate=0.03,
-        max_depth=5,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        objective="reg:squarederror",
-        random_state=42
-    ))
-])
-
-model = TransformedTargetRegressor(regressor=xgb, transformer=StandardScaler())
-model.fit(X_train, y_train)
-print("✅ Modelo entrenado con datos históricos")
+def load_island_history(path="result_total_with_lags_coded.csv", island=ISLAND_NAME):
+    """Serie mensual con features de una isla, ordenada por fecha."""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
+    df = df.sort_values(DATE_COL)
+    df = df[df["Isla"] == island].reset_index(drop=True)
 
-# ==============================================================
-# Pronóstico iterativo — lags corregidos
-# ==============================================================
-df_future = df.copy()
-last_date = df_future[DATE_COL].max()
-future_dates = pd.period_range(last_date, HORIZON_END, freq="M")[1:].to_timestamp()
+    # 🔹 Tendencia a largo plazo
+    df["month_idx"] = np.arange(len(df))
+    return df
 
-print(f"📈 Pronosticando desde {last_date.date()} hasta {future_dates[-1].date()}")
 
-for next_date in future_dates:
-    new_row = {}
+def load_all_islands(path="result_total_with_lags_coded.csv"):
+    """Todas las islas (modelo global): ``month_idx`` cuenta los meses de cada isla."""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
+    df = df.sort_values(["Isla", DATE_COL], kind="mergesort").reset_index(drop=True)
+    return add_month_index(df)
 
-    # --- características de calendario
-    new_row[DATE_COL] = next_date
-    new_row["Isla"] = ISLAND_NAME
-    m = next_date.month
-    new_row["month_sin"] = np.sin(2 * np.pi * m / 12)
-    new_row["month_cos"] = np.cos(2 * np.pi * m / 12)
-    new_row["month_idx"] = len(df_future)
-    min_year = df[DATE_COL].dt.year.min()
 
-    new_row["year_norm"] = (next_date.year - min_year) + 1
+def build_model():
+    """Pipeline XGB (imputación + escalado del objetivo)."""
+    xgb = Pipeline([
+        ("imputer", SimpleImputer(strategy="median")),
+        ("model", XGBRegressor(
+            n_estimators=800,
+            learning_rate=0.03,
+            max_depth=5,
+            subsample=0.9,
+            colsample_bytree=0.9,
+            objective="reg:squarederror",
+            random_state=42
+        ))
+    ])
+    return TransformedTargetRegressor(regressor=xgb, transformer=StandardScaler())
 
-    # --- lags: desde los últimos meses en df_future
-    for i in range(1, 13):
-        if len(df_future) >= i:
-            new_row[f"lag_{i}"] = df_future[TARGET_COL].iloc[-i]
-        else:
-            new_row[f"lag_{i}"] = np.nan
 
-    # --- rollings
-    last_vals = df_future[TARGET_COL].tail(6).values
-    new_row["roll3"] = np.mean(last_vals[-3:]) if len(last_vals) >= 3 else np.nan
-    new_row["roll6"] = np.mean(last_vals[-6:]) if len(last_vals) >= 6 else np.nan
+def build_pooled_model():
+    """Modelo global de todas las islas: el pipeline XGB sobre lags y objetivo
+    relativos al nivel de cada isla (``LevelScaledRegressor``), de modo que las
+    islas pequeñas no heredan el nivel de las grandes."""
+    return LevelScaledRegressor(build_model(), FEATURES)
 
-    X_pred = np.array([[new_row.get(f, np.nan) for f in FEATURES]])
-    y_pred = model.predict(X_pred)[0]
 
-    # --- sin valores negativos
-    y_pred = max(y_pred, 0)
-    new_row[TARGET_COL] = y_pred
+def xgb_pipeline(model):
+    """Pipeline ajustado (imputador + XGB) de un modelo por serie o global."""
+    if isinstance(model, LevelScaledRegressor):
+        model = model.regressor_
+    return model.regressor_
 
-    df_future = pd.concat([df_future, pd.DataFrame([new_row])], ignore_index=True)
 
-df_future["Phase"] = np.where(df_future[DATE_COL] <= last_date, "History", "Forecast")
+def warm_start_model(model, X, y, extra_trees=WARM_START_TREES):
+    """Continúa el boosting de un modelo ya ajustado (``xgb_model=``).
 
-# ==============================================================
-# 📊 Gráfico
-# ==============================================================
-plt.figure(figsize=(10,5))
-plt.plot(df_future[df_future["Phase"]=="History"][DATE_COL],
-         df_future[df_future["Phase"]=="History"][TARGET_COL],
-         label="Historia", color="tab:blue")
-plt.plot(df_future[df_future["Phase"]=="Forecast"][DATE_COL],
-         df_future[df_future["Phase"]=="Forecast"][TARGET_COL],
-         label="Pronóstico XGB (lags corregidos)", color="tab:orange")
-plt.title("✈️ Total Canarias — Pronóstico XGB hasta 2026 (versión corregida)")
-plt.grid(True, alpha=0.3)
-plt.legend()
-plt.tight_layout()
-plt.show()
+    Se añaden ``extra_trees`` árboles sobre ``X``/``y`` (historia + meses
+    nuevos) partiendo del booster anterior. El imputador y el escalador del
+    objetivo ya ajustados se reutilizan, de modo que los árboles nuevos
+    corrigen los residuos en la misma escala que los antiguos (en el modelo
+    global, también relativos al nivel de cada isla).
+    Modifica y devuelve ``model``.
+    """
+    target = model
+    if isinstance(model, LevelScaledRegressor):
+        X, y = model.scale(X, y)
+        target = model.regressor_
+    pipe = xgb_pipeline(model)
+    imputer = pipe.named_steps["imputer"]
+    xgb_prev = pipe.named_steps["model"]
 
-# ==============================================================
-# 📁 Guardar resultados
-# ==============================================================
-df_future.to_csv("forecast_total_canarias_xgb.csv", index=False, encoding="utf-8-sig")
-print("💾 Guardado forecast_total_canarias_fixedlags.csv")
+    y_scaled = target.transformer_.transform(np.asarray(y, dtype=float).reshape(-1, 1)).ravel()
+    xgb_new = clone(xgb_prev).set_params(n_estimators=extra_trees)
+    xgb_new.fit(imputer.transform(X), y_scaled, xgb_model=xgb_prev.get_booster())
+    pipe.steps[-1] = ("model", xgb_new)
+    return model
+
+
+def mape(y_true, y_pred):
+    y_true = np.asarray(y_true, dtype=float)
+    y_pred = np.asarray(y_pred, dtype=float)
+    return float(np.mean(np.abs(y_pred - y_true) / np.abs(y_true)) * 100)
+
+
+def compare_warm_vs_full(df_all, months=6, extra_trees=WARM_START_TREES):
+    """Simula las últimas ``months`` actualizaciones mensuales con las dos estrategias.
+
+    Para cada mes: reentrenamiento completo vs. boosting incremental sobre el
+    modelo del mes anterior; se mide el tiempo de ajuste y el MAPE (a un
+    paso, todas las islas) del mes siguiente. Devuelve un DataFrame.
+    """
+    dates = np.sort(df_all[DATE_COL].unique())
+    rows = []
+    warm = build_pooled_model()
+    first = df_all[DATE_COL] < dates[-months - 1]
+    warm.fit(df_all.loc[first, FEATURES].values, df_all.loc[first, TARGET_COL].values)
+
+    for cutoff, target in zip(dates[-months - 1:-1], dates[-months:]):
+        train = df_all[df_all[DATE_COL] <= cutoff]
+        test = df_all[df_all[DATE_COL] == target]
+        X, y = train[FEATURES].values, train[TARGET_COL].values
+
+        t0 = time.perf_counter()
+        full = build_pooled_model().fit(X, y)
+        t_full = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        warm_start_model(warm, X, y, extra_trees)
+        t_warm = time.perf_counter() - t0
+
+        for mode, mdl, secs in (("full", full, t_full), ("warm", warm, t_warm)):
+            rows.append({
+                "cutoff": pd.Timestamp(cutoff).date(), "mode": mode, "wall_time_s": round(secs, 3),
+                "mape_next_month": mape(test[TARGET_COL].values, mdl.predict(test[FEATURES].values)),
+            })
+    return pd.DataFrame(rows)
+
+
+def forecast_frame(model, df, horizon_end=HORIZON_END, island=ISLAND_NAME):
+    """Pronóstico iterativo hasta ``horizon_end``; devuelve historia + pronóstico.
+
+    La recursión corre sobre un buffer circular preasignado
+    (``RecursiveForecaster``) y el DataFrame se construye una sola vez al final.
+    """
+    last_date = df[DATE_COL].max()
+    future_dates = future_months(last_date, horizon_end)
+    min_year = year_base(df)
+
+    forecaster = RecursiveForecaster(model, FEATURES)
+    preds, feats = forecaster.forecast(df[TARGET_COL].to_numpy(dtype=float), future_dates,
+                                       base_year=min_year, month_idx0=len(df), keep_features=True)
+
+    future = pd.DataFrame(feats[0], columns=FEATURES)
+    future = future.astype({"month_idx": "int64", "year_norm": "int64"})
+    future.insert(0, DATE_COL, future_dates)
+    future.insert(1, "Isla", island)
+    future[TARGET_COL] = preds[0]
+
+    df_future = pd.concat([df, future], ignore_index=True)
+    df_future["Phase"] = np.where(df_future[DATE_COL] <= last_date, "History", "Forecast")
+    return df_future
+
+
+def forecast_all_islands(model, df_all, horizon_end=HORIZON_END, residuals=None, n_paths=N_PATHS):
+    """Pronóstico de todas las islas a la vez: un ``predict`` por mes para toda la matriz.
+
+    Devuelve la tabla consolidada (``Isla``, ``Fecha``, ``Pasajeros``, ``Phase``).
+    Con ``residuals`` (errores a un paso por isla, ver ``forecast.intervals``)
+    añade las bandas P10/P90 de ``n_paths`` trayectorias simuladas, que
+    se calculan en un solo lote (trayectorias × islas) y se anclan en el
+    pronóstico puntual (P10 <= Pasajeros <= P90).
+    """
+    islands, hist_dates, history = island_matrix(df_all, TARGET_COL)
+    future_dates = future_months(hist_dates[-1], horizon_end)
+    min_year = year_base(df_all)
+
+    forecaster = RecursiveForecaster(model, FEATURES)
+    month_idx0 = np.sum(~np.isnan(history), axis=1)
+    preds = forecaster.forecast(history, future_dates, base_year=min_year, month_idx0=month_idx0)
+    bands = None
+    if residuals is not None and n_paths:
+        bands = simulate_bands(forecaster, history, future_dates, min_year, month_idx0,
+                               residuals.reindex(islands).to_numpy(dtype=float), n_paths, point=preds)
+    return forecast_table(islands, hist_dates, history, future_dates, preds, bands)
+
+
+def forecast_scenarios(model, df_all, scenarios, horizon_end=HORIZON_END):
+    """Escenarios what-if (ver ``forecast.scenarios``) en una sola pasada recursiva.
+
+    Cada escenario × isla es una fila del lote; los choques se aplican a la
+    historia, a las predicciones antes de realimentarlas o a los lags que ve
+    el modelo. Devuelve la tabla ``scenario``, ``Isla``, ``Fecha``,
+    ``Pasajeros``, ``baseline``, ``delta``, ``delta_pct``.
+    """
+    islands, hist_dates, history = island_matrix(df_all, TARGET_COL)
+    future_dates = future_months(hist_dates[-1], horizon_end)
+    min_year = year_base(df_all)
+    names, hist_f, target_f, lag_f = shock_matrices(scenarios, islands, hist_dates, future_dates)
+    n = len(names)
+
+    forecaster = RecursiveForecaster(model, FEATURES)
+    lag_cols = [j for j, f in enumerate(FEATURES) if f.startswith(("lag_", "roll"))]
+    month_idx0 = np.tile(np.sum(~np.isnan(history), axis=1), n)
+    preds = forecaster.forecast(np.tile(history, (n, 1)) * hist_f, future_dates, base_year=min_year,
+                                month_idx0=month_idx0, step_hook=scenario_hook(lag_cols, target_f, lag_f))
+    return scenario_table(names, islands, future_dates, preds)
+
+
+def island_residuals(path="result_total.csv"):
+    """Errores relativos a un paso fuera de muestra (backtest) de cada isla."""
+    df_total = pd.read_csv(path, encoding="utf-8-sig")
+    df_total[DATE_COL] = pd.to_datetime(df_total[DATE_COL])
+    return backtest_residuals(df_total, build_pooled_model)
+
+
+def plot_forecast(df_future):
+    plt.figure(figsize=(10,5))
+    plt.plot(df_future[df_future["Phase"]=="History"][DATE_COL],
+             df_future[df_future["Phase"]=="History"][TARGET_COL],
+             label="Historia", color="tab:blue")
+    plt.plot(df_future[df_future["Phase"]=="Forecast"][DATE_COL],
+             df_future[df_future["Phase"]=="Forecast"][TARGET_COL],
+             label="Pronóstico XGB (lags corregidos)", color="tab:orange")
+    plt.title("✈️ Total Canarias — Pronóstico XGB hasta 2026 (versión corregida)")
+    plt.grid(True, alpha=0.3)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    if "--compare-warm" in sys.argv:
+        # 📏 coste/precisión: reentrenamiento completo vs. incremental
+        print(compare_warm_vs_full(load_all_islands()).to_string(index=False))
+        sys.exit(0)
+
+    # === Datos de entrada ===
+    df = load_island_history()
+    X_train = df[FEATURES].values
+    y_train = df[TARGET_COL].values
+    print(y_train)
+
+    # 🔹 Modelo XGB
+    model = build_model()
+    model.fit(X_train, y_train)
+    print("✅ Modelo entrenado con datos históricos")
+
+    # ==============================================================
+    # Pronóstico iterativo — lags corregidos
+    # ==============================================================
+    df_future = forecast_frame(model, df)
+    print(f"📈 Pronosticando desde {df[DATE_COL].max().date()} hasta {df_future[DATE_COL].max().date()}")
+
+    # ==============================================================
+    # 📊 Gráfico
+    # ==============================================================
+    plot_forecast(df_future)
+
+    # ==============================================================
+    # 📁 Guardar resultados
+    # ==============================================================
+    df_future.to_csv("forecast_total_canarias_xgb.csv", index=False, encoding="utf-8-sig")
+    print("💾 Guardado forecast_total_canarias_fixedlags.csv")
+
+    print("\n📈 Últimos 12 meses del pronóstico:")
 
-print("\n📈 Últimos 12 meses del pronóstico:")
+    # ==============================================================
+    # 🏝️ Todas las islas — modelo global, pronóstico en bloque
+    # ==============================================================
+    df_all = load_all_islands()
+    model_all = build_pooled_model()
+    model_all.fit(df_all[FEATURES].values, df_all[TARGET_COL].values)
+    joblib.dump(model_all, "models/xgb_islands.pkl")   # lo usa el servicio de pronóstico
+    df_islands = forecast_all_islands(model_all, df_all, residuals=island_residuals())
+    df_islands.to_csv(ISLAND_FORECAST_FILES["xgb"], index=False, encoding="utf-8-sig")
+    print(f"💾 Guardado {ISLAND_FORECAST_FILES['xgb']} ({df_islands['Isla'].nunique()} islas)")
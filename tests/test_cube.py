@@ -0,0 +1,133 @@
+"""The aggregate cube must give the tables of the original pandas code of the dashboard."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.cube import FLIGHT_TYPES, AggregateCube, write_cube
+
+ROOT = Path(__file__).resolve().parents[1]
+ISLANDS = ["La Palma", "Tenerife"]
+# charts/origins.py imports streamlit; same list as its EXCLUDE_ORIGINS
+EXCLUDE_ORIGINS = [
+    "TOTAL PASAJEROS",
+    "AEROP. INTERINSULARES",
+    "AEROP. PENINSULARES",
+    "TOTAL AEROP. EXTRANJEROS",
+    "AEROP. PENINSULARES + AEROP. EXTRANJEROS",
+]
+RANGES = [(None, None), ("2023-03-01", "2023-03-01"), ("2022-12-15", "2024-02-01"), ("2030-01-01", None)]
+
+
+@pytest.fixture(scope="module")
+def details():
+    """Two islands over 2022-11..2024-04 from result.csv, with holes and shuffled rows."""
+    df = pd.read_csv(ROOT / "result.csv", parse_dates=["Fecha"], encoding="utf-8-sig")
+    df = df[df["Isla"].isin(ISLANDS) & df["Fecha"].between("2022-11-01", "2024-04-01")]
+    origin = df["AEROPUERTO_DE_PROCEDENCIA"]
+    holes = (
+        ((df["Isla"] == "La Palma") & (df["Fecha"] == "2023-05-01") & (origin == "TOTAL PASAJEROS"))
+        | ((df["Isla"] == "Tenerife") & (df["Fecha"] == "2023-08-01") & (origin == "aerop. peninsulares"))
+        | ((df["Isla"] == "Tenerife") & (df["Fecha"] == "2024-01-01") & (origin == "Alemania"))
+    )
+    assert holes.sum() == 3
+    return df[~holes].sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+@pytest.fixture(scope="module")
+def cube(details):
+    return AggregateCube.from_frame(details)
+
+
+# ------------------------------------------------- baseline (ui/tabs.py, charts/*)
+def baseline_range(df, island, start, end):
+    df_island = df[df["Isla"] == island].copy()
+    lo = df_island["Fecha"].min() if start is None else pd.Timestamp(start)
+    hi = df_island["Fecha"].max() if end is None else pd.Timestamp(end)
+    return df_island[(df_island["Fecha"] >= lo) & (df_island["Fecha"] <= hi)]
+
+
+def baseline_total(dfv):
+    return dfv[dfv["AEROPUERTO_DE_PROCEDENCIA"].str.upper() == "TOTAL PASAJEROS"]
+
+
+def baseline_type_shares(dfv):
+    df_types = dfv[dfv["AEROPUERTO_DE_PROCEDENCIA"].isin(FLIGHT_TYPES)]
+    df_month_total = df_types.groupby("Fecha")["Pasajeros"].sum().rename("Total")
+    df_pct = (
+        df_types.groupby(["Fecha", "AEROPUERTO_DE_PROCEDENCIA"])["Pasajeros"]
+        .sum()
+        .unstack(fill_value=0)
+    )
+    return df_pct.div(df_month_total, axis=0) * 100
+
+
+def baseline_origin_totals(dfv):
+    df_clean = dfv[~dfv["AEROPUERTO_DE_PROCEDENCIA"].str.upper().isin(EXCLUDE_ORIGINS)]
+    return df_clean.groupby("AEROPUERTO_DE_PROCEDENCIA")["Pasajeros"].sum()
+
+
+def baseline_seasonality(df, island):
+    df_heat = baseline_total(df[df["Isla"].str.contains(island, case=False, na=False)]).copy()
+    df_heat["Año"] = df_heat["Fecha"].dt.year.astype(int)
+    df_heat["Mes"] = df_heat["Fecha"].dt.month.astype(int)
+    heat_table = df_heat.pivot(index="Año", columns="Mes", values="Pasajeros")
+    return heat_table.reindex(columns=range(1, 13))
+
+
+# ------------------------------------------------------------------- tests
+@pytest.mark.parametrize("island", ISLANDS)
+@pytest.mark.parametrize("start,end", RANGES)
+def test_range_tables_match_baseline(details, cube, island, start, end):
+    dfv = baseline_range(details, island, start, end)
+    df_total = baseline_total(dfv)
+    view = cube.view(island, start, end)
+
+    expected = df_total.set_index("Fecha")["Pasajeros"].sort_index()
+    pd.testing.assert_series_equal(view.total_series(), expected, check_dtype=False, check_index_type=False,
+                                   check_freq=False)
+
+    yearly = df_total.groupby("Año", as_index=False)["Pasajeros"].sum().sort_values("Año")
+    pd.testing.assert_frame_equal(view.yearly_table().reset_index(drop=True), yearly.reset_index(drop=True),
+                                  check_dtype=False)
+
+    monthly = df_total[["Año", "Mes", "Pasajeros"]].sort_values(["Año", "Mes"])
+    pd.testing.assert_frame_equal(view.monthly_table().reset_index(drop=True), monthly.reset_index(drop=True),
+                                  check_dtype=False)
+
+    shares = view.type_shares()
+    expected = baseline_type_shares(dfv)
+    assert sorted(shares.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(shares, expected[shares.columns], check_dtype=False, check_names=False,
+                                  check_index_type=False, check_column_type=False)
+
+    origins = view.origin_totals(exclude=EXCLUDE_ORIGINS).sort_index()
+    pd.testing.assert_series_equal(origins, baseline_origin_totals(dfv).sort_index(), check_dtype=False,
+                                   check_names=False, check_index_type=False)
+
+
+@pytest.mark.parametrize("island", ISLANDS)
+def test_seasonality_and_date_range_match_baseline(details, cube, island):
+    pd.testing.assert_frame_equal(cube.seasonality(island), baseline_seasonality(details, island),
+                                  check_dtype=False, check_column_type=False)
+
+    df_island = details[details["Isla"] == island]
+    assert cube.date_range(island) == (df_island["Fecha"].min(), df_island["Fecha"].max())
+
+
+def test_holes_are_missing_not_zero(cube):
+    assert pd.Timestamp("2023-05-01") not in cube.total_series("La Palma").index
+    shares = cube.type_shares("Tenerife", "2023-07-01", "2023-08-01")
+    assert shares.loc["2023-08-01", "aerop. peninsulares"] == 0   # baseline unstack(fill_value=0)
+    np.testing.assert_allclose(shares.sum(axis=1), 100)
+
+
+def test_stored_cube_reads_back_the_same(tmp_path, details, cube):
+    write_cube(details, cube_dir=tmp_path, source="fixture")
+    stored = AggregateCube(tmp_path)
+    assert isinstance(stored.arrays["passengers"], np.memmap)
+    for island in ISLANDS:
+        pd.testing.assert_frame_equal(stored.view(island).monthly_table(), cube.view(island).monthly_table())
+        pd.testing.assert_series_equal(stored.view(island).origin_totals(), cube.view(island).origin_totals())
@@ -0,0 +1,66 @@
+"""The P10/P90 bands must bracket the point forecast of every island."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecast.intervals import band_columns, bootstrap_factors, path_quantiles
+
+ROOT = Path(__file__).resolve().parents[1]
+N_PATHS = 200
+
+
+def assert_bracketed(table):
+    fc = table[table["Phase"] == "Forecast"]
+    assert not fc.empty
+    for island, g in fc.groupby("Isla"):
+        point = g["Pasajeros"].to_numpy()
+        assert (g["P10"].to_numpy() <= point + 1e-6).all(), f"{island}: P10 above the point forecast"
+        assert (point <= g["P90"].to_numpy() + 1e-6).all(), f"{island}: P90 below the point forecast"
+        assert "P50" not in g, "P50 would only repeat the point forecast"
+
+
+def test_bootstrap_residuals_are_centered():
+    # a constant (pure bias) error pool carries no spread: no shock at all
+    factors = bootstrap_factors(np.array([[0.4, 0.4, np.nan], [-0.2, -0.2, -0.2]]), n_paths=50, horizon=6)
+    np.testing.assert_allclose(factors, 1.0)
+
+
+def test_path_quantiles_anchor_on_point():
+    rng = np.random.default_rng(0)
+    paths = np.exp(rng.normal(0.5, 0.3, size=(100 * 3, 4))) * 1000    # median far above the point
+    point = np.full((3, 4), 1000.0)
+    bands = path_quantiles(paths, 100, point=point)
+    assert list(bands) == band_columns() == ["P10", "P90"]
+    assert (bands["P10"] <= point).all() and (point <= bands["P90"]).all()
+    # the band keeps the relative width of the paths around the point
+    np.testing.assert_allclose(bands["P90"] / bands["P10"],
+                               np.quantile(paths.reshape(100, 3, 4), 0.9, axis=0)
+                               / np.quantile(paths.reshape(100, 3, 4), 0.1, axis=0))
+
+
+def test_xgb_bands_bracket_every_island():
+    import model_final_xgb as xgb_script
+
+    df_all = xgb_script.load_all_islands(ROOT / "result_total_with_lags_coded.csv")
+    model = xgb_script.build_pooled_model().fit(df_all[xgb_script.FEATURES].values,
+                                                df_all[xgb_script.TARGET_COL].values)
+    residuals = xgb_script.island_residuals(ROOT / "result_total.csv")
+    table = xgb_script.forecast_all_islands(model, df_all, residuals=residuals, n_paths=N_PATHS)
+    assert set(table["Isla"]) == set(residuals.index)
+    assert_bracketed(table)
+
+
+def test_lstm_bands_bracket_every_island():
+    pytest.importorskip("tensorflow")
+    import model_final_lstm as lstm_script
+
+    artifacts = [ROOT / "models" / "lstm_best.h5", ROOT / "models" / "scaler_y.pkl"]
+    if not all(p.exists() for p in artifacts):
+        pytest.skip("LSTM artifacts not available")
+    model, scaler_y = lstm_script.load_artifacts(*artifacts)
+    df_total = pd.read_csv(ROOT / "result_total.csv", encoding="utf-8-sig")
+    table = lstm_script.forecast_all_islands(model, scaler_y, df_total, n_paths=N_PATHS)
+    assert_bracketed(table)
@@ -0,0 +1,56 @@
+"""The one-pass KPI table must match the original per-island ``calculate_kpi_full``."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from data.dataset import PassengerDataset
+from kpi.kpi_calculator import calculate_kpi_full, calculate_kpi_table
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def details():
+    """Every island over 2022-09..2025-04 from result.csv, rows shuffled, with edge cases.
+
+    La Palma only keeps two years (no yearly YoY) and Lanzarote loses the
+    TOTAL PASAJEROS row of a year before its last month (no monthly YoY).
+    """
+    df = pd.read_csv(ROOT / "result.csv", encoding="utf-8-sig")
+    fecha = pd.to_datetime(df["Fecha"])
+    df = df[fecha.between("2022-09-01", "2025-04-01")]
+    drop = (
+        ((df["Isla"] == "La Palma") & (df["Fecha"] < "2024-01-01"))
+        | ((df["Isla"] == "Lanzarote") & (df["Fecha"] == "2024-04-01")
+           & (df["AEROPUERTO_DE_PROCEDENCIA"] == "TOTAL PASAJEROS"))
+    )
+    return df[~drop].sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def assert_same_kpis(table, df):
+    islands = df["Isla"].astype(str).unique()
+    assert sorted(table) == sorted(islands)
+    for island in islands:
+        expected = calculate_kpi_full(df, island)
+        got = table[island]
+        assert got.keys() == expected.keys()
+        for key, value in expected.items():
+            if isinstance(value, float):
+                assert got[key] == pytest.approx(value), f"{island}: {key}"
+            else:
+                assert got[key] == value, f"{island}: {key}"
+
+
+def test_kpi_table_matches_per_island_kpis(details):
+    table = calculate_kpi_table(details)
+    assert_same_kpis(table, details)
+    assert table["La Palma"]["yoy_year_pct"] is None
+    assert table["Lanzarote"]["yoy_month_pct"] is None
+
+
+def test_kpi_table_from_dataset_frame(details):
+    # the dashboard passes the sorted, categorical PassengerDataset frame
+    frame = PassengerDataset(details).frame
+    assert_same_kpis(calculate_kpi_table(frame), details)
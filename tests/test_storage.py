@@ -0,0 +1,105 @@
+"""Keyed upserts into the Parquet store and the CSVs exported after an ingest."""
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import download_agent
+from data.storage import DETAILS_TABLE, TOTAL_TABLE, export_csv, read_table, upsert_rows, write_table
+
+ROOT = Path(__file__).resolve().parents[1]
+WORKBOOK = ROOT / "data" / "22_pasajeros_canarias_octubre_2025.xlsx"   # octubre 2025
+NEW_MONTH = pd.Timestamp("2025-10-01")
+HISTORY_START = pd.Timestamp("2025-07-01")
+
+
+def history(csv_name):
+    """Three months before the workbook's month, as stored in the repo CSV."""
+    df = pd.read_csv(ROOT / csv_name, parse_dates=["Fecha"], encoding="utf-8-sig")
+    return df[(df["Fecha"] >= HISTORY_START) & (df["Fecha"] < NEW_MONTH)].reset_index(drop=True)
+
+
+def assert_sorted(df):
+    keys = df[["Isla", "Fecha"]].astype({"Isla": str})
+    assert keys.equals(keys.sort_values(["Isla", "Fecha"], kind="mergesort")), "rows not sorted by Isla/Fecha"
+
+
+@pytest.fixture
+def totals():
+    return history("result_total.csv")
+
+
+@pytest.fixture
+def agent_dir(tmp_path, monkeypatch):
+    """Working directory with store and CSVs holding the history (the agent uses relative paths)."""
+    monkeypatch.chdir(tmp_path)
+    details, totals = history("result.csv"), history("result_total.csv")
+    write_table(details, DETAILS_TABLE)
+    write_table(totals, TOTAL_TABLE)
+    export_csv(details, download_agent.RESULT_DETAILS_CSV)
+    export_csv(totals, download_agent.RESULT_TOTAL_CSV)
+    return tmp_path
+
+
+def test_upsert_inserts_new_month(tmp_path, totals):
+    old = totals[totals["Fecha"] < pd.Timestamp("2025-09-01")]
+    new = totals[totals["Fecha"] == pd.Timestamp("2025-09-01")]
+    write_table(old, TOTAL_TABLE, store_dir=tmp_path)
+
+    written = upsert_rows(new, TOTAL_TABLE, store_dir=tmp_path)
+
+    assert len(written) == len(new)
+    stored = read_table(TOTAL_TABLE, store_dir=tmp_path)
+    assert len(stored) == len(totals)
+    assert_sorted(stored)
+    expected = totals.sort_values(["Isla", "Fecha"], kind="mergesort").reset_index(drop=True)
+    assert stored["Pasajeros"].tolist() == expected["Pasajeros"].tolist()
+
+
+def test_upsert_replaces_month_only_with_replace(tmp_path, totals):
+    write_table(totals, TOTAL_TABLE, store_dir=tmp_path)
+    month = pd.Timestamp("2025-08-01")
+    fixed = totals[totals["Fecha"] == month].assign(Pasajeros=lambda d: d["Pasajeros"] + 1)
+
+    assert upsert_rows(fixed, TOTAL_TABLE, store_dir=tmp_path).empty   # stored months are skipped
+    stored = read_table(TOTAL_TABLE, store_dir=tmp_path)
+    assert stored.loc[stored["Fecha"] == month, "Pasajeros"].sum() == totals.loc[totals["Fecha"] == month, "Pasajeros"].sum()
+
+    written = upsert_rows(fixed, TOTAL_TABLE, store_dir=tmp_path, replace=True)
+
+    assert len(written) == len(fixed)
+    stored = read_table(TOTAL_TABLE, store_dir=tmp_path)
+    assert len(stored) == len(totals)
+    assert_sorted(stored)
+    assert stored.loc[stored["Fecha"] == month, "Pasajeros"].sum() == fixed["Pasajeros"].sum()
+    other = stored[stored["Fecha"] != month]
+    assert other["Pasajeros"].sum() == totals.loc[totals["Fecha"] != month, "Pasajeros"].sum()
+
+
+@pytest.mark.parametrize("upsert", [False, True])
+def test_ingest_keeps_exported_csvs_sorted(agent_dir, upsert):
+    written_details, written_totals = download_agent.ingest_new_excel(
+        str(WORKBOOK), upsert=upsert, export_to_csv=True, use_cache=False)
+
+    assert set(written_totals["Fecha"]) == {NEW_MONTH}
+    for name, csv_path in ((DETAILS_TABLE, download_agent.RESULT_DETAILS_CSV),
+                           (TOTAL_TABLE, download_agent.RESULT_TOTAL_CSV)):
+        exported = pd.read_csv(csv_path, parse_dates=["Fecha"], encoding="utf-8-sig")
+        assert_sorted(exported)
+        stored = read_table(name)
+        assert len(exported) == len(stored)
+        assert exported["Pasajeros"].tolist() == stored["Pasajeros"].tolist()
+
+
+def test_backfill_keeps_exported_csvs_sorted(agent_dir):
+    data_dir = agent_dir / "xlsx"
+    data_dir.mkdir()
+    (data_dir / WORKBOOK.name).symlink_to(WORKBOOK)
+
+    download_agent.backfill(data_dir=data_dir, workers=1, export_to_csv=True, use_cache=False)
+
+    for csv_path in (download_agent.RESULT_DETAILS_CSV, download_agent.RESULT_TOTAL_CSV):
+        exported = pd.read_csv(csv_path, parse_dates=["Fecha"], encoding="utf-8-sig")
+        assert_sorted(exported)
+        assert exported["Fecha"].max() == NEW_MONTH
@@ -1,71 +1,81 @@
-"""Tabs layout and content rendering."""
+"""Tabs layout and content rendering.
+
+Only the active tab is rendered: the tab bar is a horizontal radio, so a
+rerun builds the figures of one tab instead of all five. Tabs 1–3 share one
+date range kept in ``st.session_state`` (per island, surviving tab changes),
+and the cube view for that range is resolved once per rerun.
+"""
 
 import streamlit as st
 import pandas as pd
 from charts.trends import plot_total_passengers, plot_flight_type_shares
-from charts.origins import plot_origins_donut
+from charts.origins import EXCLUDE_ORIGINS, plot_origins_donut
 from charts.heatmap import plot_seasonality_heatmap
 from forecast.forecast_plot import plot_forecast_tab
 
-
-def display_tabs(dfv: pd.DataFrame, df_full: pd.DataFrame, df_xgb, df_lstm, selected_island: str):
-    """Create and render all tabs: Datos, Gráfico, Origen, Tipos de vuelo, Pronóstico."""
-
-    # ---------------------------------------------------------------------
-    # Precompute valid date range for slider (always same for tabs 1–3)
-    # ---------------------------------------------------------------------
-    df_island = df_full[df_full["Isla"] == selected_island].copy()
-    df_island["Fecha"] = pd.to_datetime(df_island["Fecha"], errors="coerce")
-
-    min_d = df_island["Fecha"].min()
-    max_d = df_island["Fecha"].max()
-    default_start = max(min_d, max_d - pd.DateOffset(months=12))
-
-    # ========================= TABS =========================
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "📊 Datos",
-        "📈 Gráfico",
-        "🌍 Origen",
-        "✈️ Variación estacional",
-        "🔮 Pronóstico",
-    ])
+TABS = [
+    "📊 Datos",
+    "📈 Gráfico",
+    "🌍 Origen",
+    "✈️ Variación estacional",
+    "🔮 Pronóstico",
+]
+RANGE_TABS = TABS[:3]          # tabs filtered by the shared date range
+DEFAULT_RANGE_MONTHS = 12
+
+
+def shared_range(cube, selected_island: str):
+    """Date range of tabs 1–3 for ``selected_island`` (one slider, state kept across tabs).
+
+    Streamlit drops a widget's state when it is not rendered, so the value is
+    also stored under a plain session key and restored into the slider.
+    """
+    min_d, max_d = cube.date_range(selected_island)
+    state_key = f"date_range_{selected_island}"
+    widget_key = f"{state_key}_slider"
+
+    if widget_key not in st.session_state:
+        start, end = st.session_state.get(
+            state_key, (max(min_d, max_d - pd.DateOffset(months=DEFAULT_RANGE_MONTHS)), max_d))
+        start = min(max(pd.Timestamp(start), min_d), max_d)
+        end = min(max(pd.Timestamp(end), start), max_d)
+        st.session_state[widget_key] = (start.to_pydatetime(), end.to_pydatetime())
+
+    rango = st.slider(
+        "Selecciona el rango de fechas",
+        min_value=min_d.to_pydatetime(),
+        max_value=max_d.to_pydatetime(),
+        format="YYYY-MM",
+        key=widget_key,
+    )
+    st.session_state[state_key] = rango
+    return rango
+
+
+def display_tabs(cube, df_xgb, df_lstm, selected_island: str):
+    """Render the active tab: Datos, Gráfico, Origen, Tipos de vuelo or Pronóstico.
+
+    Every chart reads a month slice of the aggregate cube (``data/cube.py``).
+    """
+    active = st.radio("Vista", TABS, horizontal=True, key="active_tab",
+                      label_visibility="collapsed")
+
+    if active in RANGE_TABS:
+        st.subheader(f"📅 Rango de fechas — {selected_island}")
+        view = cube.view(selected_island, *shared_range(cube, selected_island))
 
     # ---------------------------------------------------------------------
-    # TAB 1 — Datos (Slider here)
+    # TAB 1 — Datos
     # ---------------------------------------------------------------------
-    with tab1:
-        st.subheader(f"📅 Rango de fechas — {selected_island}")
-
-        rango = st.slider(
-            "Selecciona el rango de fechas",
-            min_value=min_d.to_pydatetime(),
-            max_value=max_d.to_pydatetime(),
-            value=(default_start.to_pydatetime(), max_d.to_pydatetime()),
-            format="YYYY-MM",
-            key=f"slider_tab1_{selected_island}"
-        )
-
-        mask = (df_island["Fecha"] >= rango[0]) & (df_island["Fecha"] <= rango[1])
-        dfv_filtered = df_island.loc[mask].copy()
-
+    if active == TABS[0]:
         st.subheader("Totales por año y mes — filtrado por el rango seleccionado")
 
-        df_total = dfv_filtered[
-            dfv_filtered["AEROPUERTO_DE_PROCEDENCIA"].str.upper() == "TOTAL PASAJEROS"
-        ]
+        monthly = view.monthly_table()
 
-        if df_total.empty:
+        if monthly.empty:
             st.warning("No hay datos 'TOTAL PASAJEROS' en este rango.")
         else:
-            yearly = (
-                df_total.groupby("Año", as_index=False)["Pasajeros"]
-                .sum()
-                .sort_values("Año")
-            )
-            monthly = (
-                df_total[["Año", "Mes", "Pasajeros"]]
-                .sort_values(["Año", "Mes"])
-            )
+            yearly = view.yearly_table()
 
             col1, col2 = st.columns(2)
             col1.markdown("### 🟦 Totales por año")
@@ -75,55 +85,27 @@ def display_tabs(dfv: pd.DataFrame, df_full: pd.DataFrame, df_xgb, df_lstm, sele
             col2.dataframe(monthly, use_container_width=True)
 
     # ---------------------------------------------------------------------
-    # TAB 2 — Gráfico (same slider)
+    # TAB 2 — Gráfico
     # ---------------------------------------------------------------------
-    with tab2:
-        st.subheader(f"📅 Rango de fechas — {selected_island}")
-
-        rango = st.slider(
-            "Selecciona el rango de fechas",
-            min_value=min_d.to_pydatetime(),
-            max_value=max_d.to_pydatetime(),
-            value=(default_start.to_pydatetime(), max_d.to_pydatetime()),
-            format="YYYY-MM",
-            key=f"slider_tab2_{selected_island}"
-        )
-
-        mask = (df_island["Fecha"] >= rango[0]) & (df_island["Fecha"] <= rango[1])
-        dfv_filtered = df_island.loc[mask].copy()
-
+    elif active == TABS[1]:
         st.subheader("📈 Evolución mensual — Total Pasajeros")
-        plot_total_passengers(dfv_filtered)
-        plot_flight_type_shares(dfv_filtered)
+        plot_total_passengers(view.total_series())
+        plot_flight_type_shares(view.type_shares())
 
     # ---------------------------------------------------------------------
-    # TAB 3 — Origen (same slider)
+    # TAB 3 — Origen
     # ---------------------------------------------------------------------
-    with tab3:
-        st.subheader(f"📅 Rango de fechas — {selected_island}")
-
-        rango = st.slider(
-            "Selecciona el rango de fechas",
-            min_value=min_d.to_pydatetime(),
-            max_value=max_d.to_pydatetime(),
-            value=(default_start.to_pydatetime(), max_d.to_pydatetime()),
-            format="YYYY-MM",
-            key=f"slider_tab3_{selected_island}"
-        )
-
-        mask = (df_island["Fecha"] >= rango[0]) & (df_island["Fecha"] <= rango[1])
-        dfv_filtered = df_island.loc[mask].copy()
-
-        plot_origins_donut(dfv_filtered)
+    elif active == TABS[2]:
+        plot_origins_donut(view.origin_totals(exclude=EXCLUDE_ORIGINS))
 
     # ---------------------------------------------------------------------
     # TAB 4 — Heatmap (NO slider)
     # ---------------------------------------------------------------------
-    with tab4:
-        plot_seasonality_heatmap(df_full, selected_island)
+    elif active == TABS[3]:
+        plot_seasonality_heatmap(cube.seasonality(selected_island))
 
     # ---------------------------------------------------------------------
     # TAB 5 — Forecast (NO slider)
     # ---------------------------------------------------------------------
-    with tab5:
-        plot_forecast_tab(df_full, df_xgb, df_lstm)
+    else:
+        plot_forecast_tab(cube, df_xgb, df_lstm, selected_island)